@@ -0,0 +1,155 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from system_resources import usable_cpu_count
+
+
+# หน่วยความจำโดยประมาณต่อหนึ่งงาน: ภาพด้านขวาที่ขยาย 7-10 เท่า ภาพระหว่างทางในแคช และ activation ของ EasyOCR
+PIPELINE_MEMORY_BYTES = 1024 * 1024 * 1024
+# เผื่อหน่วยความจำที่เหลือไว้ให้ระบบ โมเดลที่โหลดค้างไว้ และ request ที่กำลังรับไฟล์
+MEMORY_RESERVE_FRACTION = 0.2
+
+MAX_QUEUE = 8
+QUEUE_TIMEOUT_SECONDS = 30.0
+# ใช้เป็น Retry-After ก่อนมีเวลาประมวลผลจริงให้ประมาณ
+DEFAULT_SERVICE_SECONDS = 5.0
+SERVICE_TIME_SMOOTHING = 0.2
+# หน่วยความจำอาจว่างขึ้นเองโดยไม่มีงานจบ (GC, process อื่นคืนหน่วยความจำ) งานที่รอจึงตรวจซ้ำทุกช่วงนี้
+MEMORY_POLL_SECONDS = 0.5
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, status: int, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+def available_memory_bytes() -> Optional[int]:
+    # MemAvailable นับ page cache ที่คืนได้ด้วย แม่นกว่าหน่วยความจำว่างเฉยๆ
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_max_inflight() -> int:
+    limit = usable_cpu_count()
+    memory = available_memory_bytes()
+    if memory is not None:
+        limit = min(limit, int(memory * (1 - MEMORY_RESERVE_FRACTION)) // PIPELINE_MEMORY_BYTES)
+    return max(1, limit)
+
+
+class AdmissionController:
+    # จำกัดจำนวนงานที่รันพร้อมกัน งานที่เกินรอในคิวจำกัดขนาด คิวเต็มตอบ 429 รอนานเกินตอบ 503
+    def __init__(self, max_inflight: Optional[int] = None, max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT_SECONDS, memory_poll: float = MEMORY_POLL_SECONDS):
+        self.max_inflight = max_inflight or default_max_inflight()
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.memory_poll = memory_poll
+        self.inflight = 0
+        self.waiting = 0
+        self.service_time = None
+        # บัตรคิวของงานที่รออยู่ตามลำดับที่มาถึง งานจะได้รันเมื่อบัตรอยู่หัวคิวและมีที่ว่าง
+        self._queue = deque()
+        self._next_ticket = 0
+        self.counters = {
+            'admitted': 0,
+            'queued': 0,
+            'completed': 0,
+            'rejected_queue_full': 0,
+            'rejected_timeout': 0,
+            'rejected_memory': 0,
+        }
+        self._condition = threading.Condition()
+
+    def _has_capacity(self, cost: int) -> bool:
+        if self.inflight == 0:
+            return True
+        if self.inflight + cost > self.max_inflight:
+            return False
+        # ตรวจหน่วยความจำจริงด้วย เผื่อมีโปรแกรมอื่นใช้หน่วยความจำเพิ่มหลังเริ่มเซิร์ฟเวอร์
+        memory = available_memory_bytes()
+        return memory is None or memory >= cost * PIPELINE_MEMORY_BYTES
+
+    def retry_after(self) -> int:
+        # เวลาที่คาดว่าคิวปัจจุบันจะระบายหมด
+        service_time = self.service_time or DEFAULT_SERVICE_SECONDS
+        rounds = (self.waiting + self.inflight) / self.max_inflight
+        return max(1, math.ceil(service_time * max(1.0, rounds)))
+
+    @contextmanager
+    def admit(self, cost: int = 1):
+        cost = max(1, min(cost, self.max_inflight))
+        with self._condition:
+            # งานที่มาใหม่แซงงานที่รออยู่ไม่ได้ แม้ตอนนี้จะมีที่ว่างพอสำหรับงานเล็ก
+            if self._queue or not self._has_capacity(cost):
+                if self.waiting >= self.max_queue:
+                    self.counters['rejected_queue_full'] += 1
+                    raise AdmissionRejected('queue_full', 429, self.retry_after())
+
+                ticket = self._next_ticket
+                self._next_ticket += 1
+                self._queue.append(ticket)
+                self.waiting += 1
+                self.counters['queued'] += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self._queue[0] != ticket or not self._has_capacity(cost):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            over_memory = self._queue[0] == ticket and self.inflight + cost <= self.max_inflight
+                            self.counters['rejected_memory' if over_memory else 'rejected_timeout'] += 1
+                            raise AdmissionRejected('memory' if over_memory else 'queue_timeout', 503,
+                                                    self.retry_after())
+                        self._condition.wait(min(remaining, self.memory_poll))
+                finally:
+                    self._queue.remove(ticket)
+                    self.waiting -= 1
+                    # หัวคิวเปลี่ยน ปลุกงานถัดไปให้ตรวจอีกครั้ง
+                    self._condition.notify_all()
+
+            self.inflight += cost
+            self.counters['admitted'] += 1
+
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            with self._condition:
+                self.inflight -= cost
+                self.counters['completed'] += 1
+                if self.service_time is None:
+                    self.service_time = elapsed
+                else:
+                    self.service_time += SERVICE_TIME_SMOOTHING * (elapsed - self.service_time)
+                self._condition.notify_all()
+
+    def snapshot(self) -> Dict:
+        with self._condition:
+            return {
+                'max_inflight': self.max_inflight,
+                'inflight': self.inflight,
+                'max_queue': self.max_queue,
+                'queue_depth': self.waiting,
+                'queue_timeout': self.queue_timeout,
+                'service_time': round(self.service_time, 3) if self.service_time is not None else None,
+                'available_memory_bytes': available_memory_bytes(),
+                **self.counters
+            }
@@ -1,340 +1,261 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import os
 import cv2
+import gzip
 import time
 import json
+import tempfile
+import threading
 import numpy as np
 from datetime import datetime
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import LimitedStream
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 from preprocessing import (
     split_image_left_right,
-    preprocess_left_region,
-    preprocess_right_region,
-    rotate_90
+    right_region_pipeline,
+    pipeline_until,
+    run_preprocessing,
+    white_percent
 )
-from ocr_engines import (
-    ocr_hybrid,
-    ocr_tesseract_only,
-    ocr_easyocr_only
+from pipeline import (
+    PROCESS_MODES,
+    REFINE_DEFAULT,
+    RECTIFY_DEFAULT,
+    STICKER_WORKERS,
+    MEMORY_BUDGET_BYTES,
+    StageTimer,
+    process_sticker,
+    process_stickers
 )
-from data_extraction import (
-    extract_vaccine_data,
-    validate_vaccine_data,
-    format_output_thai,
-    THAI_FIELDS
+from tuning import build_combinations, sweep_preprocessing
+from data_extraction import validate_vaccine_data
+from duplicates import dhash, find_duplicate, remember
+from admission import AdmissionController, AdmissionRejected
+from ocr_engines import engine_status, ocr_cache_stats, prewarm_engines
+from stream_ingest import FrameError, read_frames
+from fusion import FUSION_TOP_FRAMES, VIDEO_EXTENSIONS, fuse_extractions, read_video_frames, scan_frames
+from results_store import (
+    EXPORT_FORMATS,
+    append_record,
+    compact_record,
+    iter_records,
+    iter_export_chunks
 )
-from data_extraction import format_registration_number
-import re
-
 
-VALID_MONTHS = {'JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC',
-                'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'}
 
+app = Flask(__name__)
+CORS(app, resources={
+    r"/api/*": {
+        "origins": "*",
+        "methods": ["GET", "POST", "OPTIONS"],
+        "allow_headers": ["Content-Type"],
+        "supports_credentials": False
+    }
+})
 
-def score_date_format(date_str):
-    if not date_str or date_str == 'ไม่พบ':
-        return 0
+# กำหนดค่า
+UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+MAX_FILE_SIZE = 5 * 1024 * 1024 
+# ตัวอักษรของ request id (ULID) ที่ใช้ตั้งชื่อไฟล์อัพโหลดและรูประหว่างทาง
+CROCKFORD_BASE32 = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
 
-    parts = date_str.strip().split()
-    if len(parts) != 3:
-        return 0
+# ส่วนที่ขอเพิ่มได้ใน response แบบย่อ (view=compact หรือ fields=...)
+RESPONSE_VIEWS = ('full', 'compact')
+RESPONSE_SECTIONS = ('tesseract', 'easyocr', 'hybrid', 'ocr', 'metrics', 'refinement',
+                     'stages', 'images', 'formatted_output')
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = ('application/json', 'text/html', 'text/csv', 'text/plain', 'application/x-ndjson')
 
-    score = 0
-    day, month, year = parts
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+# งบหน่วยความจำของภาพระหว่างทางต่อสติกเกอร์ ภาพที่ใหญ่เกินจะถูกย่อก่อน (None = ไม่จำกัด)
+app.config['MEMORY_BUDGET'] = MEMORY_BUDGET_BYTES
 
-    if day.isdigit() and 1 <= int(day) <= 31:
-        score += 33
+# จำกัดจำนวน pipeline ที่รันพร้อมกันตามหน่วยความจำและจำนวน core
+admission = AdmissionController()
 
-    if month in VALID_MONTHS:
-        score += 34
+# โหลดล่วงหน้าใน background หลังเซิร์ฟเวอร์เริ่ม /api/health และหน้าเว็บตอบได้ทันทีโดยไม่ต้องรอ torch
+PREWARM_ENGINES = ('tesseract', 'easyocr')
+_prewarm_started = False
+_prewarm_lock = threading.Lock()
 
-    if year.isdigit() and 2000 <= int(year) <= 2030:
-        score += 33
 
-    return score
+def start_prewarm():
+    # เรียกครั้งเดียวต่อ process ที่รับ request ไม่เริ่ม thread ตอน import เพราะ gunicorn --preload จะ fork หลังจากนั้น
+    global _prewarm_started
+    if _prewarm_started:
+        return
+    with _prewarm_lock:
+        if _prewarm_started:
+            return
+        _prewarm_started = True
+    threading.Thread(target=prewarm_engines, args=(PREWARM_ENGINES,), daemon=True).start()
 
 
-def score_registration_number(reg_str):
-    if not reg_str or reg_str == 'ไม่พบ':
-        return 0
+@app.before_request
+def prewarm_on_first_request():
+    # เซิร์ฟเวอร์ WSGI ที่ import app โดยไม่ผ่าน __main__ (gunicorn, waitress) เริ่มโหลดตั้งแต่ request แรก
+    # เช่น health check ของ load balancer จะได้ไม่ต้องรอโมเดลตอนสแกนครั้งแรก
+    start_prewarm()
 
-    score = 0
+@app.errorhandler(500)
+def internal_error(error):
+    return jsonify({'error': 'Internal server error', 'details': str(error)}), 500
 
-    if '/' in reg_str:
-        score += 40
+@app.errorhandler(404)
+def not_found(error):
+    return jsonify({'error': 'Not found'}), 404
 
-        slash_pattern = re.search(r'\d+/\d+', reg_str)
-        if slash_pattern:
-            score += 30
+@app.after_request
+def compress_response(response):
+    # บีบอัด response ที่เป็นข้อความ ข้ามไฟล์รูปและ response แบบ stream
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=5))
+    elif encoding == 'gzip':
+        response.set_data(gzip.compress(data, compresslevel=6))
+    else:
+        return response
 
-    prefix_pattern = re.search(r'([A-Z0-9]{1,3})\s*\d+/\d+', reg_str)
-    if prefix_pattern:
-        score += 20
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
 
-    suffix_pattern = re.search(r'\(([A-Z0-9]+)\)', reg_str)
-    if suffix_pattern:
-        suffix = suffix_pattern.group(1)
-        if re.fullmatch(r'[A-Z]{1,2}', suffix):
-            score += 10
-        elif re.fullmatch(r'[0-9]{1,2}', suffix):
-            score += 5
+def rejected_response(error: AdmissionRejected):
+    print(f'ปฏิเสธ request ({error.reason}) ลองใหม่ใน {error.retry_after} วินาที')
+    response = jsonify({'error': 'Server busy, please retry later', 'reason': error.reason,
+                        'retry_after': error.retry_after})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
-    return min(score, 100)
+@app.route('/uploads/<path:filename>')
+def uploaded_file(filename):
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 
-def score_serial_number(serial_str):
-    if not serial_str or serial_str == 'ไม่พบ':
-        return 0
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-    clean = re.sub(r'[^A-Z0-9]', '', serial_str.upper())
 
-    if len(clean) < 5:
-        return 0
+def requested_sections():
+    # None = response เต็มแบบเดิม, set = response แบบย่อพร้อมส่วนที่ขอเพิ่ม
+    # รับ mode=compact ด้วย เพื่อให้ client เดิมที่ส่ง mode ใช้ได้
+    view = request.values.get('view') or ('compact' if request.values.get('mode') == 'compact' else 'full')
+    if view not in RESPONSE_VIEWS:
+        raise ValueError(f'Unknown view: {view}')
 
-    score = 0
+    fields = request.values.get('fields')
+    if fields is None and view == 'full':
+        return None
 
-    if 5 <= len(clean) <= 9:
-        score += 50
+    sections = {name.strip() for name in (fields or '').split(',') if name.strip()}
+    unknown = sections - set(RESPONSE_SECTIONS)
+    if unknown:
+        raise ValueError(f'Unknown sections: {", ".join(sorted(unknown))}')
+    return sections
 
-    digit_part = re.match(r'^(\d+)', clean)
-    if digit_part:
-        digits = digit_part.group(1)
-        if 5 <= len(digits) <= 7:
-            score += 30
 
-    letter_part = re.search(r'([A-Z]+)$', clean)
-    if letter_part:
-        letters = letter_part.group(1)
-        if len(letters) <= 2:
-            score += 20
-    else:
-        score += 20
-
-    pattern = re.fullmatch(r'\d{5,7}[A-Z]{0,2}', clean)
-    if pattern:
-        return 100
-
-    return min(score, 100)
-
-
-def score_field_value(field_name, value):
-    if not value or value == 'ไม่พบ':
-        return 0
-
-    if field_name in ['mfg_date', 'exp_date']:
-        return score_date_format(value)
-    elif field_name == 'registration_number':
-        return score_registration_number(value)
-    elif field_name == 'serial_number':
-        return score_serial_number(value)
-    elif field_name in ['vaccine_name', 'product_name']:
-        if len(value.strip()) >= 3:
-            return 100
-        elif len(value.strip()) >= 1:
-            return 50
-        return 0
-
-    return 100
-
-
-def calculate_field_level_accuracy(tess_data, easy_data, merged_data):
-    field_names = ['vaccine_name', 'product_name', 'registration_number', 'serial_number', 'mfg_date', 'exp_date']
-    field_accuracy = {}
-
-    for field in field_names:
-        tess_val = tess_data.get(field)
-        easy_val = easy_data.get(field)
-        merged_val = merged_data.get(field)
-
-        tess_score = score_field_value(field, tess_val)
-        easy_score = score_field_value(field, easy_val)
-        merged_score = score_field_value(field, merged_val)
-
-        field_accuracy[field] = {
-            'tesseract': tess_score,
-            'easyocr': easy_score,
-            'merged': merged_score,
-            'tesseract_value': tess_val or '',
-            'easyocr_value': easy_val or '',
-            'merged_value': merged_val or ''
+def sticker_response(result: dict, sections: Optional[set], filename: str, images: dict) -> dict:
+    if sections is None:
+        return {
+            'success': True,
+            'filename': filename,
+            'images': images,
+            **result
         }
+    return compact_response(result, sections, filename, images)
 
-    return field_accuracy
-
-
-def calculate_merge_quality_score(tess_data, easy_data, merged_data):
-    field_names = ['vaccine_name', 'product_name', 'registration_number', 'serial_number', 'mfg_date', 'exp_date']
 
-    def calculate_average_score(data):
-        total_score = 0
-        for field in field_names:
-            total_score += score_field_value(field, data.get(field))
-        return total_score / len(field_names)
-
-    tess_accuracy = calculate_average_score(tess_data)
-    easy_accuracy = calculate_average_score(easy_data)
-    merged_accuracy = calculate_average_score(merged_data)
-
-    best_individual = max(tess_accuracy, easy_accuracy)
-    improvement = merged_accuracy - best_individual
-
-    return {
-        'tesseract_accuracy': round(tess_accuracy, 1),
-        'easyocr_accuracy': round(easy_accuracy, 1),
-        'merged_accuracy': round(merged_accuracy, 1),
-        'best_individual': round(best_individual, 1),
-        'improvement': round(improvement, 1),
-        'improvement_percentage': round(improvement, 1)
+def compact_response(result: dict, sections: set, filename: str, images: dict) -> dict:
+    merged = result['merged']
+    response = {
+        'success': True,
+        'filename': filename,
+        'mode': result['mode'],
+        'merged': {'data': merged['data'], 'sources': merged['sources']},
+        'validation': validate_vaccine_data(merged['data'])
     }
 
+    for section in sections:
+        if section == 'images':
+            response['images'] = images
+        elif section == 'formatted_output':
+            response['merged']['formatted_output'] = merged['formatted_output']
+        elif section == 'stages':
+            for key in ('stages', 'skipped_stages', 'weak_fields'):
+                if key in result:
+                    response[key] = result[key]
+        elif section in result:
+            response[section] = result[section]
 
-def create_merge_decision_explanation(tess_data, easy_data, merged_data, sources):
-    field_names = ['vaccine_name', 'product_name', 'registration_number', 'serial_number', 'mfg_date', 'exp_date']
-    decisions = {}
+    return response
 
-    for field in field_names:
-        tess_val = tess_data.get(field, '')
-        easy_val = easy_data.get(field, '')
-        merged_val = merged_data.get(field, '')
-        source_info = sources.get(field, {})
 
-        source = source_info.get('source', 'unknown')
-        reason = source_info.get('reason', '')
+def dedupe_key(mode: str, refine: bool, rectify: bool, multi: bool = False, track_memory: bool = False,
+               merge_metrics: bool = True, save_images: bool = False) -> tuple:
+    # ผลเดิมใช้ซ้ำได้เฉพาะเมื่อสแกนด้วยตัวเลือกเดียวกัน /api/process และ /api/stream ใช้ key ร่วมกัน
+    return (mode, refine, rectify, multi, track_memory, merge_metrics, save_images)
 
-        match = (tess_val == easy_val) if (tess_val and easy_val) else False
 
-        decisions[field] = {
-            'tesseract': tess_val or 'ไม่พบ',
-            'easyocr': easy_val or 'ไม่พบ',
-            'selected': merged_val or 'ไม่พบ',
-            'source': source,
-            'reason': reason,
-            'engines_agree': match
-        }
+def new_request_id() -> str:
+    # ULID: เวลา 48 bit + สุ่ม 80 bit เรียงตามเวลาได้ และไม่ชนกันแม้มี request พร้อมกันในวินาทีเดียว
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), 'big')
+    return ''.join(CROCKFORD_BASE32[(value >> shift) & 31] for shift in range(125, -1, -5))
 
-    return decisions
-
-
-def merge_ocr_results(tess_data: dict, easy_data: dict, hybrid_data: dict) -> dict:
-    def choose_field(key):
-        e = easy_data.get(key)
-        h = hybrid_data.get(key)
-        t = tess_data.get(key)
-        if key == 'registration_number':
-            e_form = format_registration_number(e) if e else None
-            t_form = format_registration_number(t) if t else None
-            h_form = format_registration_number(h) if h else None
-            if e_form:
-                return e_form, 'easyocr', 'preferred-canonical'
-            if t_form:
-                return t_form, 'tesseract', 'preferred-canonical'
-            if h_form:
-                return h_form, 'hybrid', 'preferred-canonical'
-            return None, 'none', 'no-canonical-found'
-        else:
-            if key == 'vaccine_name':
-                def split_components(s):
-                    if not s:
-                        return []
-                    parts = re.split(r'[;\n,]+', s)
-                    return [p.strip() for p in parts if p.strip()]
-
-                t_comps = split_components(t)
-                e_comps = split_components(e)
-                h_comps = split_components(h)
-
-                merged_list = []
-                seen = set()
-                for comp in (t_comps + e_comps + h_comps):
-                    low = comp.lower()
-                    if low not in seen:
-                        merged_list.append(comp)
-                        seen.add(low)
-
-                merged_name = '; '.join(merged_list) if merged_list else (e or h or t)
-
-                src = 'none'
-                reason = 'missing'
-                if t and ('FELINE' in (t or '').upper() or len(t_comps) > len(e_comps)):
-                    src = 'tesseract'
-                    reason = 'preferred-by-content'
-                elif e:
-                    src = 'easyocr'
-                    reason = 'easy-present'
-                elif h:
-                    src = 'hybrid'
-                    reason = 'hybrid-present'
-
-                return merged_name, src, reason
-            if e:
-                return e, 'easyocr', 'easy-present'
-            if h:
-                return h, 'hybrid', 'hybrid-present'
-            if t:
-                return t, 'tesseract', 'tesseract-present'
-            return None, 'none', 'missing'
-
-    merged_fields = {}
-    merged_sources = {}
-    for k in ['vaccine_name', 'product_name', 'manufacturer', 'registration_number', 'serial_number', 'mfg_date', 'exp_date']:
-        val, src, reason = choose_field(k)
-        merged_fields[k] = val
-        merged_sources[k] = {'source': src, 'reason': reason}
-
-    return {
-        'data': merged_fields,
-        'sources': merged_sources,
-        'formatted_output': format_output_thai(merged_fields)
-    }
-
-app = Flask(__name__)
-CORS(app, resources={
-    r"/api/*": {
-        "origins": "*",
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"],
-        "supports_credentials": False
-    }
-})
-
-# กำหนดค่า
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
-MAX_FILE_SIZE = 5 * 1024 * 1024 
-
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
-@app.errorhandler(500)
-def internal_error(error):
-    return jsonify({'error': 'Internal server error', 'details': str(error)}), 500
-
-@app.errorhandler(404)
-def not_found(error):
-    return jsonify({'error': 'Not found'}), 404
-
-@app.route('/uploads/<path:filename>')
-def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+def atomic_write(filepath: str, write) -> None:
+    # เขียนลงไฟล์ชั่วคราวในโฟลเดอร์เดียวกันแล้ว rename ผู้อ่านจะไม่เห็นไฟล์ที่เขียนไม่เสร็จ
+    directory = os.path.dirname(filepath)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def save_upload(file, filepath: str) -> None:
+    atomic_write(filepath, file.save)
 
 
 def save_image(image: np.ndarray, filepath: str) -> bool:
     try:
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
         # ตรวจสอบให้แน่ใจว่าเป็น dtype uint8
         if image.dtype != np.uint8:
             image = cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX)
             image = image.astype(np.uint8)
         
-        return cv2.imwrite(filepath, image)
+        ok, encoded = cv2.imencode(os.path.splitext(filepath)[1], image)
+        if not ok:
+            return False
+        atomic_write(filepath, lambda f: f.write(encoded.tobytes()))
+        return True
     except Exception as e:
         print(f'เกิดข้อผิดพลาดในการบันทึก {filepath}: {e}')
         return False
@@ -369,11 +290,10 @@ def api_test_preprocessing():
         c_value = params.get('c_value', 2)
         
         # บันทึกไฟล์ที่อัปโหลด
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
+        request_id = new_request_id()
+        filename = f"{request_id}_{secure_filename(file.filename)}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        save_upload(file, filepath)
         
         # โหลดรูปภาพ
         image = cv2.imread(filepath)
@@ -386,39 +306,24 @@ def api_test_preprocessing():
         # การประมวลผลล่วงหน้าที่เรากำหนดบริเวณด้านขวา
         start_time = time.time()
         
-        height, width = right.shape[:2]
-        scaled = cv2.resize(right, (width*scale, height*scale), 
-                           interpolation=cv2.INTER_CUBIC)
-        
-        rotated = rotate_90(scaled)
-        
-        gray = cv2.cvtColor(rotated, cv2.COLOR_BGR2GRAY) if len(rotated.shape) == 3 else rotated
-        inverted = cv2.bitwise_not(gray)
-        
-        bilateral = cv2.bilateralFilter(inverted, 9, 75, 75)
-        
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-        clahe_applied = clahe.apply(bilateral)
-        
-        # ใช้พารามิเตอร์ที่กำหนดเอง
-        enhanced = cv2.convertScaleAbs(clahe_applied, alpha=alpha, beta=beta)
-        binary = cv2.adaptiveThreshold(
-            enhanced, 255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY,
-            blockSize=block_size, C=c_value
+        # ใช้พารามิเตอร์ที่กำหนดเอง ขั้นตอนก่อนหน้าพารามิเตอร์ที่เปลี่ยนจะถูกดึงจากแคช
+        steps = pipeline_until(
+            right_region_pipeline(scale, alpha=alpha, beta=beta,
+                                  block_size=block_size, c_value=c_value),
+            'adaptive_threshold'
         )
+        binary = run_preprocessing(right, steps, cache=True)
         
-        white_percent = (binary == 255).sum() / binary.size * 100
+        white = white_percent(binary)
         processing_time = time.time() - start_time
         
         # บันทึกรูปภาพทดสอบ
         temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'test')
         os.makedirs(temp_dir, exist_ok=True)
         
-        original_path = os.path.join(temp_dir, f'{timestamp}_original.png')
-        right_raw_path = os.path.join(temp_dir, f'{timestamp}_right_raw.png')
-        right_processed_path = os.path.join(temp_dir, f'{timestamp}_right_processed.png')
+        original_path = os.path.join(temp_dir, f'{request_id}_original.png')
+        right_raw_path = os.path.join(temp_dir, f'{request_id}_right_raw.png')
+        right_processed_path = os.path.join(temp_dir, f'{request_id}_right_processed.png')
         
         save_image(image, original_path)
         save_image(right, right_raw_path)
@@ -426,14 +331,15 @@ def api_test_preprocessing():
         
         return jsonify({
             'success': True,
-            'white_percent': round(white_percent, 1),
+            'request_id': request_id,
+            'white_percent': round(white, 1),
             'method': f'Adaptive (alpha={alpha}, beta={beta}, block={block_size}, C={c_value})',
             'image_size': [binary.shape[0], binary.shape[1]],
             'processing_time': round(processing_time, 3),
             'images': {
-                'original': f'/uploads/test/{timestamp}_original.png',
-                'right_raw': f'/uploads/test/{timestamp}_right_raw.png',
-                'right_processed': f'/uploads/test/{timestamp}_right_processed.png'
+                'original': f'/uploads/test/{request_id}_original.png',
+                'right_raw': f'/uploads/test/{request_id}_right_raw.png',
+                'right_processed': f'/uploads/test/{request_id}_right_processed.png'
             }
         })
 
@@ -444,6 +350,59 @@ def api_test_preprocessing():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/sweep_preprocessing', methods=['POST'])
+def api_sweep_preprocessing():
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        
+        # grid: {"alpha": [1.1, 1.3]} หรือช่วง [min, max] สำหรับ random
+        search = request.form.get('search', 'grid')
+        seed = request.form.get('seed', type=int)
+        engine = request.form.get('engine', 'tesseract')
+        workers = request.form.get('workers', type=int)
+        try:
+            space = json.loads(request.form.get('space', '{}'))
+            samples = int(request.form.get('samples', 20))
+            top = int(request.form.get('top', 20))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid sweep parameters: {e}'}), 400
+        
+        image = cv2.imdecode(np.frombuffer(file.read(), np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return jsonify({'error': 'Failed to load image'}), 400
+        
+        try:
+            combinations = build_combinations(search, space, samples=samples, seed=seed)
+            # sweep ใช้ทุก worker จึงจองทั้งเซิร์ฟเวอร์
+            with admission.admit(cost=admission.max_inflight):
+                start_time = time.time()
+                rows = sweep_preprocessing(image, combinations, engine=engine, workers=workers)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except AdmissionRejected as e:
+            return rejected_response(e)
+        
+        return jsonify({
+            'success': True,
+            'search': search,
+            'engine': engine,
+            'combinations': len(combinations),
+            'processing_time': round(time.time() - start_time, 2),
+            'results': rows[:top]
+        })
+
+    except Exception as e:
+        print(f'ข้อผิดพลาดใน sweep_preprocessing: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/process', methods=['POST', 'OPTIONS'])
 def process_image():
     if request.method == 'OPTIONS':
@@ -466,12 +425,28 @@ def process_image():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Only JPG, PNG files allowed'}), 400
         
-        # บันทึกไฟล์
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
+        # full: รันทั้ง 3 แบบ, fast: รัน Tesseract ก่อนแล้วเรียก EasyOCR เฉพาะที่จำเป็น
+        mode = request.values.get('mode', 'full')
+        if mode == 'compact':
+            mode = 'full'
+        if mode not in PROCESS_MODES:
+            return jsonify({'error': f'Unknown mode: {mode}'}), 400
+        refine = request.values.get('refine', '1' if REFINE_DEFAULT else '0') not in ('0', 'false', 'no')
+        rectify = request.values.get('rectify', '1' if RECTIFY_DEFAULT else '0') not in ('0', 'false', 'no')
+        # multi=1: ภาพเดียวมีหลายขวด ผลลัพธ์เป็น array stickers
+        multi = request.values.get('multi', '0') not in ('0', 'false', 'no')
+        # memory=1: วัด peak หน่วยความจำของแต่ละขั้นตอนไว้ใน metrics.stage_memory (ช้าลงเล็กน้อย)
+        track_memory = request.values.get('memory', '0') not in ('0', 'false', 'no')
+        try:
+            sections = requested_sections()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # บันทึกไฟล์ ทุกไฟล์ของ request นี้ขึ้นต้นด้วย request_id เดียวกัน
+        request_id = new_request_id()
+        filename = f"{request_id}_{secure_filename(file.filename)}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        save_upload(file, filepath)
         
         print(f'\n{"="*60}')
         print(f'Processing: {filename}')
@@ -482,194 +457,335 @@ def process_image():
         if image is None:
             return jsonify({'error': 'ไม่สามารถโหลดรูปภาพได้'}), 400
 
-        # แบ่งรูปภาพ
-        print('กำลังแบ่งรูปภาพ...')
-        left, right = split_image_left_right(image)
-        
-        # สร้างไดเรกทอรีชั่วคราว
-        temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # ประมวลผล
-        print('กำลังประมวลผล...')
-        left_processed = preprocess_left_region(left, scale=2)
-        right_processed = preprocess_right_region(right, scale=7)
-        
-        # บันทึกรูปภาพที่ประมวลผลแล้ว
-        left_path = os.path.join(temp_dir, f'{timestamp}_left.png')
-        right_path = os.path.join(temp_dir, f'{timestamp}_right.png')
-        save_image(left_processed, left_path)
-        save_image(right_processed, right_path)
+        # ไม่คำนวณ metrics การรวมผลและไม่บันทึกรูปถ้าไม่มีใครขอ
+        merge_metrics = sections is None or 'metrics' in sections
+        save_images = sections is None or 'images' in sections
+        
+        # รูปเดิมที่อัพโหลดซ้ำในช่วงเวลาสั้นๆ ใช้ผลของครั้งก่อน ส่ง dedupe=0 เพื่อประมวลผลใหม่
+        scan_hash = dhash(image)
+        scan_key = dedupe_key(mode, refine, rectify, multi=multi, track_memory=track_memory,
+                              merge_metrics=merge_metrics, save_images=save_images)
+        duplicate = None
+        if request.values.get('dedupe', '1') not in ('0', 'false', 'no'):
+            duplicate = find_duplicate(scan_hash, scan_key)
+        
+        if duplicate:
+            previous = duplicate['payload']
+            print(f'ภาพซ้ำกับ {previous["filename"]} (ห่าง {duplicate["distance"]} bit) ใช้ผลเดิม')
+            stickers = previous['stickers']
+        else:
+            # รอคิวเฉพาะตอนรัน pipeline จริง ภาพซ้ำตอบได้ทันทีโดยไม่กินโควตา
+            with admission.admit(cost=STICKER_WORKERS if multi else 1):
+                start_time = time.time()
+                timer = StageTimer(track_memory=track_memory)
+                memory_budget = app.config['MEMORY_BUDGET']
+                if multi:
+                    outputs = process_stickers(image, mode=mode, refine=refine, timer=timer,
+                                               merge_metrics=merge_metrics, rectify=rectify,
+                                               memory_budget=memory_budget)
+                else:
+                    outputs = [process_sticker(image, mode=mode, refine=refine, timer=timer,
+                                               merge_metrics=merge_metrics, rectify=rectify,
+                                               memory_budget=memory_budget)]
+                processing_time = time.time() - start_time
+            
+            stickers = []
+            for index, (result, regions) in enumerate(outputs):
+                # เก็บผลแบบย่อไว้สำหรับ /api/export
+                try:
+                    # หลายขวดรันพร้อมกัน เวลาของแต่ละใบคือผลรวมขั้นตอนของใบนั้นเอง ไม่ใช่เวลาทั้งภาพ
+                    sticker_time = sum(result['metrics']['stage_times'].values()) if multi else processing_time
+                    append_record(compact_record(result, filename, sticker_time,
+                                                 sticker=index if multi else None))
+                except OSError as e:
+                    print(f'บันทึกผลลัพธ์ไม่สำเร็จ: {e}')
+                
+                prefix = f'{request_id}_{index}' if multi else request_id
+                images = {
+                    'original': f'/uploads/{filename}',
+                    'left_preprocessed': f'/uploads/temp/{prefix}_left.png',
+                    'right_preprocessed': f'/uploads/temp/{prefix}_right.png'
+                }
+                
+                # บันทึกรูปภาพที่ประมวลผลแล้ว เฉพาะเมื่อ response มีลิงก์ไปยังรูป
+                if save_images:
+                    temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
+                    save_image(regions['left_processed'], os.path.join(temp_dir, f'{prefix}_left.png'))
+                    save_image(regions['right_processed'], os.path.join(temp_dir, f'{prefix}_right.png'))
+                
+                stickers.append({'result': result, 'images': images})
+            
+            remember(scan_hash, {'filename': filename, 'stickers': stickers}, scan_key)
         
-        # TESSERACT
-        print('\nกำลังประมวลผลด้วย Tesseract...')
-        start_time = time.time()
-
-        # ใช้ Tesseract สำหรับทั้งสองข้าง
-        tess_results = ocr_tesseract_only(left_processed, right_processed)
-        tess_data = extract_vaccine_data(
-            tess_results['left_text'],
-            tess_results['right_text']
-        )
-        tess_validation = validate_vaccine_data(tess_data)
+        # เตรียมการตอบกลับ
+        if multi:
+            response = {
+                'success': True,
+                'filename': filename,
+                'count': len(stickers),
+                'stickers': []
+            }
+            for index, sticker in enumerate(stickers):
+                entry = sticker_response(sticker['result'], sections, filename, sticker['images'])
+                entry.pop('success')
+                entry.pop('filename')
+                response['stickers'].append({'index': index, **entry})
+        else:
+            response = sticker_response(stickers[0]['result'], sections, filename, stickers[0]['images'])
+        
+        response['request_id'] = request_id
+        if duplicate:
+            response['duplicate_of'] = {
+                'filename': duplicate['payload']['filename'],
+                'distance': duplicate['distance'],
+                'age': duplicate['age']
+            }
 
-        tess_time = time.time() - start_time
-        print(f'Time: {tess_time:.2f}s')
-        print(f'Complete: {tess_validation["is_complete"]}')
+        print('ประมวลผลเสร็จสมบูรณ์!\n')
 
-        # EASYOCR
-        print('\nกำลังประมวลผลด้วย EasyOCR...')
-        start_time = time.time()
+        return jsonify(response)
 
-        # ใช้ EasyOCR สำหรับทั้งสองข้าง
-        easy_results = ocr_easyocr_only(left_processed, right_processed)
-        easy_data = extract_vaccine_data(
-            easy_results['left_text'],
-            easy_results['right_text']
-        )
-        easy_validation = validate_vaccine_data(easy_data)
+    except AdmissionRejected as e:
+        return rejected_response(e)
+    except Exception as e:
+        print(f'\nข้อผิดพลาดใน process_image: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
 
-        easy_time = time.time() - start_time
-        print(f'Time: {easy_time:.2f}s')
-        print(f'Complete: {easy_validation["is_complete"]}')
 
-        # นำมารวมกัน
-        print('\n กำลังประมวลผลด้วยการนำมารวมกัน...')
-        start_time = time.time()
+@app.route('/api/process_frames', methods=['POST'])
+def process_frames():
+    # ส่งวิดีโอสั้น (video) หรือภาพหลายภาพของสติกเกอร์ใบเดียว (frames) เลือกเฟรมที่คมและไม่มีแสงสะท้อน
+    # แล้ว OCR เฉพาะ top เฟรม และรวมผลแต่ละฟิลด์ข้ามเฟรม แทนการถ่ายใหม่แล้วอัพโหลดซ้ำ
+    try:
+        mode = request.values.get('mode', 'full')
+        if mode not in PROCESS_MODES:
+            return jsonify({'error': f'Unknown mode: {mode}'}), 400
+        refine = request.values.get('refine', '1' if REFINE_DEFAULT else '0') not in ('0', 'false', 'no')
+        rectify = request.values.get('rectify', '1' if RECTIFY_DEFAULT else '0') not in ('0', 'false', 'no')
+        # แต่ละเฟรมคือ pipeline เต็มหนึ่งรอบภายใต้คิวเดียว จำกัดไม่ให้ request เดียวกินเวลาเครื่องนานเกินไป
+        top = max(1, min(request.values.get('top', FUSION_TOP_FRAMES, type=int), FUSION_TOP_FRAMES * 2))
+        early_stop = request.values.get('early_stop', '1') not in ('0', 'false', 'no')
+        try:
+            sections = requested_sections()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        request_id = new_request_id()
+        video = request.files.get('video')
+        if video and video.filename:
+            if not video.filename.lower().endswith(VIDEO_EXTENSIONS):
+                return jsonify({'error': f'Only {", ".join(VIDEO_EXTENSIONS)} videos allowed'}), 400
+            # VideoCapture อ่านจากไฟล์เท่านั้น เก็บไว้ชั่วคราวแล้วลบทิ้ง
+            fd, video_path = tempfile.mkstemp(prefix=f'{request_id}_',
+                                              suffix=os.path.splitext(video.filename)[1].lower())
+            os.close(fd)
+            try:
+                video.save(video_path)
+                frames = read_video_frames(video_path)
+            finally:
+                os.remove(video_path)
+        else:
+            frames = []
+            for file in request.files.getlist('frames'):
+                if file.filename and allowed_file(file.filename):
+                    image = cv2.imdecode(np.frombuffer(file.read(), np.uint8), cv2.IMREAD_COLOR)
+                    if image is not None:
+                        frames.append(image)
 
-        # ใช้ Tesseract สำหรับด้านซ้าย, EasyOCR สำหรับด้านขวา
-        hybrid_results = ocr_hybrid(left_processed, right_processed)
-        hybrid_data = extract_vaccine_data(
-            hybrid_results['left_text'],
-            hybrid_results['right_text']
-        )
-        hybrid_validation = validate_vaccine_data(hybrid_data)
+        if not frames:
+            return jsonify({'error': 'No frames provided (send video or frames)'}), 400
 
-        hybrid_time = time.time() - start_time
-        print(f'Time: {hybrid_time:.2f}s')
-        print(f'Complete: {hybrid_validation["is_complete"]}')
-        
-        # คำนวณเมตริก
-        def count_detected(data):
-            return sum(1 for v in data.values() if v and v != 'ไม่พบ')
-        
-        tess_detected = count_detected(tess_data)
-        easy_detected = count_detected(easy_data)
-        hybrid_detected = count_detected(hybrid_data)
-        
-        total_fields = len(THAI_FIELDS)
-        
-        metrics = {
-            'tesseract': {
-                'fields_detected': tess_detected,
-                'total_fields': total_fields,
-                'accuracy': round((tess_detected / total_fields) * 100, 1),
-                'processing_time': round(tess_time, 2),
-                'is_complete': tess_validation['is_complete']
-            },
-            'easyocr': {
-                'fields_detected': easy_detected,
-                'total_fields': total_fields,
-                'accuracy': round((easy_detected / total_fields) * 100, 1),
-                'processing_time': round(easy_time, 2),
-                'is_complete': easy_validation['is_complete']
-            },
-            'hybrid': {
-                'fields_detected': hybrid_detected,
-                'total_fields': total_fields,
-                'accuracy': round((hybrid_detected / total_fields) * 100, 1),
-                'processing_time': round(hybrid_time, 2),
-                'is_complete': hybrid_validation['is_complete']
-            }
-        }
-        
-        # กำหนดว่าอะไรดีที่สุด
-        if hybrid_detected >= max(tess_detected, easy_detected):
-            winner = 'Hybrid'
-        elif easy_detected > tess_detected:
-            winner = 'EasyOCR'
-        else:
-            winner = 'Tesseract'
-        
-        metrics['comparison'] = {
-            'winner': winner,
-            'recommendation': 'Hybrid (Tesseract + EasyOCR)' if winner == 'Hybrid' else f'{winner}'
-        }
-        
-        # พิมพ์สรุปผลลัพธ์
         print(f'\n{"="*60}')
-        print('RESULTS SUMMARY')
+        print(f'Processing frames: {request_id} ({len(frames)} เฟรม)')
         print(f'{"="*60}')
-        print(f'Tesseract:  {tess_detected}/{total_fields} fields ({metrics["tesseract"]["accuracy"]}%)')
-        print(f'EasyOCR:    {easy_detected}/{total_fields} fields ({metrics["easyocr"]["accuracy"]}%)')
-        print(f'Hybrid:     {hybrid_detected}/{total_fields} fields ({metrics["hybrid"]["accuracy"]}%)')
-        print(f'Winner:     {winner}')
-        print(f'{"="*60}\n')
-        
-        # เตรียมการตอบกลับ
-        response = {
-            'success': True,
-            'filename': filename,
-            'images': {
-                'original': f'/uploads/{filename}',
-                'left_preprocessed': f'/uploads/temp/{timestamp}_left.png',
-                'right_preprocessed': f'/uploads/temp/{timestamp}_right.png'
-            },
-            'tesseract': {
-                'data': tess_data,
-                'validation': tess_validation,
-                'formatted_output': format_output_thai(tess_data),
-                'raw_left': tess_results.get('left_text', ''),
-                'raw_right': tess_results.get('right_text', '')
-            },
-            'easyocr': {
-                'data': easy_data,
-                'validation': easy_validation,
-                'formatted_output': format_output_thai(easy_data),
-                'raw_left': easy_results.get('left_text', ''),
-                'raw_right': easy_results.get('right_text', '')
-            },
-            'hybrid': {
-                'data': hybrid_data,
-                'validation': hybrid_validation,
-                'formatted_output': format_output_thai(hybrid_data),
-                'raw_left': hybrid_results.get('left_text', ''),
-                'raw_right': hybrid_results.get('right_text', '')
-            },
-            'merged': merge_ocr_results(tess_data, easy_data, hybrid_data),
-            'metrics': metrics
-        }
-
-        merged_result = response['merged']
-        merged_data = merged_result['data']
-        merged_sources = merged_result['sources']
-
-        field_level_accuracy = calculate_field_level_accuracy(tess_data, easy_data, merged_data)
-        merge_quality = calculate_merge_quality_score(tess_data, easy_data, merged_data)
-        merge_decisions = create_merge_decision_explanation(tess_data, easy_data, merged_data, merged_sources)
 
-        response['metrics']['field_level_accuracy'] = field_level_accuracy
-        response['metrics']['merge_quality'] = merge_quality
-        response['metrics']['merge_decisions'] = merge_decisions
-
-        print('ประมวลผลเสร็จสมบูรณ์!\n')
+        merge_metrics = sections is None or 'metrics' in sections
+        with admission.admit():
+            summary, outputs = scan_frames(frames, top_k=top, mode=mode, refine=refine, rectify=rectify,
+                                           merge_metrics=merge_metrics, early_stop=early_stop,
+                                           memory_budget=app.config['MEMORY_BUDGET'])
+
+        fused = summary['fused']
+        try:
+            append_record(compact_record({'mode': mode, 'merged': fused}, request_id,
+                                         summary['processing_time']))
+        except OSError as e:
+            print(f'บันทึกผลลัพธ์ไม่สำเร็จ: {e}')
+
+        results = []
+        for frame, (result, _) in zip(summary['processed'], outputs):
+            entry = sticker_response(result, sections, request_id, {})
+            for key in ('success', 'filename', 'images'):
+                entry.pop(key, None)
+            results.append({'frame': frame, **entry})
 
-        return jsonify(response)
+        return jsonify({
+            'success': True,
+            'request_id': request_id,
+            'frames': summary['frames'],
+            'quality': summary['quality'],
+            'selected': summary['selected'],
+            'processed': summary['processed'],
+            'scoring_time': summary['scoring_time'],
+            'processing_time': summary['processing_time'],
+            'fused': fused,
+            'results': results
+        })
 
+    except AdmissionRejected as e:
+        return rejected_response(e)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f'\nข้อผิดพลาดใน process_image: {e}')
+        print(f'\nข้อผิดพลาดใน process_frames: {e}')
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/fuse', methods=['POST'])
+def fuse():
+    # รวมผลที่ดึงได้จากหลายภาพของสติกเกอร์ใบเดียว (เช่น merged.data ของแต่ละภาพ) ด้วยการโหวตรายฟิลด์
+    # {"frames": [{"product_name": "...", ...}, ...], "early_stop": true}
+    payload = request.get_json(silent=True) or {}
+    frames = payload.get('frames')
+    if not isinstance(frames, list) or not all(isinstance(frame, dict) for frame in frames):
+        return jsonify({'error': 'frames must be a list of extracted field objects'}), 400
+
+    # รับ true/false ของ JSON หรือสตริงแบบเดียวกับ form ("0", "false", "no") ค่าอื่นตอบ 400
+    early_stop = payload.get('early_stop', True)
+    if isinstance(early_stop, str) and early_stop.lower() in ('0', 'false', 'no', '1', 'true', 'yes'):
+        early_stop = early_stop.lower() not in ('0', 'false', 'no')
+    if not isinstance(early_stop, bool):
+        return jsonify({'error': 'early_stop must be a boolean'}), 400
+
+    fused = fuse_extractions(frames, early_stop=early_stop)
+    # บอก client ว่าภาพที่เหลือในชุดไม่ต้องส่งมา OCR แล้ว
+    return jsonify({'success': True, 'used': len(fused['frames']), 'total': len(frames), **fused})
+
+
+@app.route('/api/stream', methods=['POST'])
+def stream_process():
+    # รับภาพหลายภาพต่อกันใน request เดียว (frame ตาม stream_ingest.py) ตอบผลเป็น NDJSON ทีละภาพทันทีที่เสร็จ
+    # ไม่ parse multipart และไม่บันทึกไฟล์ลงดิสก์ ใช้ pipeline เดียวกับ /api/process
+    mode = request.args.get('mode', 'full')
+    if mode not in PROCESS_MODES:
+        return jsonify({'error': f'Unknown mode: {mode}'}), 400
+    refine = request.args.get('refine', '1' if REFINE_DEFAULT else '0') not in ('0', 'false', 'no')
+    rectify = request.args.get('rectify', '1' if RECTIFY_DEFAULT else '0') not in ('0', 'false', 'no')
+    dedupe = request.args.get('dedupe', '1') not in ('0', 'false', 'no')
+    try:
+        sections = requested_sections()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if sections is not None and 'images' in sections:
+        return jsonify({'error': 'images are not saved for streamed frames'}), 400
+
+    # จำกัดขนาดต่อ frame แทนขนาดทั้ง request เพราะ stream เปิดค้างไว้ได้นาน
+    stream = request.environ['wsgi.input']
+    if request.content_length is not None:
+        stream = LimitedStream(stream, request.content_length)
+    stream_id = new_request_id()
+    merge_metrics = sections is None or 'metrics' in sections
+    scan_key = dedupe_key(mode, refine, rectify, merge_metrics=merge_metrics)
+
+    def results():
+        seq = 0
+        try:
+            for data in read_frames(stream, MAX_FILE_SIZE):
+                filename = f'{stream_id}_{seq}'
+                entry = {'seq': seq}
+                image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                if image is None:
+                    entry['error'] = 'Failed to decode image'
+                    yield json.dumps(entry, ensure_ascii=False) + '\n'
+                    seq += 1
+                    continue
+
+                scan_hash = dhash(image)
+                duplicate = find_duplicate(scan_hash, scan_key) if dedupe else None
+                try:
+                    if duplicate:
+                        result = duplicate['payload']['stickers'][0]['result']
+                        entry['duplicate_of'] = {'filename': duplicate['payload']['filename'],
+                                                 'distance': duplicate['distance'], 'age': duplicate['age']}
+                    else:
+                        # ขอคิวทีละ frame เพื่อให้ client อื่นได้คิวสลับกันระหว่าง stream ยาวๆ
+                        with admission.admit():
+                            start_time = time.time()
+                            result, _ = process_sticker(image, mode=mode, refine=refine, rectify=rectify,
+                                                        merge_metrics=merge_metrics,
+                                                        memory_budget=app.config['MEMORY_BUDGET'])
+                            processing_time = time.time() - start_time
+                        try:
+                            append_record(compact_record(result, filename, processing_time))
+                        except OSError as e:
+                            print(f'บันทึกผลลัพธ์ไม่สำเร็จ: {e}')
+                        remember(scan_hash, {'filename': filename, 'stickers': [{'result': result, 'images': {}}]},
+                                 scan_key)
+                    response = sticker_response(result, sections, filename, {})
+                    response.pop('images', None)
+                except AdmissionRejected as e:
+                    # ไม่ตัด stream ทิ้ง client ส่ง frame นี้ใหม่ได้หลัง retry_after
+                    entry.update({'error': 'Server busy, please retry later', 'reason': e.reason,
+                                  'retry_after': e.retry_after})
+                    yield json.dumps(entry, ensure_ascii=False) + '\n'
+                    seq += 1
+                    continue
+                except Exception as e:
+                    # frame เดียวพังไม่ควรตัด stream ที่เหลือ ตอบ error ของ frame นั้นแล้วอ่าน frame ถัดไป
+                    print(f'\nข้อผิดพลาดใน stream {stream_id} frame {seq}: {e}')
+                    import traceback
+                    traceback.print_exc()
+                    entry['error'] = str(e)
+                    yield json.dumps(entry, ensure_ascii=False) + '\n'
+                    seq += 1
+                    continue
+
+                yield json.dumps({**entry, **response}, ensure_ascii=False, default=str) + '\n'
+                seq += 1
+        except FrameError as e:
+            yield json.dumps({'error': str(e), 'frames': seq}) + '\n'
+
+    print(f'เริ่ม stream {stream_id}')
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson',
+                    headers={'X-Request-Id': stream_id})
+
+
+@app.route('/api/export', methods=['GET'])
+def export_results():
+    # ?format=jsonl|csv&since=2025-11-21T10:00:00&limit=1000
+    export_format = request.args.get('format', 'jsonl')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown format: {export_format}'}), 400
+    since = request.args.get('since')
+    limit = request.args.get('limit', type=int)
+
+    # อ่านและส่งทีละก้อน ไม่โหลด log ทั้งไฟล์เข้าหน่วยความจำ
+    chunks = iter_export_chunks(iter_records(since=since, limit=limit), export_format)
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=results.{export_format}'}
+    )
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return jsonify({'admission': admission.snapshot(), 'ocr_cache': ocr_cache_stats()})
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'upload_folder': app.config['UPLOAD_FOLDER'],
-        'max_file_size': app.config['MAX_CONTENT_LENGTH']
+        'max_file_size': app.config['MAX_CONTENT_LENGTH'],
+        'engines': engine_status()
     })
 
 
@@ -683,4 +799,11 @@ if __name__ == '__main__':
     print('='*60)
     print()
 
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    # FLASK_DEBUG=0 ปิด debug mode และ reloader
+    debug = os.environ.get('FLASK_DEBUG', '1') not in ('0', 'false', 'no')
+    # reloader ของ debug mode รันไฟล์นี้สองรอบ โหลดโมเดลเฉพาะใน process ลูกที่รับ request จริง
+    # ถ้าปิด debug มี process เดียว โหลดได้ทันที
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_prewarm()
+
+    app.run(debug=debug, host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,186 @@
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Set
+
+import cv2
+
+from pipeline import PROCESS_MODES, RECTIFY_DEFAULT, REFINE_DEFAULT, process_sticker
+from ocr_engines import configure_easyocr, get_easyocr_reader
+from data_extraction import THAI_FIELDS, validate_vaccine_data
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+OUTPUT_FORMATS = ('jsonl', 'csv')
+RECORD_FIELDS = list(THAI_FIELDS)
+CSV_COLUMNS = ['path', 'status'] + RECORD_FIELDS + ['is_complete', 'processing_time', 'error']
+
+
+def iter_images(inputs: List[str], recursive: bool = False) -> Iterator[str]:
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            paths = glob.glob(pattern, recursive=recursive)
+        else:
+            paths = glob.glob(item, recursive=recursive)
+        for path in sorted(paths):
+            if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+                yield os.path.abspath(path)
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def _init_worker(verbose: bool = False, layout: bool = False):
+    if not verbose:
+        sys.stdout = open(os.devnull, 'w')
+
+    # หนึ่ง process ต่อหนึ่ง core ไม่ให้ OpenCV/PyTorch แตก thread ซ้อนกัน
+    cv2.setNumThreads(1)
+    configure_easyocr(threads=1, layout=layout)
+
+    # โหลด EasyOCR reader ครั้งเดียวต่อ worker
+    get_easyocr_reader()
+
+
+def scan_one(path: str, mode: str = 'full', refine: bool = REFINE_DEFAULT,
+             rectify: bool = RECTIFY_DEFAULT) -> Dict:
+    start_time = time.time()
+    record = {'path': path, 'status': 'ok'}
+    try:
+        image = cv2.imread(path)
+        if image is None:
+            raise ValueError('ไม่สามารถโหลดรูปภาพได้')
+        result, _ = process_sticker(image, mode=mode, refine=refine, merge_metrics=False,
+                                    rectify=rectify)
+        data = result['merged']['data']
+        record.update({field: data.get(field) for field in RECORD_FIELDS})
+        record['is_complete'] = validate_vaccine_data(data)['is_complete']
+        record['sources'] = {field: info.get('source') for field, info in result['merged']['sources'].items()}
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+    record['processing_time'] = round(time.time() - start_time, 3)
+    return record
+
+
+class ResultWriter:
+    def __init__(self, path: str, output_format: str):
+        self.format = output_format
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', encoding='utf-8', newline='')
+        if output_format == 'csv':
+            self.writer = csv.DictWriter(self.file, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+            if is_new:
+                self.writer.writeheader()
+
+    def write(self, record: Dict):
+        if self.format == 'csv':
+            self.writer.writerow(record)
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run_batch(paths: List[str], output: str, output_format: str, checkpoint: str,
+              workers: int, mode: str = 'full', refine: bool = REFINE_DEFAULT,
+              rectify: bool = RECTIFY_DEFAULT, verbose: bool = False, layout: bool = False) -> Dict:
+    writer = ResultWriter(output, output_format)
+    done_file = open(checkpoint, 'a', encoding='utf-8')
+    stats = {'ok': 0, 'error': 0}
+    start_time = time.time()
+
+    # ส่งงานทีละไม่เกิน workers*2 ชิ้น เพื่อไม่ให้หน่วยความจำโตตามจำนวนไฟล์
+    max_pending = workers * 2
+    pending = {}
+    remaining = iter(paths)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(verbose, layout)) as executor:
+            while True:
+                while len(pending) < max_pending:
+                    path = next(remaining, None)
+                    if path is None:
+                        break
+                    pending[executor.submit(scan_one, path, mode, refine, rectify)] = path
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = pending.pop(future)
+                    record = future.result()
+                    writer.write(record)
+                    # บันทึก checkpoint หลังเขียนผลลัพธ์แล้วเท่านั้น
+                    done_file.write(path + '\n')
+                    done_file.flush()
+                    stats[record['status']] += 1
+
+                    total = stats['ok'] + stats['error']
+                    elapsed = time.time() - start_time
+                    print(f'[{total}/{len(paths)}] {record["status"]:<5} {os.path.basename(path)} '
+                          f'({record["processing_time"]}s, {total / elapsed:.2f} img/s)', file=sys.stderr)
+    except KeyboardInterrupt:
+        print('\nหยุดการทำงาน รันคำสั่งเดิมอีกครั้งเพื่อทำต่อจาก checkpoint', file=sys.stderr)
+    finally:
+        writer.close()
+        done_file.close()
+
+    stats['elapsed'] = round(time.time() - start_time, 2)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scan vaccine sticker images in bulk without the web server')
+    parser.add_argument('inputs', nargs='+', help='Image directories, files or glob patterns')
+    parser.add_argument('-o', '--output', required=True, help='Output file (.jsonl or .csv)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None)
+    parser.add_argument('-r', '--recursive', action='store_true')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--mode', choices=PROCESS_MODES, default='full')
+    parser.add_argument('--no-refine', dest='refine', action='store_false', default=REFINE_DEFAULT)
+    parser.add_argument('--no-rectify', dest='rectify', action='store_false', default=RECTIFY_DEFAULT)
+    parser.add_argument('--checkpoint', default=None, help='Checkpoint file (default: OUTPUT.done)')
+    parser.add_argument('--restart', action='store_true', help='Ignore existing checkpoint and output')
+    parser.add_argument('--verbose', action='store_true', help='Show pipeline logs from workers')
+    parser.add_argument('--layout', action='store_true',
+                        help='Skip the EasyOCR text detector and use layout line boxes (standard stickers)')
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    checkpoint = args.checkpoint or f'{args.output}.done'
+
+    if args.restart:
+        for path in (args.output, checkpoint):
+            if os.path.exists(path):
+                os.remove(path)
+
+    done = load_checkpoint(checkpoint)
+    paths = [p for p in dict.fromkeys(iter_images(args.inputs, args.recursive)) if p not in done]
+
+    print(f'Images: {len(paths)} to scan, {len(done)} already done, workers: {args.workers}', file=sys.stderr)
+    if not paths:
+        return
+
+    stats = run_batch(paths, args.output, output_format, checkpoint, max(1, args.workers),
+                      mode=args.mode, refine=args.refine, rectify=args.rectify, verbose=args.verbose,
+                      layout=args.layout)
+    print(f'Done: {stats["ok"]} ok, {stats["error"]} errors in {stats["elapsed"]}s → {args.output}',
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
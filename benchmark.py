@@ -0,0 +1,524 @@
+import io
+import os
+import re
+import sys
+import glob
+import json
+import time
+import difflib
+import argparse
+import platform
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from pipeline import (PROCESS_MODES, RECTIFY_DEFAULT, REFINE_DEFAULT, MEMORY_BUDGET_BYTES,
+                      StageTimer, process_sticker)
+from ocr_engines import (OCR_BACKENDS, clear_ocr_cache, configure_easyocr, easyocr_options, get_easyocr_reader,
+                         ocr_cache_stats, ocr_result, prewarm_engines)
+from preprocessing import rectify_sticker, split_image_left_right, preprocess_left_region, preprocess_right_region
+from data_extraction import extract_vaccine_data
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DIRS = [os.path.join(BASE_DIR, 'รูปที่ใช้ทดสอบ'), os.path.join(BASE_DIR, 'uploads')]
+DEFAULT_LABELS = os.path.join(BASE_DIR, 'benchmark_labels.json')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+BENCH_FIELDS = ['vaccine_name', 'product_name', 'manufacturer', 'registration_number',
+                'serial_number', 'mfg_date', 'exp_date']
+BENCH_OUTPUTS = ['tesseract', 'easyocr', 'hybrid', 'merged']
+PERCENTILES = [50, 90, 95, 99]
+
+# วัดเวลา import ของแต่ละโมดูลใน process ใหม่ (เรียงจากเบาไปหนัก) และ backend ที่หนักที่ไม่ควรถูก import ตอนเริ่ม
+IMPORT_MODULES = ['data_extraction', 'preprocessing', 'ocr_engines', 'pipeline', 'app']
+HEAVY_MODULES = ['torch', 'torchvision', 'easyocr']
+IMPORT_PROBE = '''
+import sys, json, time, contextlib, io
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    __import__(sys.argv[1])
+result = {'seconds': time.perf_counter() - start}
+if sys.argv[2] == '1':
+    from ocr_engines import prewarm_engines
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result['prewarm'] = prewarm_engines()
+    result['prewarm_seconds'] = time.perf_counter() - start
+result['heavy'] = sorted(m for m in json.loads(sys.argv[3]) if m in sys.modules)
+# RSS ปัจจุบันจาก /proc ไม่ใช้ ru_maxrss เพราะค่าสูงสุดของ process แม่ติดมากับ fork
+try:
+    import os
+    with open('/proc/self/statm') as f:
+        result['rss_bytes'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+except (OSError, ValueError):
+    result['rss_bytes'] = None
+print(json.dumps(result))
+'''
+
+# ไฟล์ใน uploads/ ขึ้นต้นด้วย request id (ULID) หรือ timestamp ของไฟล์เก่า เช่น 20251121_103901_defensor_1.png
+UPLOAD_PREFIX = re.compile(r'^(\d{8}_\d{6}|[0-9A-HJKMNP-TV-Z]{26})_')
+
+
+def label_key(path: str) -> str:
+    return UPLOAD_PREFIX.sub('', os.path.basename(path))
+
+
+def collect_images(paths: List[str]) -> List[str]:
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = sorted(glob.glob(os.path.join(path, '*')))
+        else:
+            candidates = sorted(glob.glob(path))
+        images.extend(p for p in candidates if p.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(p))
+    return images
+
+
+def normalize_value(value: Optional[str]) -> str:
+    return re.sub(r'\s+', ' ', re.sub(r'[^A-Z0-9/() ]', ' ', (value or '').upper())).strip()
+
+
+def field_matches(value: Optional[str], expected) -> bool:
+    options = expected if isinstance(expected, list) else [expected]
+    return bool(value) and normalize_value(value) in {normalize_value(o) for o in options}
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux รายงานเป็น KB, macOS เป็น bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile_summary(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    summary = {f'p{p}': round(float(np.percentile(values, p)), 4) for p in PERCENTILES}
+    summary['mean'] = round(float(np.mean(values)), 4)
+    summary['max'] = round(float(np.max(values)), 4)
+    return summary
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(images: List[str], labels: Dict[str, Dict], mode: str = 'full',
+                  refine: bool = REFINE_DEFAULT, rectify: bool = RECTIFY_DEFAULT,
+                  repeat: int = 1, verbose: bool = False, track_memory: bool = False,
+                  memory_budget: Optional[int] = MEMORY_BUDGET_BYTES, ocr_cache: bool = False) -> Dict:
+    stage_samples = {}
+    stage_memory = {}
+    totals = []
+    correct = {output: {field: 0 for field in BENCH_FIELDS} for output in BENCH_OUTPUTS}
+    # ผลที่ถูกข้าม (เช่น EasyOCR ในโหมด fast) ไม่นับรวมในตัวหาร
+    evaluated = {output: {field: 0 for field in BENCH_FIELDS} for output in BENCH_OUTPUTS}
+    per_image = []
+
+    # โหลดโมเดล EasyOCR ก่อนจับเวลา เพื่อไม่ให้เวลาโหลดปนกับภาพแรก
+    start_time = time.perf_counter()
+    get_easyocr_reader()
+    easyocr_init = time.perf_counter() - start_time
+
+    clear_ocr_cache()
+    wall_start = time.perf_counter()
+    for path in images:
+        expected = labels.get(label_key(path))
+        for _ in range(repeat):
+            # ค่าเริ่มต้นล้างแคช OCR ทุกรอบ ไม่ให้ --repeat วัดได้แต่เวลาอ่านจากแคช
+            if not ocr_cache:
+                clear_ocr_cache()
+            timer = StageTimer(track_memory=track_memory)
+            start_time = time.perf_counter()
+
+            with timer.stage('load'):
+                image = cv2.imread(path)
+            if image is None:
+                print(f'Skip (cannot load): {path}')
+                break
+
+            log = io.StringIO()
+            if verbose:
+                result, _ = process_sticker(image, mode=mode, refine=refine, rectify=rectify, timer=timer,
+                                                memory_budget=memory_budget)
+            else:
+                with redirect_stdout(log):
+                    result, _ = process_sticker(image, mode=mode, refine=refine, rectify=rectify, timer=timer,
+                                                memory_budget=memory_budget)
+
+            totals.append(time.perf_counter() - start_time)
+            for stage, seconds in timer.stages.items():
+                stage_samples.setdefault(stage, []).append(seconds)
+            # เก็บค่าสูงสุดของทุกรอบ งบหน่วยความจำต้องรองรับภาพที่หนักที่สุด
+            for stage, stats in timer.memory.items():
+                worst = stage_memory.setdefault(stage, {'peak_bytes': 0, 'rss_delta_bytes': 0})
+                for key in worst:
+                    worst[key] = max(worst[key], stats[key])
+
+        if image is None:
+            continue
+
+        record = {'image': os.path.relpath(path, BASE_DIR), 'labelled': expected is not None}
+        if expected:
+            record['fields'] = {}
+            for field in BENCH_FIELDS:
+                if field not in expected:
+                    continue
+                record['fields'][field] = {}
+                for output in BENCH_OUTPUTS:
+                    section = result.get(output) or {}
+                    if section.get('skipped'):
+                        continue
+                    value = section.get('data', {}).get(field)
+                    evaluated[output][field] += 1
+                    correct[output][field] += int(field_matches(value, expected[field]))
+                    record['fields'][field][output] = value
+                record['fields'][field]['expected'] = expected[field]
+        per_image.append(record)
+    wall_time = time.perf_counter() - wall_start
+
+    accuracy = {}
+    for output in BENCH_OUTPUTS:
+        per_field = {
+            field: round(correct[output][field] / evaluated[output][field] * 100, 1)
+            for field in BENCH_FIELDS if evaluated[output][field]
+        }
+        accuracy[output] = {
+            'fields': per_field,
+            'overall': round(sum(per_field.values()) / len(per_field), 1) if per_field else None
+        }
+
+    runs = len(totals)
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'git': git_revision(),
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'config': {'mode': mode, 'refine': refine, 'rectify': rectify, 'repeat': repeat,
+                   'memory_budget': memory_budget, 'ocr_cache': ocr_cache, 'easyocr': easyocr_options()},
+        'images': len(per_image),
+        'labelled': sum(1 for r in per_image if r['labelled']),
+        'runs': runs,
+        'wall_time': round(wall_time, 3),
+        'images_per_sec': round(runs / wall_time, 3) if wall_time else None,
+        'easyocr_init': round(easyocr_init, 3),
+        'peak_rss_bytes': peak_rss_bytes(),
+        'latency': {
+            'total': percentile_summary(totals),
+            'stages': {stage: percentile_summary(samples) for stage, samples in sorted(stage_samples.items())}
+        },
+        'memory': {'stages': dict(sorted(stage_memory.items()))} if track_memory else None,
+        'ocr_cache': ocr_cache_stats() if ocr_cache else None,
+        'accuracy': accuracy,
+        'per_image': per_image
+    }
+
+
+def run_backend_benchmark(images: List[str], labels: Dict[str, Dict], backends: List[str],
+                          repeat: int = 1) -> Dict:
+    # เทียบ OCR backend บนภาพที่ประมวลผลแล้วชุดเดียวกัน ไม่ผ่านแคช ไม่รวมเวลา preprocess
+    # similarity คือความเหมือนของข้อความเทียบกับ backend แรก (1.0 = ตรงกันทุกตัว)
+    load_times = prewarm_engines(backends)
+    active = [name for name in backends if load_times[name]['ready']]
+    samples = {name: [] for name in backends}
+    confidences = {name: [] for name in backends}
+    similarity = {name: [] for name in backends}
+    correct = {name: {field: 0 for field in BENCH_FIELDS} for name in backends}
+    evaluated = {field: 0 for field in BENCH_FIELDS}
+
+    for path in images:
+        image = cv2.imread(path)
+        if image is None:
+            print(f'Skip (cannot load): {path}')
+            continue
+        with redirect_stdout(io.StringIO()):
+            sticker, _ = rectify_sticker(image)
+            left, right = split_image_left_right(sticker)
+            regions = (preprocess_left_region(left), preprocess_right_region(right))
+
+        expected = labels.get(label_key(path)) or {}
+        for field in BENCH_FIELDS:
+            evaluated[field] += int(field in expected)
+
+        reference = None
+        for name in active:
+            for _ in range(repeat):
+                start_time = time.perf_counter()
+                results = [ocr_result(name, region, cache=False) for region in regions]
+                samples[name].append(time.perf_counter() - start_time)
+
+            confidences[name].append(np.mean([result['confidence'] for result in results]))
+            text = '\n'.join(result['text'] for result in results)
+            if reference is None:
+                reference = text
+            similarity[name].append(difflib.SequenceMatcher(None, reference, text).ratio())
+
+            with redirect_stdout(io.StringIO()):
+                data = extract_vaccine_data(results[0]['text'], results[1]['text'])
+            for field in BENCH_FIELDS:
+                if field in expected:
+                    correct[name][field] += int(field_matches(data.get(field), expected[field]))
+
+    report = {}
+    for name in backends:
+        per_field = {field: round(correct[name][field] / evaluated[field] * 100, 1)
+                     for field in BENCH_FIELDS if evaluated[field]}
+        report[name] = {
+            'ready': load_times[name]['ready'],
+            'load_time': load_times[name]['seconds'],
+            'latency': percentile_summary(samples[name]),
+            'confidence': round(float(np.mean(confidences[name])), 1) if confidences[name] else None,
+            'similarity': round(float(np.mean(similarity[name])), 3) if similarity[name] else None,
+            'accuracy': {'fields': per_field,
+                         'overall': round(sum(per_field.values()) / len(per_field), 1) if per_field else None}
+        }
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'git': git_revision(),
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'images': len(images),
+        'repeat': repeat,
+        'backends': report
+    }
+
+
+def format_backend_report(report: Dict) -> str:
+    lines = [f'{"backend":<16}{"load s":>8}{"p50 s":>9}{"p95 s":>9}{"conf":>7}{"similar":>9}{"accuracy":>10}']
+    for name, row in report['backends'].items():
+        if not row['ready']:
+            lines.append(f'{name:<16}  not available')
+            continue
+        latency = row['latency']
+        overall = row['accuracy']['overall']
+        lines.append(f'{name:<16}{row["load_time"]:>8.2f}{latency.get("p50", 0):>9.3f}{latency.get("p95", 0):>9.3f}'
+                     f'{row["confidence"] or 0:>7.1f}{row["similarity"] or 0:>9.3f}'
+                     f'{"-" if overall is None else f"{overall}%":>10}')
+    return '\n'.join(lines)
+
+
+def measure_import(module: str, prewarm: bool = False) -> Dict:
+    output = subprocess.check_output(
+        [sys.executable, '-c', IMPORT_PROBE, module, '1' if prewarm else '0', json.dumps(HEAVY_MODULES)],
+        cwd=BASE_DIR, stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def run_import_benchmark(modules: List[str] = IMPORT_MODULES, repeat: int = 3) -> Dict:
+    # process ใหม่ทุกรอบ เพราะโมดูลที่ import แล้วจะถูก cache ไว้ใน sys.modules
+    rows = {}
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        rows[module] = {
+            'seconds': percentile_summary([run['seconds'] for run in runs]),
+            'rss_bytes': max(run['rss_bytes'] or 0 for run in runs) or None,
+            'heavy': runs[-1]['heavy']
+        }
+
+    prewarmed = measure_import('ocr_engines', prewarm=True)
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'git': git_revision(),
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'repeat': repeat,
+        'imports': rows,
+        'prewarm': {
+            'seconds': round(prewarmed['prewarm_seconds'], 3),
+            'engines': prewarmed['prewarm'],
+            'rss_bytes': prewarmed['rss_bytes'],
+            'heavy': prewarmed['heavy']
+        }
+    }
+
+
+def format_import_report(report: Dict) -> str:
+    lines = [f'{"module":<18}{"p50 s":>9}{"max s":>9}{"RSS MB":>9}  heavy modules loaded']
+    for module, row in report['imports'].items():
+        rss = (row['rss_bytes'] or 0) / 1048576
+        lines.append(f'{module:<18}{row["seconds"]["p50"]:>9.3f}{row["seconds"]["max"]:>9.3f}{rss:>9.1f}  '
+                     f'{", ".join(row["heavy"]) or "-"}')
+    prewarm = report['prewarm']
+    engines = ', '.join(f'{name} {info["seconds"]:.2f}s{"" if info["ready"] else " (not available)"}'
+                        for name, info in prewarm['engines'].items())
+    lines.append('')
+    lines.append(f'prewarm: {prewarm["seconds"]:.3f}s ({engines}), '
+                 f'RSS {(prewarm["rss_bytes"] or 0) / 1048576:.1f} MB')
+    return '\n'.join(lines)
+
+
+def format_report(report: Dict) -> str:
+    lines = [
+        f'Images: {report["images"]} ({report["labelled"]} labelled), runs: {report["runs"]}, '
+        f'mode: {report["config"]["mode"]}, refine: {report["config"]["refine"]}, '
+        f'rectify: {report["config"].get("rectify")}',
+        f'Throughput: {report["images_per_sec"]} images/sec, wall {report["wall_time"]}s',
+    ]
+    easyocr = report['config'].get('easyocr')
+    if easyocr:
+        lines.append(f'EasyOCR: {"int8" if easyocr["quantize"] else "fp32"}, '
+                     f'channels_last: {easyocr["channels_last"]}, threads: {easyocr["threads"]}, '
+                     f'layout: {easyocr.get("layout", False)}')
+    if report['peak_rss_bytes']:
+        lines.append(f'Peak RSS: {report["peak_rss_bytes"] / 1024 / 1024:.1f} MB')
+
+    lines.append('')
+    lines.append(f'{"stage":<18}' + ''.join(f'{"p" + str(p):>9}' for p in PERCENTILES) + f'{"mean":>9}')
+    rows = [('total', report['latency']['total'])] + list(report['latency']['stages'].items())
+    for stage, summary in rows:
+        lines.append(f'{stage:<18}' + ''.join(f'{summary.get("p" + str(p), 0):>9.3f}' for p in PERCENTILES)
+                     + f'{summary.get("mean", 0):>9.3f}')
+
+    if report.get('memory'):
+        lines.append('')
+        lines.append(f'{"stage":<18}{"peak MB":>10}{"RSS +MB":>10}')
+        for stage, stats in report['memory']['stages'].items():
+            lines.append(f'{stage:<18}{stats["peak_bytes"] / 1048576:>10.1f}{stats["rss_delta_bytes"] / 1048576:>10.1f}')
+
+    if report.get('ocr_cache'):
+        lines.append('')
+        lines.append(f'{"OCR cache":<18}{"hits":>9}{"misses":>9}{"hit rate":>10}')
+        for engine, stats in report['ocr_cache']['engines'].items():
+            lines.append(f'{engine:<18}{stats["hits"]:>9}{stats["misses"]:>9}{stats["hit_rate"] or 0:>10.3f}')
+
+    lines.append('')
+    lines.append(f'{"field":<22}' + ''.join(f'{o:>11}' for o in BENCH_OUTPUTS))
+    for field in BENCH_FIELDS:
+        values = [report['accuracy'][o]['fields'].get(field) for o in BENCH_OUTPUTS]
+        if all(v is None for v in values):
+            continue
+        lines.append(f'{field:<22}' + ''.join(f'{v:>10}%' if v is not None else f'{"-":>11}' for v in values))
+    overall = [report['accuracy'][o]['overall'] for o in BENCH_OUTPUTS]
+    lines.append(f'{"overall":<22}' + ''.join(f'{v:>10}%' if v is not None else f'{"-":>11}' for v in overall))
+
+    return '\n'.join(lines)
+
+
+def format_comparison(previous: Dict, current: Dict) -> str:
+    def delta(old, new):
+        if old is None or new is None:
+            return '-'
+        if not old:
+            return f'{new - old:+.3f}'
+        return f'{(new - old) / old * 100:+.1f}%'
+
+    lines = [f'Compare {previous.get("git") or "previous"} → {current.get("git") or "current"}', '']
+    lines.append(f'{"metric":<28}{"before":>12}{"after":>12}{"change":>10}')
+
+    old_ips, new_ips = previous.get('images_per_sec'), current.get('images_per_sec')
+    lines.append(f'{"images/sec":<28}{old_ips or 0:>12.3f}{new_ips or 0:>12.3f}{delta(old_ips, new_ips):>10}')
+
+    stages = ['total'] + sorted(set(previous['latency']['stages']) | set(current['latency']['stages']))
+    for stage in stages:
+        old = (previous['latency']['total'] if stage == 'total' else previous['latency']['stages'].get(stage, {})).get('p50')
+        new = (current['latency']['total'] if stage == 'total' else current['latency']['stages'].get(stage, {})).get('p50')
+        lines.append(f'{stage + " p50 (s)":<28}{old or 0:>12.3f}{new or 0:>12.3f}{delta(old, new):>10}')
+
+    old_rss, new_rss = previous.get('peak_rss_bytes'), current.get('peak_rss_bytes')
+    if old_rss and new_rss:
+        lines.append(f'{"peak RSS (MB)":<28}{old_rss / 1048576:>12.1f}{new_rss / 1048576:>12.1f}{delta(old_rss, new_rss):>10}')
+
+    for output in BENCH_OUTPUTS:
+        old = previous['accuracy'].get(output, {}).get('overall')
+        new = current['accuracy'].get(output, {}).get('overall')
+        lines.append(f'{output + " accuracy (%)":<28}{old or 0:>12.1f}{new or 0:>12.1f}'
+                     f'{"" if old is None or new is None else f"{new - old:+.1f}":>10}')
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark speed and accuracy of the OCR pipeline')
+    parser.add_argument('paths', nargs='*', default=DEFAULT_DIRS, help='Image directories or globs')
+    parser.add_argument('--labels', default=DEFAULT_LABELS, help='Ground-truth labels JSON')
+    parser.add_argument('--mode', choices=PROCESS_MODES, default='full')
+    parser.add_argument('--no-refine', dest='refine', action='store_false', default=REFINE_DEFAULT)
+    parser.add_argument('--no-rectify', dest='rectify', action='store_false', default=RECTIFY_DEFAULT)
+    parser.add_argument('--memory', action='store_true', help='Record peak memory of each stage (slower)')
+    parser.add_argument('--memory-budget', type=int, default=MEMORY_BUDGET_BYTES // 1048576,
+                        help='Downscale inputs expected to need more than this many MB (0 = no limit)')
+    parser.add_argument('--ocr-cache', action='store_true',
+                        help='Keep the OCR result cache across runs and report its hit rate')
+    parser.add_argument('--fp32', dest='quantize', action='store_false',
+                        help='Load EasyOCR without int8 dynamic quantization')
+    parser.add_argument('--channels-last', action='store_true',
+                        help='Run the EasyOCR detector with channels_last (NHWC) tensors')
+    parser.add_argument('--threads', type=int, default=None, help='Torch threads for EasyOCR (default: usable cores)')
+    parser.add_argument('--layout', action='store_true',
+                        help='Feed EasyOCR line boxes from layout segmentation instead of running its text detector')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per image for latency percentiles')
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--output', help='Write JSON report to this file')
+    parser.add_argument('--compare', help='Previous JSON report to compare against')
+    parser.add_argument('--verbose', action='store_true', help='Show pipeline logs')
+    parser.add_argument('--backends', nargs='+', choices=sorted(OCR_BACKENDS),
+                        help='Compare OCR backends on the same preprocessed regions instead (first is the reference)')
+    parser.add_argument('--imports', action='store_true',
+                        help='Measure import time and RSS of each module in fresh processes instead')
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    if args.imports:
+        report = run_import_benchmark(repeat=args.repeat)
+        print(format_import_report(report))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f'\nSaved: {args.output}')
+        return
+
+    # ต้องตั้งก่อนโหลด reader เทียบ int8/fp32 ด้วย --output แล้วรันอีกครั้งพร้อม --compare
+    configure_easyocr(quantize=args.quantize, channels_last=args.channels_last, threads=args.threads,
+                      layout=args.layout)
+
+    labels = {}
+    if args.labels and os.path.exists(args.labels):
+        with open(args.labels, encoding='utf-8') as f:
+            labels = json.load(f)
+
+    images = collect_images(args.paths)[:args.limit]
+    if not images:
+        parser.error('No images found')
+
+    if args.backends:
+        report = run_backend_benchmark(images, labels, args.backends, repeat=args.repeat)
+        print(format_backend_report(report))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f'\nSaved: {args.output}')
+        return
+
+    report = run_benchmark(images, labels, mode=args.mode, refine=args.refine, rectify=args.rectify,
+                           track_memory=args.memory, memory_budget=args.memory_budget * 1048576 or None,
+                           ocr_cache=args.ocr_cache, repeat=args.repeat, verbose=args.verbose)
+    print(format_report(report))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'\nSaved: {args.output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        print()
+        print(format_comparison(previous, report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import itertools
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from fuzzy_match import build_deletion_index, lookup
+
+CATALOGUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'product_catalogue.json')
+CATALOGUE_KINDS = ('products', 'manufacturers', 'components')
+
+FUZZY_MAX_DISTANCE = 2
+# ชื่อผู้ผลิตและชื่อการค้าสั้นและคล้ายคำทั่วไป (MATERIAL → MERIAL, INTERVAL → INTERVET)
+# จึงแก้ได้ไม่เกินสัดส่วนนี้ของความยาวคำ ร่วมกับคำทั่วไปใน words ของ product_catalogue.json
+BRAND_MAX_DISTANCE_RATIO = 0.25
+BRAND_KINDS = ('products', 'manufacturers')
+# รวมคำที่ OCR แยกเป็นชิ้น เช่น FE O K CELL ได้สูงสุดกี่คำ
+MAX_JOIN_TOKENS = 6
+
+# ตัวอักษรที่ OCR อ่านสลับกับตัวเลขบ่อย ใช้สร้าง variant ของ prefix เลขทะเบียน
+DIGIT_LOOKALIKES = {
+    '0': 'OQD',
+    '1': 'IL',
+    '2': 'Z',
+    '5': 'S',
+    '6': 'G',
+    '8': 'B',
+}
+
+_END = ''
+
+
+def variant_key(text: str) -> str:
+    return re.sub(r'[^A-Z0-9]', '', text.upper())
+
+
+def build_trie(pairs) -> Dict:
+    root = {}
+    for key, entry in pairs:
+        node = root
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[_END] = entry
+    return root
+
+
+def prefix_variants(prefix: str) -> List[str]:
+    options = [ch + DIGIT_LOOKALIKES.get(ch, '') for ch in prefix]
+    return [''.join(chars) for chars in itertools.product(*options)]
+
+
+def load_catalogue(path: str = CATALOGUE_PATH) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        raw = json.load(f)
+
+    catalogue = {'entries': {}, 'tries': {}, 'registration_prefixes': {}}
+    terms = set()
+    brand_terms = set()
+    for kind in CATALOGUE_KINDS:
+        entries = raw.get(kind, [])
+        pairs = []
+        for entry in entries:
+            for variant in [entry['key']] + entry.get('variants', []):
+                pairs.append((variant_key(variant), entry))
+        catalogue['entries'][kind] = entries
+        catalogue['tries'][kind] = build_trie(pairs)
+        terms.update(key for key, _ in pairs)
+        if kind in BRAND_KINDS:
+            brand_terms.update(key for key, _ in pairs)
+
+    # คำทั่วไปบนสติกเกอร์อยู่ใน vocabulary ด้วย เพื่อไม่ให้ SERIAL ถูกแก้เป็น MERIAL
+    words = {variant_key(word) for word in raw.get('words', [])}
+    catalogue['terms'] = terms - words
+    catalogue['brand_terms'] = brand_terms - words
+    catalogue['max_term_length'] = max(len(term) for term in terms | words)
+    catalogue['fuzzy'] = build_deletion_index(terms | words, FUZZY_MAX_DISTANCE)
+
+    for product in catalogue['entries']['products']:
+        for prefix in product.get('registration_prefixes', []):
+            for variant in prefix_variants(prefix):
+                catalogue['registration_prefixes'].setdefault(variant, prefix)
+
+    return catalogue
+
+
+# โหลดครั้งเดียวตอน import ทุกการค้นหาหลังจากนี้ใช้ index ในหน่วยความจำ
+CATALOGUE = load_catalogue()
+
+
+def find_matches(text: str, kind: str, first_only: bool = False) -> List[Dict]:
+    # เดิน trie จากแต่ละตำแหน่ง ข้ามช่องว่างกลางคำได้ เช่น FE O K CELL
+    # เวลาขึ้นกับความยาวข้อความและความยาวคำที่ยาวที่สุด ไม่ขึ้นกับจำนวนสินค้า
+    t = text.upper()
+    trie = CATALOGUE['tries'][kind]
+    matches = []
+
+    i = 0
+    while i < len(t):
+        if not t[i].isalnum():
+            i += 1
+            continue
+
+        node = trie
+        found = None
+        j = i
+        while j < len(t):
+            if t[j].isspace():
+                j += 1
+                continue
+            node = node.get(t[j])
+            if node is None:
+                break
+            j += 1
+            if _END in node:
+                found = (node[_END], j)
+
+        if found is None:
+            i += 1
+            continue
+
+        matches.append({'entry': found[0], 'start': i, 'end': found[1]})
+        if first_only:
+            break
+        i = found[1]
+
+    return matches
+
+
+def find_first(text: str, kind: str) -> Optional[Dict]:
+    matches = find_matches(text, kind, first_only=True)
+    return matches[0] if matches else None
+
+
+def within_correction(term: str, distance: int) -> bool:
+    if term in CATALOGUE['brand_terms']:
+        return distance <= int(len(term) * BRAND_MAX_DISTANCE_RATIO)
+    return True
+
+
+@lru_cache(maxsize=256)
+def correct_tokens(text: str) -> str:
+    # แก้คำที่ OCR อ่านผิดด้วย deletion index รอบเดียวต่อคำ แทนการเขียน variant ทุกแบบ
+    # ลองรวมคำที่อยู่ติดกันด้วย แล้วเลือกแบบที่ระยะแก้ไขน้อยที่สุด
+    t = text.upper()
+    tokens = list(re.finditer(r'[A-Z]+', t))
+    parts = []
+    last = 0
+
+    i = 0
+    while i < len(tokens):
+        best = None
+        joined = ''
+        for n in range(i, min(i + MAX_JOIN_TOKENS, len(tokens))):
+            if n > i and not t[tokens[n - 1].end():tokens[n].start()].isspace():
+                break
+            joined += tokens[n].group(0)
+            if len(joined) > CATALOGUE['max_term_length'] + FUZZY_MAX_DISTANCE:
+                break
+            match = lookup(CATALOGUE['fuzzy'], joined, accept=within_correction)
+            if match and (best is None or match['distance'] <= best['distance']):
+                best = {**match, 'last': n}
+
+        if best is None or best['term'] not in CATALOGUE['terms'] or (best['distance'] == 0 and best['last'] == i):
+            i += 1
+            continue
+
+        parts.append(t[last:tokens[i].start()])
+        parts.append(best['term'])
+        last = tokens[best['last']].end()
+        i = best['last'] + 1
+
+    parts.append(t[last:])
+    return ''.join(parts)
+
+
+def canonicalize_variants(text: str, kinds=('products', 'manufacturers')) -> str:
+    # แทน variant ที่ OCR อ่านผิดด้วยชื่อมาตรฐาน เช่น DEFERUSOR3 → DEFENSOR 3
+    t = text.upper()
+    for kind in kinds:
+        parts = []
+        last = 0
+        for match in find_matches(t, kind):
+            parts.append(t[last:match['start']])
+            parts.append(match['entry']['key'])
+            if match['end'] < len(t) and t[match['end']].isdigit():
+                parts.append(' ')
+            last = match['end']
+        parts.append(t[last:])
+        t = ''.join(parts)
+    return t
+
+
+def component_names(text: str) -> List[str]:
+    found = {match['entry']['name'] for match in find_matches(text, 'components')}
+    # เรียงตามลำดับใน catalogue ไม่ใช่ลำดับในข้อความ
+    return [entry['name'] for entry in CATALOGUE['entries']['components'] if entry['name'] in found]
+
+
+def infer_product(components: List[str]) -> Optional[str]:
+    # เลือกสินค้าที่มีส่วนประกอบตรงมากที่สุด เท่ากันใช้ลำดับใน catalogue
+    best, best_overlap = None, 0
+    for product in CATALOGUE['entries']['products']:
+        overlap = len(set(product.get('components', [])) & set(components))
+        if overlap > best_overlap:
+            best, best_overlap = product['name'], overlap
+    return best
+
+
+def registration_prefix(prefix: str) -> str:
+    return CATALOGUE['registration_prefixes'].get(prefix, prefix)
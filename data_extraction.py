@@ -2,6 +2,16 @@ import re
 from typing import Dict, Optional
 from datetime import datetime
 
+from catalogue import (
+    canonicalize_variants,
+    component_names,
+    correct_tokens,
+    find_first,
+    infer_product,
+    registration_prefix,
+    variant_key
+)
+
 
 def clean_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text)
@@ -37,18 +47,10 @@ def normalize_ocr_text(text: str) -> str:
         'A0': 'APR',
     }
 
+    # ชื่อสินค้าและผู้ผลิตที่อ่านผิดแก้จาก catalogue
+    t = canonicalize_variants(correct_tokens(t))
+
     domain_replacements = {
-        'DEFERUSOR': 'DEFENSOR',
-        'DEFERUSO': 'DEFENSOR',
-        'DEFERUSOR 3': 'DEFENSOR 3',
-        'DEFERRUSOR': 'DEFENSOR',
-        'ZORTS': 'ZOETIS',
-        'ZORTS INC': 'ZOETIS INC',
-        'CEFENSOR': 'DEFENSOR',
-        'DEFENSOR 3  ': 'DEFENSOR 3 ',
-        'DEFENSOR3': 'DEFENSOR 3',
-        'FEUOCELL': 'FELOCELL',
-        'FEUOKCELL': 'FELOCELL',
         'RSG': 'REG',
         'RGS': 'REG',
         'RS G': 'REG',
@@ -68,8 +70,6 @@ def normalize_ocr_text(text: str) -> str:
     t = t.replace('0CT', 'OCT')
     t = t.replace('O0T', 'OCT')
     t = t.replace('O0CT', 'OCT')
-    t = t.replace('FEUOCELL', 'FELOCELL')
-    t = t.replace('FEUOKCELL', 'FELOCELL')
     t = t.replace('RAY', 'MAY')
     t = t.replace('ROV', 'NOV')
     t = t.replace('R0V', 'NOV')
@@ -105,63 +105,40 @@ def normalize_serial(raw: str) -> str:
     return s
 
 
-def extract_vaccine_name(text: str) -> Optional[str]:
-    t = text.upper()
+def product_with_suffix(text: str, suffix: str) -> Optional[str]:
+    t = correct_tokens(text)
+    match = find_first(t, 'products')
+    if match is None:
+        return None
 
-    components = []
-    if 'RABIES VACCINE' in t or 'RABIES' in t:
-        components.append('Rabies Vaccine')
-    if 'FELINE' in t and ('RHINOTRACH' in t or 'RHINOTRACHC' in t):
-        components.append('Feline Rhinotracheitis')
-    elif 'RHINOTRACHEITIS' in t or 'RHINOTRACH' in t or 'RHINOTRACHC' in t:
-        components.append('Feline Rhinotracheitis')
-    if 'CALICI' in t or 'PANLEUKOPENIA' in t or 'PANLCUKOPENIA' in t or 'PANLEUCOPENIA' in t:
-        components.append('Calici-Panleukopenia')
-    if 'CHLAMYDIA' in t or 'PSITTACI' in t or 'PSITTACH' in t or 'SHTCINDIS' in t:
-        components.append('Chlamydia psittaci')
+    # เก็บตัวเลขรุ่นที่ตามหลังชื่อ เช่น DEFENSOR 3, FELOCELL 4
+    tail = re.match(suffix, t[match['end']:])
+    return (match['entry']['name'] + tail.group(0)).strip()
 
+
+def extract_vaccine_name(text: str) -> Optional[str]:
+    components = component_names(correct_tokens(text))
     if components:
         return '; '.join(components)
 
-    match = re.search(r'(NOBIVAC|DEFENSOR|FELOCELL|FEUOCELL|FEUOKCELL|CEFENSOR)\s*\d*', t)
-    if match:
-        prod = match.group(0).strip()
-        prod = prod.replace('FEUOCELL', 'FELOCELL').replace('FEUOKCELL', 'FELOCELL').replace('CEFENSOR', 'DEFENSOR')
-        return prod
-
-    return None
+    return product_with_suffix(text, r'\s*\d*')
 
 
 def extract_product_name(text: str) -> Optional[str]:
-    t = text.upper()
+    return product_with_suffix(text, r'\s*[TM]*\s*\d*')
 
-    match = re.search(r'(DEFENSOR|DEFERUSOR|DEFERUSO|CEFENSOR|NOBIVAC|FELOCELL|FEUOCELL|FEUOKCELL|FEU?\s*O\s*K\s*C?\s*CELL|FE\s*O\s*K\s*C?\s*CELL|FE\s*OKC\s*ELL|ELOKCELL|ELCELL|RABISIN)\s*[TM]*\s*\d*', t)
-    if match:
-        prod = match.group(0).strip()
-        prod = prod.replace('DEFERUSOR', 'DEFENSOR').replace('DEFERUSO', 'DEFENSOR').replace('CEFENSOR', 'DEFENSOR')
-        prod = prod.replace('FEUOCELL', 'FELOCELL').replace('FEUOKCELL', 'FELOCELL')
-        prod = re.sub(r'FEU?\s*O\s*K\s*C?\s*CELL', 'FELOCELL', prod)
-        prod = re.sub(r'FE\s*O\s*K\s*C?\s*CELL', 'FELOCELL', prod)
-        prod = re.sub(r'FE\s*OKC\s*ELL', 'FELOCELL', prod)
-        prod = prod.replace('ELOKCELL', 'FELOCELL').replace('ELCELL', 'FELOCELL')
-        return prod
 
-    return None
+def extract_brand_name(text: str) -> Optional[str]:
+    # หาชื่อการค้าโดยไม่สนช่องว่าง เครื่องหมาย และการขึ้นบรรทัด เช่น FELO-CELL, DEFEN.SOR
+    # ไม่ได้เลขรุ่นเหมือน extract_product_name จึงใช้เป็นทางสำรองเท่านั้น
+    match = find_first(variant_key(correct_tokens(text)), 'products')
+    return match['entry']['name'] if match else None
 
 
 def extract_manufacturer(text: str) -> Optional[str]:
-    text_upper = text.upper()
-    
-    manufacturers = [
-        ('ZOETIS', 'Zoetis Inc.'),
-        ('BOEHRINGER', 'Boehringer Ingelheim'),
-        ('INTERVET', 'Intervet'),
-        ('MERIAL', 'Merial'),
-    ]
-    
-    for keyword, full_name in manufacturers:
-        if keyword in text_upper:
-            return full_name
+    match = find_first(correct_tokens(text), 'manufacturers')
+    if match:
+        return match['entry']['name']
     
     match = re.search(r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s+Inc\.?', text)
     if match:
@@ -283,8 +260,7 @@ def format_registration_number(raw: str) -> Optional[str]:
             prefix = re.sub(r'[^A-Z0-9]', '', toks[-1]) if toks else ''
 
         if prefix:
-            prefix = prefix.replace('IF', '1F').replace('I F', '1F')
-            prefix = prefix.replace('ZF', '2F').replace('Z F', '2F')
+            prefix = registration_prefix(prefix)
 
             if len(prefix) > 3:
                 return None
@@ -300,7 +276,7 @@ def format_registration_number(raw: str) -> Optional[str]:
         prefix = m2.group(1)
         number = m2.group(2)
 
-        prefix = prefix.replace('IF', '1F').replace('ZF', '2F')
+        prefix = registration_prefix(prefix)
 
         if len(prefix) == 2 and len(number) >= 4:
             conv = str.maketrans({'O': '0', 'Q': '0', 'D': '0', 'S': '5', 'Z': '2', 'I': '1', 'L': '1', 'B': '8', 'G': '6'})
@@ -621,13 +597,10 @@ def extract_vaccine_data(left_text: str, right_text: str) -> Dict[str, Optional[
             if pick:
                 data['exp_date'] = pick
 
+    # ไม่พบชื่อการค้าพร้อมรุ่น หาชื่อการค้าในข้อความด้านซ้ายอีกรอบ แล้วจึงเดาจากส่วนประกอบของวัคซีนตาม catalogue
     if not data.get('product_name'):
-        vn = (data.get('vaccine_name') or '').upper()
-        left_up = (left_text or '').upper()
-        if 'FELINE' in vn or 'FELOCELL' in left_up or 'FELOCELL' in vn or 'FEUOCELL' in left_up:
-            data['product_name'] = 'FELOCELL'
-        elif 'RABIES' in vn or 'RABIES VACCINE' in vn or 'DEFENSOR' in left_up or 'DEFERUSOR' in left_up:
-            data['product_name'] = 'DEFENSOR'
+        data['product_name'] = (extract_brand_name(left_text)
+                                or infer_product(component_names(data.get('vaccine_name') or '')))
 
     reg = data.get('registration_number')
     if not reg or len(reg) < 4 or re.fullmatch(r'\d{1,6}', (reg or '').replace(' ', '')):
@@ -0,0 +1,102 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import cv2
+import numpy as np
+
+
+# dHash 16x16 = 256 bit ภาพเดียวกันที่อัพโหลดซ้ำหรือแสงต่างเล็กน้อยห่างกัน 0-3 bit
+# สติกเกอร์คนละใบของสินค้าเดียวกันห่างกันตั้งแต่ ~60 bit แต่ถ่ายใหม่แล้วขยับเล็กน้อยก็ห่าง 20+ bit
+# จึงต้องตั้งเกณฑ์ต่ำ เพื่อไม่ให้คืนผลของขวดอื่นที่ต่างกันแค่ serial
+# ข้อจำกัด: จับได้เฉพาะไฟล์เดิมที่อัพโหลดซ้ำหรือบีบอัดใหม่ ขวดเดิมที่ถ่ายใหม่ห่างไม่กี่วินาที
+# (กรณีที่ต้องการจริง) ห่าง 20-60 bit จึงไม่ถูกจับ และไม่มีการตรวจภาพที่ถ่ายซ้ำจากหน้าจอ (moiré แสงสะท้อนจอ)
+HASH_SIZE = 16
+DUPLICATE_MAX_DISTANCE = 8
+DUPLICATE_TTL_SECONDS = 600
+DUPLICATE_MAX_ENTRIES = 256
+
+# แบ่ง hash เป็น band ละ 16 bit ถ้าห่างกันน้อยกว่าจำนวน band จะมีอย่างน้อยหนึ่ง band ที่ตรงกันทุก bit
+BAND_BITS = 16
+NUM_BANDS = HASH_SIZE * HASH_SIZE // BAND_BITS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+_entries = OrderedDict()
+_bands = [{} for _ in range(NUM_BANDS)]
+_lock = threading.Lock()
+_next_id = 0
+
+
+def dhash(image: np.ndarray, size: int = HASH_SIZE) -> int:
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def _band_values(image_hash: int):
+    for band in range(NUM_BANDS):
+        yield band, (image_hash >> (band * BAND_BITS)) & BAND_MASK
+
+
+def _remove(entry_id: int):
+    entry = _entries.pop(entry_id)
+    for band, value in _band_values(entry['hash']):
+        ids = _bands[band].get(value)
+        if ids:
+            ids.discard(entry_id)
+            if not ids:
+                del _bands[band][value]
+
+
+def _expire(now: float):
+    while _entries:
+        entry_id, entry = next(iter(_entries.items()))
+        if now - entry['time'] <= DUPLICATE_TTL_SECONDS and len(_entries) <= DUPLICATE_MAX_ENTRIES:
+            break
+        _remove(entry_id)
+
+
+def find_duplicate(image_hash: int, key: Hashable = None) -> Optional[Dict]:
+    now = time.time()
+    with _lock:
+        _expire(now)
+
+        # ดูเฉพาะรายการที่มี band ตรงกัน ไม่ต้องเทียบกับทุกรายการ
+        candidates = set()
+        for band, value in _band_values(image_hash):
+            candidates |= _bands[band].get(value, set())
+
+        best = None
+        for entry_id in candidates:
+            entry = _entries[entry_id]
+            if entry['key'] != key:
+                continue
+            distance = hamming(image_hash, entry['hash'])
+            if distance <= DUPLICATE_MAX_DISTANCE and (best is None or distance < best['distance']):
+                best = {'distance': distance, 'age': round(now - entry['time'], 1), 'payload': entry['payload']}
+
+        return best
+
+
+def remember(image_hash: int, payload: Dict, key: Hashable = None):
+    global _next_id
+    with _lock:
+        entry_id = _next_id
+        _next_id += 1
+        _entries[entry_id] = {'hash': image_hash, 'key': key, 'time': time.time(), 'payload': payload}
+        for band, value in _band_values(image_hash):
+            _bands[band].setdefault(value, set()).add(entry_id)
+        _expire(time.time())
+
+
+def clear_duplicates():
+    with _lock:
+        _entries.clear()
+        for band in _bands:
+            band.clear()
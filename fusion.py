@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import argparse
+from contextlib import redirect_stdout
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from preprocessing import sharpness_score, glare_fraction
+from pipeline import PROCESS_MODES, REFINE_DEFAULT, RECTIFY_DEFAULT, MEMORY_BUDGET_BYTES, StageTimer, process_sticker
+from data_extraction import THAI_FIELDS, format_output_thai, validate_vaccine_data
+from scoring import FIELD_NAMES, score_field_value
+from catalogue import variant_key
+
+
+# รัน OCR เฉพาะเฟรมที่ดีที่สุดกี่เฟรม
+FUSION_TOP_FRAMES = 3
+# อ่านจากวิดีโอไม่เกินกี่เฟรม กระจายให้ทั่วทั้งคลิป
+VIDEO_SAMPLE_FRAMES = 30
+# ค่าที่ชนะต้องนำค่าอื่นอยู่เท่านี้ เช่น สองเฟรมอ่านได้ตรงกันและรูปแบบถูกต้องทั้งคู่ (100 + 100)
+CONSENSUS_SCORE = 200
+CONSENSUS_FIELDS = FIELD_NAMES
+# glare 5% ของภาพหักคะแนนเท่ากับความคมที่หายไปครึ่งหนึ่ง
+GLARE_WEIGHT = 10.0
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm')
+
+
+def read_video_frames(path: str, max_frames: int = VIDEO_SAMPLE_FRAMES) -> List[np.ndarray]:
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f'Cannot open video: {path}')
+
+    try:
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = max(1, total // max_frames) if total > 0 else 1
+        frames = []
+        index = 0
+        # grab() ข้ามเฟรมโดยไม่ decode เฉพาะเฟรมที่เลือกจึง retrieve()
+        while len(frames) < max_frames and capture.grab():
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    frames.append(frame)
+            index += 1
+        return frames
+    finally:
+        capture.release()
+
+
+def frame_quality(frames: List[np.ndarray]) -> List[Dict]:
+    rows = []
+    for index, frame in enumerate(frames):
+        rows.append({
+            'index': index,
+            'sharpness': round(sharpness_score(frame), 1),
+            'glare': round(glare_fraction(frame), 4)
+        })
+
+    # ความคมเทียบกับเฟรมที่คมที่สุดในชุดเดียวกัน เพราะค่าจริงขึ้นกับกล้องและระยะถ่าย
+    best = max((row['sharpness'] for row in rows), default=0) or 1
+    for row in rows:
+        row['score'] = round(row['sharpness'] / best - GLARE_WEIGHT * row['glare'], 3)
+    return rows
+
+
+def select_frames(quality: List[Dict], top_k: int = FUSION_TOP_FRAMES) -> List[Dict]:
+    return sorted(quality, key=lambda row: (-row['score'], row['index']))[:max(1, top_k)]
+
+
+class FieldVotes:
+    # โหวตแต่ละฟิลด์ข้ามเฟรม ค่าที่เขียนต่างกันแค่ช่องว่าง/ตัวพิมพ์/เครื่องหมายนับเป็นค่าเดียวกัน
+    # น้ำหนักโหวต = score_field_value ของค่านั้น ค่าที่รูปแบบผิดจึงชนะค่าที่ถูกได้ยาก
+    def __init__(self, consensus_score: float = CONSENSUS_SCORE):
+        self.consensus_score = consensus_score
+        self.votes = {field: {} for field in THAI_FIELDS}
+        self.frames = []
+
+    def add(self, data: Dict, frame: Optional[int] = None):
+        frame = len(self.frames) if frame is None else frame
+        self.frames.append(frame)
+        for field, candidates in self.votes.items():
+            value = data.get(field)
+            if not value or value == 'ไม่พบ':
+                continue
+            key = variant_key(value)
+            if not key:
+                continue
+            score = score_field_value(field, value)
+            candidate = candidates.setdefault(key, {'value': value, 'score': 0, 'best': -1, 'frames': []})
+            candidate['score'] += score
+            candidate['frames'].append(frame)
+            # ตัวแทนของกลุ่มคือค่าที่ได้คะแนนรูปแบบสูงสุด เสมอกันใช้เฟรมที่มาก่อน
+            if score > candidate['best']:
+                candidate['value'], candidate['best'] = value, score
+
+    def ranked(self, field: str) -> List[Dict]:
+        return sorted(self.votes[field].values(), key=lambda c: (-c['score'], c['frames'][0]))
+
+    def margin(self, field: str) -> float:
+        ranked = self.ranked(field)
+        if not ranked:
+            return 0
+        return ranked[0]['score'] - (ranked[1]['score'] if len(ranked) > 1 else 0)
+
+    def has_consensus(self, field: str) -> bool:
+        return self.margin(field) >= self.consensus_score
+
+    def complete(self) -> bool:
+        # ฟิลด์ที่ไม่จำเป็น (ผู้ผลิต) ไม่ต้องรอ consensus
+        return all(self.has_consensus(field) for field in CONSENSUS_FIELDS)
+
+    def result(self) -> Dict:
+        data = {}
+        sources = {}
+        for field in THAI_FIELDS:
+            ranked = self.ranked(field)
+            if not ranked:
+                data[field] = None
+                sources[field] = {'frames': [], 'score': 0, 'consensus': False}
+                continue
+            winner = ranked[0]
+            data[field] = winner['value']
+            sources[field] = {
+                'frames': winner['frames'],
+                'score': winner['score'],
+                'margin': self.margin(field),
+                'consensus': self.has_consensus(field),
+                'alternatives': len(ranked) - 1
+            }
+
+        return {
+            'data': data,
+            'sources': sources,
+            'frames': list(self.frames),
+            'consensus': self.complete(),
+            'validation': validate_vaccine_data(data),
+            'formatted_output': format_output_thai(data)
+        }
+
+
+def fuse_extractions(extractions: Iterable[Dict], early_stop: bool = True,
+                     consensus_score: float = CONSENSUS_SCORE) -> Dict:
+    # รวมผลของ extract_vaccine_data จากหลายเฟรม หยุดอ่านเฟรมถัดไปเมื่อทุกฟิลด์ได้ consensus แล้ว
+    votes = FieldVotes(consensus_score)
+    for frame, data in enumerate(extractions):
+        votes.add(data, frame)
+        if early_stop and votes.complete():
+            break
+    return votes.result()
+
+
+def scan_frames(frames: List[np.ndarray], top_k: int = FUSION_TOP_FRAMES, mode: str = 'full',
+                refine: bool = REFINE_DEFAULT, rectify: bool = RECTIFY_DEFAULT,
+                merge_metrics: bool = True, early_stop: bool = True,
+                memory_budget: Optional[int] = MEMORY_BUDGET_BYTES) -> Tuple[Dict, List[Tuple[Dict, Dict]]]:
+    # ให้คะแนนทุกเฟรมแบบถูกๆ ก่อน แล้วรัน pipeline เต็มทีละเฟรมจากเฟรมที่ดีที่สุด ไม่เกิน top_k เฟรม
+    # เฟรมที่เหลือไม่ต้อง OCR เมื่อทุกฟิลด์ได้ consensus แล้ว
+    if not frames:
+        raise ValueError('No frames')
+
+    start_time = time.time()
+    quality = frame_quality(frames)
+    selected = select_frames(quality, top_k)
+    scoring_time = time.time() - start_time
+    print(f'เลือก {len(selected)} จาก {len(frames)} เฟรม: {[row["index"] for row in selected]}')
+
+    votes = FieldVotes()
+    outputs = []
+    for row in selected:
+        timer = StageTimer()
+        result, regions = process_sticker(frames[row['index']], mode=mode, refine=refine, timer=timer,
+                                          merge_metrics=merge_metrics, rectify=rectify,
+                                          memory_budget=memory_budget)
+        outputs.append((result, regions))
+        votes.add(result['merged']['data'], row['index'])
+        if early_stop and votes.complete():
+            break
+
+    if len(outputs) < len(selected):
+        print(f'ทุกฟิลด์ได้ consensus หลัง {len(outputs)} เฟรม ไม่ต้อง OCR อีก {len(selected) - len(outputs)} เฟรม')
+
+    summary = {
+        'frames': len(frames),
+        'quality': quality,
+        'selected': [row['index'] for row in selected],
+        'processed': votes.frames,
+        'scoring_time': round(scoring_time, 3),
+        'processing_time': round(time.time() - start_time, 3),
+        'fused': votes.result()
+    }
+    return summary, outputs
+
+
+def load_frames(paths: List[str], max_frames: int = VIDEO_SAMPLE_FRAMES) -> List[np.ndarray]:
+    frames = []
+    for path in paths:
+        if path.lower().endswith(VIDEO_EXTENSIONS):
+            frames.extend(read_video_frames(path, max_frames))
+            continue
+        image = cv2.imread(path)
+        if image is None:
+            print(f'Skip (cannot load): {path}', file=sys.stderr)
+            continue
+        frames.append(image)
+    return frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scan the best frames of a video or burst and fuse the fields')
+    parser.add_argument('inputs', nargs='+', help='A video file or several images of the same sticker')
+    parser.add_argument('--top', type=int, default=FUSION_TOP_FRAMES, help='Frames to run OCR on')
+    parser.add_argument('--max-frames', type=int, default=VIDEO_SAMPLE_FRAMES, help='Frames sampled from a video')
+    parser.add_argument('--mode', choices=PROCESS_MODES, default='full')
+    parser.add_argument('--no-refine', dest='refine', action='store_false', default=REFINE_DEFAULT)
+    parser.add_argument('--no-rectify', dest='rectify', action='store_false', default=RECTIFY_DEFAULT)
+    parser.add_argument('--no-early-stop', dest='early_stop', action='store_false',
+                        help='OCR every selected frame even after all fields agree')
+    args = parser.parse_args(argv)
+
+    frames = load_frames(args.inputs, args.max_frames)
+    if not frames:
+        parser.error('No frames loaded')
+
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        summary, _ = scan_frames(frames, top_k=args.top, mode=args.mode, refine=args.refine,
+                                 rectify=args.rectify, merge_metrics=False, early_stop=args.early_stop)
+
+    summary.pop('quality')
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+from typing import Callable, Dict, Iterable, Optional, Set
+
+
+# ระยะแก้ไขสูงสุดตามความยาวคำ คำสั้นมีโอกาสชนคำอื่นสูงจึงต้องตรงตัว
+DISTANCE_BY_LENGTH = ((8, 2), (5, 1))
+
+
+def allowed_distance(length: int) -> int:
+    for min_length, distance in DISTANCE_BY_LENGTH:
+        if length >= min_length:
+            return distance
+    return 0
+
+
+def deletes(word: str, max_distance: int) -> Set[str]:
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - results
+        results |= frontier
+    return results
+
+
+def build_deletion_index(terms: Iterable[str], max_distance: int = 2) -> Dict:
+    # SymSpell: เก็บทุกคำที่ได้จากการลบตัวอักษรไม่เกิน max_distance ตัว ชี้กลับไปยังคำต้นฉบับ
+    index = {'max_distance': max_distance, 'deletes': {}}
+    for term in set(terms):
+        for variant in deletes(term, max_distance):
+            index['deletes'].setdefault(variant, set()).add(term)
+    return index
+
+
+def bounded_distance(a: str, b: str, max_distance: int) -> int:
+    # Damerau-Levenshtein (optimal string alignment) หยุดทันทีเมื่อทั้งแถวเกิน max_distance
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(row[j - 1] + 1, previous[j] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], previous2[j - 2] + 1)
+        if min(row) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, row
+
+    return previous[-1]
+
+
+def lookup(index: Dict, word: str, max_distance: Optional[int] = None,
+           accept: Optional[Callable[[str, int], bool]] = None) -> Optional[Dict]:
+    # accept(term, distance) กรองคำที่มีเงื่อนไขเพิ่ม เช่น ชื่อผู้ผลิตที่แก้ได้น้อยกว่าคำอื่น
+    if max_distance is None:
+        max_distance = allowed_distance(len(word))
+    max_distance = min(max_distance, index['max_distance'])
+
+    # ลบตัวอักษรจากคำที่ค้นแล้วเทียบกับ index ตรงๆ ไม่ต้องวนทุกคำใน vocabulary
+    best = None
+    checked = set()
+    for variant in deletes(word, max_distance):
+        for term in index['deletes'].get(variant, ()):
+            if term in checked:
+                continue
+            checked.add(term)
+            distance = bounded_distance(word, term, max_distance)
+            if distance > max_distance or (accept is not None and not accept(term, distance)):
+                continue
+            if best is None or (distance, term) < (best['distance'], best['term']):
+                best = {'term': term, 'distance': distance}
+                if distance == 0:
+                    return best
+
+    return best
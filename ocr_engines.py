@@ -1,96 +1,444 @@
 import cv2
+import copy
+import json
+import time
+import threading
+import importlib.util
 import numpy as np
 import pytesseract
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
 
-# EasyOCR
-try:
-    import easyocr
-    EASYOCR_AVAILABLE = True
-    _reader = None
-except ImportError:
-    EASYOCR_AVAILABLE = False
-    _reader = None
+from preprocessing import image_hash, segment_text_lines
+from system_resources import usable_cpu_count
+
+# EasyOCR ดึง torch และ torchvision มาด้วย (หลายวินาที หลายร้อย MB) จึงตรวจแค่ว่าติดตั้งไว้
+# แล้ว import ตอนใช้ครั้งแรกหรือตอน prewarm_engines() เครื่องมือที่ใช้แค่ data_extraction จึงเริ่มได้ทันที
+EASYOCR_AVAILABLE = importlib.util.find_spec('easyocr') is not None
+_reader = None
+# ความแม่นยำที่ reader ตัวที่โหลดอยู่ถูกสร้างมา configure_easyocr(quantize=...) หลังโหลดไม่เปลี่ยนโมเดลที่ใช้จริง
+_reader_quantized = None
+_reader_lock = threading.Lock()
+
+# ตั้งค่า inference บน CPU ของ EasyOCR มีผลตอนโหลด reader ครั้งแรก เปลี่ยนด้วย configure_easyocr()
+# quantize: int8 แบบ dynamic ให้ LSTM/Linear ของ recognizer (ค่าเริ่มต้นของ EasyOCR บน CPU) ปิดเพื่อใช้ fp32
+EASYOCR_QUANTIZE = True
+# channels_last: เก็บ tensor ของ detector (CRAFT ซึ่งเป็น conv ทั้งหมด) แบบ NHWC ให้ oneDNN เลือก kernel ที่เร็วกว่า
+EASYOCR_CHANNELS_LAST = False
+# จำนวน thread ของ torch None = ทุก core ที่ process ใช้ได้ (torch นับ core ทั้งเครื่องแม้อยู่ใน container)
+EASYOCR_THREADS = None
+# layout: ข้ามตัวตรวจจับ CRAFT ใช้กรอบบรรทัดจาก segment_text_lines แล้วส่งให้ recognizer โดยตรง
+# เร็วกว่ามากกับสติกเกอร์รูปแบบปกติ ภาพที่แบ่งบรรทัดไม่ได้กลับไปใช้ตัวตรวจจับเอง
+EASYOCR_LAYOUT = False
+
+
+def configure_easyocr(quantize: Optional[bool] = None, channels_last: Optional[bool] = None,
+                      threads: Optional[int] = None, layout: Optional[bool] = None):
+    global EASYOCR_QUANTIZE, EASYOCR_CHANNELS_LAST, EASYOCR_THREADS, EASYOCR_LAYOUT
+    if _reader is not None and (quantize is not None or channels_last is not None):
+        print('Warning: EasyOCR already loaded, quantize/channels_last apply to the next load only')
+    if quantize is not None:
+        EASYOCR_QUANTIZE = quantize
+    if channels_last is not None:
+        EASYOCR_CHANNELS_LAST = channels_last
+    if threads is not None:
+        EASYOCR_THREADS = threads
+        if _reader is not None:
+            _set_torch_threads()
+    if layout is not None:
+        EASYOCR_LAYOUT = layout
+
+
+def easyocr_options() -> Dict:
+    return {'quantize': EASYOCR_QUANTIZE, 'channels_last': EASYOCR_CHANNELS_LAST,
+            'threads': EASYOCR_THREADS or usable_cpu_count(), 'layout': EASYOCR_LAYOUT}
+
+
+def _set_torch_threads():
+    import torch
+    torch.set_num_threads(EASYOCR_THREADS or usable_cpu_count())
+
+
+def _tune_reader(reader):
+    import torch
+    _set_torch_threads()
+    if EASYOCR_CHANNELS_LAST:
+        detector = reader.detector.to(memory_format=torch.channels_last)
+
+        class ChannelsLast(torch.nn.Module):
+            def __init__(self, module):
+                super().__init__()
+                self.module = module
+
+            def forward(self, x):
+                return self.module(x.contiguous(memory_format=torch.channels_last))
+
+        reader.detector = ChannelsLast(detector).eval()
 
 
 def get_easyocr_reader():
-    global _reader
+    global _reader, _reader_quantized, EASYOCR_AVAILABLE
     if _reader is None and EASYOCR_AVAILABLE:
-        try:
-            _reader = easyocr.Reader(['en'], gpu=False, verbose=False)
-        except Exception as e:
-            print(f'Warning: Could not initialize EasyOCR: {e}')
+        # หลายสติกเกอร์ประมวลผลพร้อมกัน ต้องไม่โหลดโมเดลซ้ำ
+        with _reader_lock:
+            if _reader is None and EASYOCR_AVAILABLE:
+                try:
+                    import easyocr
+                    quantized = EASYOCR_QUANTIZE
+                    reader = easyocr.Reader(['en'], gpu=False, verbose=False, quantize=quantized)
+                    _tune_reader(reader)
+                    _reader_quantized = quantized
+                    _reader = reader
+                except ImportError as e:
+                    # ติดตั้งไว้แต่ import ไม่ได้ (เช่น torch พัง) ไม่ต้องลองใหม่ทุก request
+                    EASYOCR_AVAILABLE = False
+                    print(f'Warning: Could not import EasyOCR: {e}')
+                except Exception as e:
+                    print(f'Warning: Could not initialize EasyOCR: {e}')
     return _reader
 
 
-def ocr_tesseract(image: np.ndarray) -> str:
+def tesseract_ready() -> bool:
     try:
-        config = '--psm 6 --oem 3'
-        text = pytesseract.image_to_string(image, lang='eng', config=config)
-        return text.strip()
+        pytesseract.get_tesseract_version()
+        return True
     except Exception as e:
-        return f'Tesseract Error: {e}'
+        print(f'Warning: Tesseract not available: {e}')
+        return False
 
 
-def ocr_easyocr(image: np.ndarray) -> str:
+TESSERACT_CONFIG = '--psm 6 --oem 3'
+# ค่าที่มีผลต่อผลของ EasyOCR ใช้เป็นส่วนหนึ่งของคีย์แคช
+EASYOCR_CONFIG = 'en detail=1 paragraph=False'
+
+
+def easyocr_config(layout: Optional[bool] = None) -> str:
+    # ผลของโมเดล int8 กับ fp32 และของกรอบจาก layout กับจากตัวตรวจจับต่างกัน ไม่ใช้แคชร่วมกัน
+    # ใช้ความแม่นยำของ reader ที่โหลดอยู่จริง ไม่ใช่ค่าที่ตั้งไว้สำหรับการโหลดครั้งถัดไป
+    layout = EASYOCR_LAYOUT if layout is None else layout
+    quantized = EASYOCR_QUANTIZE if _reader_quantized is None else _reader_quantized
+    return f'{EASYOCR_CONFIG} {"int8" if quantized else "fp32"}{" layout" if layout else ""}'
+
+# แคชผล OCR ตาม (engine, config, hash ของภาพที่ประมวลผลแล้ว) ใช้ร่วมกันทุก strategy ทุก request และ sweep
+OCR_CACHE_MAX_BYTES = 16 * 1024 * 1024
+_ocr_cache = OrderedDict()
+_ocr_cache_bytes = 0
+_ocr_cache_lock = threading.Lock()
+_ocr_cache_stats = {}
+
+
+def _count(engine: str, event: str):
+    stats = _ocr_cache_stats.setdefault(engine, {'hits': 0, 'misses': 0, 'evictions': 0})
+    stats[event] += 1
+
+
+def cached_ocr(engine: str, config: str, image: np.ndarray, read: Callable[[], Dict]):
+    key = (engine, config, image_hash(image))
+    with _ocr_cache_lock:
+        entry = _ocr_cache.get(key)
+        if entry is not None:
+            _ocr_cache.move_to_end(key)
+            _count(engine, 'hits')
+        else:
+            _count(engine, 'misses')
+    if entry is not None:
+        return copy.deepcopy(entry[0])
+
+    # ผิดพลาดให้ exception หลุดออกไป ผลที่ผิดพลาดจะไม่ถูกเก็บ
+    value = read()
+    size = len(json.dumps(value, ensure_ascii=False, default=str)) + 200
+    _ocr_cache_put(key, copy.deepcopy(value), size)
+    return value
+
+
+def _ocr_cache_put(key, value, size: int):
+    global _ocr_cache_bytes
+    with _ocr_cache_lock:
+        if key in _ocr_cache or size > OCR_CACHE_MAX_BYTES:
+            return
+        _ocr_cache[key] = (value, size)
+        _ocr_cache_bytes += size
+        while _ocr_cache_bytes > OCR_CACHE_MAX_BYTES:
+            (engine, _, _), (_, evicted) = _ocr_cache.popitem(last=False)
+            _ocr_cache_bytes -= evicted
+            _count(engine, 'evictions')
+
+
+def clear_ocr_cache():
+    global _ocr_cache_bytes
+    with _ocr_cache_lock:
+        _ocr_cache.clear()
+        _ocr_cache_bytes = 0
+        _ocr_cache_stats.clear()
+
+
+def ocr_cache_stats() -> Dict:
+    with _ocr_cache_lock:
+        engines = {}
+        for engine, stats in sorted(_ocr_cache_stats.items()):
+            lookups = stats['hits'] + stats['misses']
+            engines[engine] = {**stats, 'hit_rate': round(stats['hits'] / lookups, 3) if lookups else None}
+        hits = sum(stats['hits'] for stats in _ocr_cache_stats.values())
+        lookups = hits + sum(stats['misses'] for stats in _ocr_cache_stats.values())
+        return {
+            'entries': len(_ocr_cache),
+            'bytes': _ocr_cache_bytes,
+            'max_bytes': OCR_CACHE_MAX_BYTES,
+            'hit_rate': round(hits / lookups, 3) if lookups else None,
+            'engines': engines
+        }
+
+
+def empty_result(engine: str, text: str = '') -> Dict:
+    return {'engine': engine, 'text': text, 'tokens': [], 'confidence': 0.0, 'time': 0.0}
+
+
+def mean_confidence(tokens: List[Dict]) -> float:
+    if not tokens:
+        return 0.0
+    return round(sum(t['conf'] for t in tokens) / len(tokens), 1)
+
+
+# OCR backend: ชื่อ → ฟังก์ชันอ่านภาพที่คืนผลรูปแบบเดียวกัน (engine text tokens confidence)
+# token แต่ละคำมี text conf (0-100) box [x1, y1, x2, y2] และ line ส่วน time ใส่ให้โดย ocr_result
+# เพิ่ม engine ใหม่ด้วย register_backend โดยไม่ต้องแก้ pipeline app หรือ tuning
+OCR_BACKENDS = {}
+
+
+def register_backend(name: str, read: Callable[[np.ndarray], Dict], label: str, config='',
+                     installed: Optional[Callable[[], bool]] = None,
+                     load: Optional[Callable[[], bool]] = None,
+                     loaded: Optional[Callable[[], bool]] = None,
+                     prewarm: Optional[Callable[[], bool]] = None):
+    # config: ข้อความ (หรือฟังก์ชันที่คืนข้อความ) ที่ใช้ในคีย์แคช
+    # installed: ตรวจแบบไม่โหลดอะไร, load: เตรียม backend ก่อนอ่าน (เรียกทุกครั้ง ต้องเร็วหลังครั้งแรก)
+    OCR_BACKENDS[name] = {
+        'read': read,
+        'label': label,
+        'config': config,
+        'installed': installed or (lambda: True),
+        'load': load,
+        'loaded': loaded,
+        'prewarm': prewarm or load
+    }
+
+
+def backend_names(installed_only: bool = False) -> List[str]:
+    return [name for name, backend in OCR_BACKENDS.items() if not installed_only or backend['installed']()]
+
+
+def ocr_result(engine: str, image: np.ndarray, cache: bool = True) -> Dict:
+    backend = OCR_BACKENDS.get(engine)
+    if backend is None:
+        raise ValueError(f'Unknown engine: {engine}')
+
+    start_time = time.time()
     try:
-        reader = get_easyocr_reader()
-        if reader is None:
-            return 'EasyOCR not available'
-        
-        # อ่านข้อความ
-        results = reader.readtext(image, detail=0, paragraph=True)
-        text = ' '.join(results)
-        return text.strip()
+        if not backend['installed']() or (backend['load'] and not backend['load']()):
+            return empty_result(engine, f'{backend["label"]} not available')
+        if cache:
+            config = backend['config']() if callable(backend['config']) else backend['config']
+            result = cached_ocr(engine, config, image, lambda: backend['read'](image))
+        else:
+            result = backend['read'](image)
     except Exception as e:
-        return f'EasyOCR Error: {e}'
+        return empty_result(engine, f'{backend["label"]} Error: {e}')
+
+    return {**result, 'time': round(time.time() - start_time, 3)}
+
+
+def ocr_text(engine: str, image: np.ndarray) -> str:
+    return ocr_result(engine, image)['text']
+
+
+def engine_status() -> Dict:
+    # ไม่โหลดอะไรเพิ่ม ใช้ได้กับ health check
+    return {
+        name: {
+            'available': backend['installed'](),
+            'loaded': backend['loaded']() if backend['loaded'] else None
+        }
+        for name, backend in OCR_BACKENDS.items()
+    }
+
 
+def prewarm_engines(engines=('tesseract', 'easyocr')) -> Dict:
+    # โหลด backend ล่วงหน้า เช่น ตอนเริ่มเซิร์ฟเวอร์ เพื่อไม่ให้ request แรกรอโหลดโมเดล
+    timings = {}
+    for engine in engines:
+        backend = OCR_BACKENDS.get(engine)
+        if backend is None:
+            raise ValueError(f'Unknown engine: {engine}')
+        start_time = time.perf_counter()
+        ready = backend['installed']() and (backend['prewarm'] is None or bool(backend['prewarm']()))
+        timings[engine] = {'ready': ready, 'seconds': round(time.perf_counter() - start_time, 3)}
+    return timings
 
-def ocr_hybrid(left_image: np.ndarray, right_image: np.ndarray) -> Dict[str, str]:
+
+def ocr_tesseract_result(image: np.ndarray) -> Dict:
+    return ocr_result('tesseract', image)
+
+
+def read_tesseract(image: np.ndarray) -> Dict:
+    # image_to_data ใช้การอ่านรอบเดียวกับ image_to_string แต่คืนตำแหน่งและความมั่นใจของแต่ละคำด้วย
+    data = pytesseract.image_to_data(image, lang='eng', config=TESSERACT_CONFIG,
+                                     output_type=pytesseract.Output.DICT)
+
+    tokens = []
+    lines = []
+    current_line = None
+    for i, word in enumerate(data['text']):
+        word = (word or '').strip()
+        conf = float(data['conf'][i])
+        if not word or conf < 0:
+            continue
+        line = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        x, y = data['left'][i], data['top'][i]
+        tokens.append({
+            'text': word,
+            'conf': conf,
+            'box': [x, y, x + data['width'][i], y + data['height'][i]],
+            'line': list(line)
+        })
+        if line != current_line:
+            lines.append([])
+            current_line = line
+        lines[-1].append(word)
+
+    return {
+        'engine': 'tesseract',
+        'text': '\n'.join(' '.join(words) for words in lines).strip(),
+        'tokens': tokens,
+        'confidence': mean_confidence(tokens)
+    }
+
+
+def ocr_tesseract_text(image: np.ndarray, config: str) -> str:
+    # อ่านเป็นข้อความอย่างเดียวด้วย config อื่น เช่น PSM แบบบรรทัดเดียวตอน refine
+    return cached_ocr('tesseract_text', config, image,
+                      lambda: {'text': pytesseract.image_to_string(image, lang='eng', config=config)})['text']
+
+
+def ocr_easyocr_result(image: np.ndarray) -> Dict:
+    return ocr_result('easyocr', image)
+
+
+def read_easyocr(image: np.ndarray, layout: Optional[bool] = None) -> Dict:
+    # อ่านข้อความพร้อมกรอบและความมั่นใจ (detail=1) ค่าใช้จ่ายเท่ากับ detail=0
+    reader = get_easyocr_reader()
+    boxes = segment_text_lines(image) if (EASYOCR_LAYOUT if layout is None else layout) else []
+    if boxes:
+        results = reader.recognize(image, horizontal_list=boxes, free_list=[], detail=1, paragraph=False)
+    else:
+        results = reader.readtext(image, detail=1, paragraph=False)
+
+    tokens = []
+    for box, text, conf in results:
+        xs = [int(p[0]) for p in box]
+        ys = [int(p[1]) for p in box]
+        tokens.append({
+            'text': text,
+            'conf': round(float(conf) * 100, 1),
+            'box': [min(xs), min(ys), max(xs), max(ys)],
+            'line': None
+        })
+
+    return {
+        'engine': 'easyocr',
+        'text': ' '.join(t['text'] for t in tokens).strip(),
+        'tokens': tokens,
+        'confidence': mean_confidence(tokens),
+        'detector': 'layout' if boxes else 'craft'
+    }
+
+
+def _read_easyocr_layout(image: np.ndarray) -> Dict:
+    return {**read_easyocr(image, layout=True), 'engine': 'easyocr_layout'}
+
+
+def _read_easyocr_onnx(image: np.ndarray) -> Dict:
+    from onnx_recognizer import read_onnx
+    return read_onnx(image)
+
+
+def _onnx_installed() -> bool:
+    from onnx_recognizer import onnx_installed
+    return onnx_installed()
+
+
+def _onnx_load() -> bool:
+    from onnx_recognizer import get_session
+    return get_session() is not None
+
+
+def _onnx_loaded() -> bool:
+    from onnx_recognizer import session_loaded
+    return session_loaded()
+
+
+register_backend('tesseract', read_tesseract, 'Tesseract', TESSERACT_CONFIG, prewarm=tesseract_ready)
+register_backend('easyocr', read_easyocr, 'EasyOCR', easyocr_config,
+                 installed=lambda: EASYOCR_AVAILABLE or _reader is not None,
+                 load=lambda: get_easyocr_reader() is not None,
+                 loaded=lambda: _reader is not None)
+# EasyOCR แบบ layout เสมอ ไม่ขึ้นกับ EASYOCR_LAYOUT ใช้เทียบกับ easyocr ใน benchmark.py --backends
+register_backend('easyocr_layout', _read_easyocr_layout, 'EasyOCR', lambda: easyocr_config(layout=True),
+                 installed=lambda: EASYOCR_AVAILABLE or _reader is not None,
+                 load=lambda: get_easyocr_reader() is not None,
+                 loaded=lambda: _reader is not None)
+# ตัวรู้จำ CRNN ของ EasyOCR ที่ export เป็น ONNX int8 ใช้กรอบคำจากตัวตรวจจับของ EasyOCR (ดู onnx_recognizer.py)
+register_backend('easyocr_onnx', _read_easyocr_onnx, 'EasyOCR ONNX', 'en crnn-int8',
+                 installed=_onnx_installed, load=_onnx_load, loaded=_onnx_loaded)
+
+
+def ocr_tesseract(image: np.ndarray) -> str:
+    return ocr_text('tesseract', image)
+
+
+def ocr_easyocr(image: np.ndarray) -> str:
+    return ocr_text('easyocr', image)
+
+
+def region_results(left_result: Dict, right_result: Dict) -> Dict:
+    return {
+        'left_text': left_result['text'],
+        'right_text': right_result['text'],
+        'left_engine': left_result['engine'],
+        'right_engine': right_result['engine'],
+        'left_result': left_result,
+        'right_result': right_result
+    }
+
+
+def ocr_hybrid(left_image: np.ndarray, right_image: np.ndarray) -> Dict:
     print('\nกำลังประมวลผล OCR แบบรวม...')
     
     # ด้านซ้าย: Tesseract 
     print('Left region → Tesseract...')
-    left_text = ocr_tesseract(left_image)
+    left_result = ocr_tesseract_result(left_image)
     
     # ด้านขวา: EasyOCR
     print('Right region → EasyOCR...')
-    right_text = ocr_easyocr(right_image)
+    right_result = ocr_easyocr_result(right_image)
     
-    return {
-        'left_text': left_text,
-        'right_text': right_text,
-        'left_engine': 'tesseract',
-        'right_engine': 'easyocr'
-    }
+    return region_results(left_result, right_result)
 
 
-def ocr_tesseract_only(left_image: np.ndarray, right_image: np.ndarray) -> Dict[str, str]:
-    print('\nกำลังประมวลผล OCR (Tesseract เท่านั้น)...')
+def ocr_only(engine: str, left_image: np.ndarray, right_image: np.ndarray) -> Dict:
+    print(f'\nกำลังประมวลผล OCR ({OCR_BACKENDS[engine]["label"]} เท่านั้น)...')
     
-    left_text = ocr_tesseract(left_image)
-    right_text = ocr_tesseract(right_image)
+    left_result = ocr_result(engine, left_image)
+    right_result = ocr_result(engine, right_image)
     
-    return {
-        'left_text': left_text,
-        'right_text': right_text,
-        'left_engine': 'tesseract',
-        'right_engine': 'tesseract'
-    }
+    return region_results(left_result, right_result)
 
 
-def ocr_easyocr_only(left_image: np.ndarray, right_image: np.ndarray) -> Dict[str, str]:
-    print('\nกำลังประมวลผล OCR (EasyOCR เท่านั้น)...')
-    
-    left_text = ocr_easyocr(left_image)
-    right_text = ocr_easyocr(right_image)
-    
-    return {
-        'left_text': left_text,
-        'right_text': right_text,
-        'left_engine': 'easyocr',
-        'right_engine': 'easyocr'
-    }
+def ocr_tesseract_only(left_image: np.ndarray, right_image: np.ndarray) -> Dict:
+    return ocr_only('tesseract', left_image, right_image)
+
+
+def ocr_easyocr_only(left_image: np.ndarray, right_image: np.ndarray) -> Dict:
+    return ocr_only('easyocr', left_image, right_image)
 
 
 def clean_ocr_text(text: str) -> str:
@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import math
+import argparse
+import threading
+import importlib.util
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+ONNX_MODEL_PATH = os.path.join(MODELS_DIR, 'easyocr_crnn_int8.onnx')
+# รายชื่อตัวอักษรของ CTC (index 0 = blank) export ไว้คู่กับโมเดล ไม่ต้องโหลด recognizer ของ PyTorch ตอนรัน
+CHARSET_PATH = os.path.join(MODELS_DIR, 'easyocr_crnn.json')
+
+# ความสูงของภาพที่ recognizer ของ EasyOCR (english_g2) รับ
+RECOGNIZER_HEIGHT = 64
+ONNX_OPSET = 13
+# thread ต่อ session ควรเท่ากับ core ที่ใช้ได้ต่อ worker ไม่งั้น thread ของหลาย request จะแย่งกัน
+ONNX_THREADS = 1
+RECOGNIZER_BATCH = 16
+
+_session = None
+_charset = None
+_detector = None
+_lock = threading.Lock()
+
+
+def onnx_installed() -> bool:
+    return importlib.util.find_spec('onnxruntime') is not None and os.path.exists(ONNX_MODEL_PATH)
+
+
+def session_loaded() -> bool:
+    return _session is not None
+
+
+def get_session():
+    global _session, _charset
+    if _session is None and onnx_installed():
+        with _lock:
+            if _session is None:
+                try:
+                    import onnxruntime as ort
+                    options = ort.SessionOptions()
+                    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    options.intra_op_num_threads = ONNX_THREADS
+                    options.inter_op_num_threads = 1
+                    with open(CHARSET_PATH, encoding='utf-8') as f:
+                        _charset = json.load(f)['characters']
+                    _session = ort.InferenceSession(ONNX_MODEL_PATH, options, providers=['CPUExecutionProvider'])
+                except Exception as e:
+                    print(f'Warning: Could not load ONNX recognizer: {e}')
+    return _session
+
+
+def get_detector():
+    # ใช้ตัวตรวจจับ CRAFT ของ EasyOCR เหมือนเดิม ถ้าแอปโหลด reader ไว้แล้วใช้ตัวนั้น ไม่โหลด CRAFT ซ้ำ
+    # ไม่อย่างนั้นโหลดแบบไม่มี recognizer ของ PyTorch
+    from ocr_engines import OCR_BACKENDS, get_easyocr_reader
+
+    if OCR_BACKENDS['easyocr']['loaded']():
+        return get_easyocr_reader()
+
+    global _detector
+    if _detector is None:
+        with _lock:
+            if _detector is None:
+                import easyocr
+                _detector = easyocr.Reader(['en'], gpu=False, recognizer=False, verbose=False)
+    return _detector
+
+
+def _normalize_crop(crop: np.ndarray, width: int) -> np.ndarray:
+    # เหมือน NormalizePAD ของ EasyOCR: ขยายให้สูง 64 คงสัดส่วน แล้วเติมขวาด้วยคอลัมน์สุดท้าย
+    height, crop_width = crop.shape[:2]
+    resized_width = min(width, max(1, math.ceil(RECOGNIZER_HEIGHT * crop_width / height)))
+    resized = cv2.resize(crop, (resized_width, RECOGNIZER_HEIGHT), interpolation=cv2.INTER_CUBIC)
+    padded = np.empty((RECOGNIZER_HEIGHT, width), dtype=np.float32)
+    padded[:, :resized_width] = resized
+    padded[:, resized_width:] = resized[:, -1:]
+    return (padded / 255.0 - 0.5) / 0.5
+
+
+def _ctc_decode(logits: np.ndarray) -> List[Dict]:
+    # greedy CTC: ตัวที่ซ้ำติดกันนับครั้งเดียว ตัด blank (index 0)
+    logits = logits - logits.max(axis=2, keepdims=True)
+    probs = np.exp(logits)
+    probs /= probs.sum(axis=2, keepdims=True)
+    best = probs.argmax(axis=2)
+    best_probs = probs.max(axis=2)
+
+    decoded = []
+    for indexes, scores in zip(best, best_probs):
+        keep = (indexes != 0) & np.concatenate(([True], indexes[1:] != indexes[:-1]))
+        text = ''.join(_charset[i] for i in indexes[keep])
+        kept = scores[keep]
+        # ความมั่นใจแบบเดียวกับ custom_mean ของ EasyOCR
+        conf = float(kept.prod() ** (2.0 / math.sqrt(len(kept)))) if len(kept) else 0.0
+        decoded.append({'text': text, 'conf': conf})
+    return decoded
+
+
+def recognize_crops(crops: List[np.ndarray]) -> List[Dict]:
+    session = get_session()
+    input_name = session.get_inputs()[0].name
+    # เรียงตามความกว้างก่อนแบ่ง batch เพื่อเติมขอบน้อยที่สุด
+    order = sorted(range(len(crops)), key=lambda i: crops[i].shape[1] / crops[i].shape[0])
+    decoded = {}
+    for start in range(0, len(order), RECOGNIZER_BATCH):
+        batch = order[start:start + RECOGNIZER_BATCH]
+        width = max(math.ceil(RECOGNIZER_HEIGHT * crops[i].shape[1] / crops[i].shape[0]) for i in batch)
+        tensor = np.stack([_normalize_crop(crops[i], width) for i in batch])[:, None, :, :]
+        logits = session.run(None, {input_name: tensor.astype(np.float32)})[0]
+        for i, item in zip(batch, _ctc_decode(logits)):
+            decoded[i] = item
+    return [decoded[i] for i in range(len(crops))]
+
+
+def read_onnx(image: np.ndarray) -> Dict:
+    from ocr_engines import mean_confidence
+
+    if len(image.shape) == 3:
+        color, gray = image, cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        color, gray = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR), image
+    horizontal, free = get_detector().detect(color)
+
+    boxes = []
+    for x_min, x_max, y_min, y_max in horizontal[0]:
+        boxes.append([max(0, int(x_min)), max(0, int(y_min)), int(x_max), int(y_max)])
+    for polygon in free[0]:
+        # กรอบเอียงใช้สี่เหลี่ยมที่ครอบไว้
+        xs = [int(p[0]) for p in polygon]
+        ys = [int(p[1]) for p in polygon]
+        boxes.append([max(0, min(xs)), max(0, min(ys)), max(xs), max(ys)])
+
+    crops = []
+    kept_boxes = []
+    for x1, y1, x2, y2 in boxes:
+        crop = gray[y1:y2, x1:x2]
+        if crop.shape[0] >= 2 and crop.shape[1] >= 2:
+            crops.append(crop)
+            kept_boxes.append([x1, y1, x2, y2])
+
+    tokens = []
+    for box, item in zip(kept_boxes, recognize_crops(crops) if crops else []):
+        if item['text'].strip():
+            tokens.append({'text': item['text'], 'conf': round(item['conf'] * 100, 1), 'box': box, 'line': None})
+
+    return {
+        'engine': 'easyocr_onnx',
+        'text': ' '.join(t['text'] for t in tokens).strip(),
+        'tokens': tokens,
+        'confidence': mean_confidence(tokens)
+    }
+
+
+def export_recognizer(output: str = ONNX_MODEL_PATH, quantize: bool = True, opset: int = ONNX_OPSET) -> Dict:
+    # ต้องมี easyocr torch onnx และ onnxruntime ใช้ตอน export ครั้งเดียว ตอนรันใช้แค่ onnxruntime
+    import torch
+    import easyocr
+
+    # reader ของแอปถูก quantize แบบ dynamic int8 ไปแล้ว (EASYOCR_QUANTIZE) ซึ่ง torch.onnx.export ไม่รองรับ
+    # จึงโหลด recognizer fp32 แยก แล้วให้ quantize_dynamic ของ onnxruntime ทำ int8 แทน
+    reader = easyocr.Reader(['en'], gpu=False, quantize=False, detector=False, verbose=False)
+    model = getattr(reader.recognizer, 'module', reader.recognizer).cpu().eval()
+
+    class Recognizer(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, image):
+            # โมเดล CTC ไม่ใช้ text ตอน inference
+            return self.model(image, None)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    float_path = os.path.splitext(output)[0] + '_fp32.onnx' if quantize else output
+    dummy = torch.zeros(1, 1, RECOGNIZER_HEIGHT, 256)
+    with torch.no_grad():
+        torch.onnx.export(Recognizer(model), dummy, float_path, opset_version=opset,
+                          input_names=['image'], output_names=['logits'],
+                          dynamic_axes={'image': {0: 'batch', 3: 'width'}, 'logits': {0: 'batch', 1: 'steps'}})
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        # int8 เฉพาะน้ำหนักของ LSTM/Linear/Conv activation คำนวณตอนรัน ไม่ต้องมีชุดข้อมูล calibrate
+        quantize_dynamic(float_path, output, weight_type=QuantType.QInt8)
+
+    with open(CHARSET_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'characters': list(reader.converter.character), 'height': RECOGNIZER_HEIGHT,
+                   'easyocr': easyocr.__version__}, f, ensure_ascii=False)
+
+    return {
+        'model': output,
+        'bytes': os.path.getsize(output),
+        'float_bytes': os.path.getsize(float_path),
+        'characters': len(reader.converter.character)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the EasyOCR CRNN recogniser to ONNX (int8)')
+    parser.add_argument('--output', default=ONNX_MODEL_PATH)
+    parser.add_argument('--no-quantize', dest='quantize', action='store_false')
+    parser.add_argument('--opset', type=int, default=ONNX_OPSET)
+    args = parser.parse_args(argv)
+
+    try:
+        info = export_recognizer(args.output, quantize=args.quantize, opset=args.opset)
+    except ImportError as e:
+        sys.exit(f'Export needs easyocr, torch, onnx and onnxruntime: {e}')
+    print(json.dumps(info, indent=2))
+
+
+if __name__ == '__main__':
+    main()
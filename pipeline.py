@@ -0,0 +1,757 @@
+import os
+import re
+import time
+import threading
+import tracemalloc
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from preprocessing import (
+    detect_sticker_quads,
+    warp_quad,
+    rectify_sticker,
+    split_image_left_right,
+    preprocess_left_region,
+    preprocess_right_region,
+    preprocess_left_region_with_gray,
+    preprocess_right_region_with_gray
+)
+from ocr_engines import (
+    ocr_tesseract_only,
+    ocr_easyocr_only,
+    ocr_easyocr_result,
+    empty_result,
+    region_results
+)
+from data_extraction import (
+    extract_vaccine_data,
+    validate_vaccine_data,
+    format_output_thai,
+    format_registration_number,
+    THAI_FIELDS
+)
+from refinement import refine_fields
+from scoring import (
+    FIELD_NAMES,
+    score_field_value,
+    calculate_field_level_accuracy,
+    calculate_merge_quality_score
+)
+
+
+# ฟิลด์ที่ดึงจากด้านซ้าย/ขวา ใช้ตัดสินว่าต้อง OCR ด้านไหนซ้ำในโหมด fast
+LEFT_FIELDS = ['vaccine_name', 'product_name', 'manufacturer', 'registration_number']
+RIGHT_FIELDS = ['serial_number', 'mfg_date', 'exp_date']
+
+PROCESS_MODES = ('full', 'fast')
+
+# น้ำหนักของคะแนนรูปแบบเทียบกับความมั่นใจของ engine ตอนรวมผล
+PATTERN_WEIGHT = 0.7
+REFINE_DEFAULT = True
+RECTIFY_DEFAULT = True
+# หน่วยความจำที่ภาพระหว่างทางใช้ต่อ pixel ของภาพเข้า วัดด้วย tracemalloc บนรูปตัวอย่างที่ right_scale=7
+# เปิดหรือปิด refine ใช้เท่ากัน เพราะ refine เก็บไว้แค่ภาพเทาที่มีอยู่แล้วระหว่าง preprocess
+MEMORY_BYTES_PER_PIXEL = 130
+# ภาพที่คาดว่าจะใช้เกินนี้จะถูกย่อก่อนประมวลผล รูปตัวอย่างใช้ราว 60-150 MB รูปมือถือ 12 MP เต็มภาพใช้หลาย GB
+MEMORY_BUDGET_BYTES = 256 * 1024 * 1024
+# Tesseract ทำงานใน subprocess และ EasyOCR ปล่อย GIL ระหว่างคำนวณ จึงใช้ thread ได้
+STICKER_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def current_rss_bytes() -> Optional[int]:
+    # RSS ปัจจุบันจาก /proc รวมหน่วยความจำของ OpenCV และ torch ที่ tracemalloc มองไม่เห็น
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False
+
+
+def _start_tracing():
+    # หลาย request อาจวัดหน่วยความจำพร้อมกัน เปิด tracemalloc ครั้งเดียวและปิดเมื่อไม่มีใครใช้แล้ว
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_owned = True
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+
+
+# tracemalloc และ RSS เป็นค่าของทั้ง process ตัวเลข stage_memory จะถูกต้องเฉพาะตอนที่ไม่มีงานอื่นรันพร้อมกัน
+# run ที่วัดหน่วยความจำจึงต่อคิวกันทีละ run (RLock เพราะ process_stickers เรียก process_sticker ซ้อนใน thread เดียวกัน)
+_memory_run_lock = threading.RLock()
+
+
+@contextmanager
+def exclusive_memory_run(timer: 'StageTimer'):
+    if not timer.track_memory:
+        yield
+        return
+    with _memory_run_lock:
+        yield
+
+
+class StageTimer:
+    # เก็บเวลาที่ใช้ของแต่ละขั้นตอน (วินาที) ขั้นตอนชื่อซ้ำจะถูกรวมกัน
+    # track_memory=True เก็บ peak ที่ Python/numpy จองเพิ่ม (tracemalloc) และ RSS ที่เพิ่มขึ้นของแต่ละขั้นตอนด้วย
+    def __init__(self, track_memory: bool = False):
+        self.stages = {}
+        self.track_memory = track_memory
+        self.memory = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.track_memory:
+            _start_tracing()
+            start_traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            start_rss = current_rss_bytes()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start_time)
+            if self.track_memory:
+                peak = tracemalloc.get_traced_memory()[1] - start_traced
+                end_rss = current_rss_bytes()
+                _stop_tracing()
+                stats = self.memory.setdefault(name, {'peak_bytes': 0, 'rss_delta_bytes': 0})
+                stats['peak_bytes'] = max(stats['peak_bytes'], peak)
+                if start_rss is not None and end_rss is not None:
+                    stats['rss_delta_bytes'] += end_rss - start_rss
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(seconds, 4) for name, seconds in self.stages.items()}
+
+    def memory_dict(self) -> Dict[str, Dict[str, int]]:
+        return {name: dict(stats) for name, stats in self.memory.items()}
+
+
+def create_merge_decision_explanation(tess_data, easy_data, merged_data, sources):
+    decisions = {}
+
+    for field in FIELD_NAMES:
+        tess_val = tess_data.get(field, '')
+        easy_val = easy_data.get(field, '')
+        merged_val = merged_data.get(field, '')
+        source_info = sources.get(field, {})
+
+        source = source_info.get('source', 'unknown')
+        reason = source_info.get('reason', '')
+
+        match = (tess_val == easy_val) if (tess_val and easy_val) else False
+
+        decisions[field] = {
+            'tesseract': tess_val or 'ไม่พบ',
+            'easyocr': easy_val or 'ไม่พบ',
+            'selected': merged_val or 'ไม่พบ',
+            'source': source,
+            'reason': reason,
+            'engines_agree': match
+        }
+
+    return decisions
+
+
+def normalize_token(text: str) -> str:
+    return re.sub(r'[^A-Z0-9]', '', (text or '').upper())
+
+
+def value_confidence(value: Optional[str], tokens: List[Dict]) -> float:
+    # ความมั่นใจเฉลี่ยของคำที่ประกอบเป็นค่านั้น (0-100)
+    target = normalize_token(value)
+    if not target:
+        return 0.0
+
+    confs = []
+    for token in tokens:
+        text = normalize_token(token['text'])
+        if len(text) >= 2 and (text in target or target in text):
+            confs.append(token['conf'])
+
+    return sum(confs) / len(confs) if confs else 0.0
+
+
+def field_tokens(field: str, ocr_results: Optional[Dict], source: str) -> List[Dict]:
+    if not ocr_results:
+        return []
+
+    # Hybrid: ด้านซ้ายจาก Tesseract ด้านขวาจาก EasyOCR
+    engines = {
+        'tesseract': ('tesseract', 'tesseract'),
+        'easyocr': ('easyocr', 'easyocr'),
+        'hybrid': ('tesseract', 'easyocr'),
+    }[source]
+
+    regions = []
+    if field not in RIGHT_FIELDS or field == 'serial_number':
+        regions.append(('left', engines[0]))
+    if field not in LEFT_FIELDS:
+        regions.append(('right', engines[1]))
+
+    tokens = []
+    for region, engine in regions:
+        result = (ocr_results.get(engine) or {}).get(region)
+        if result:
+            tokens.extend(result['tokens'])
+    return tokens
+
+
+def merge_ocr_results(tess_data: dict, easy_data: dict, hybrid_data: dict,
+                      ocr_results: Optional[Dict] = None) -> dict:
+    def choose_by_confidence(key, candidates):
+        # คะแนนรวม = รูปแบบของค่า + ความมั่นใจของ engine, เสมอกันใช้ลำดับ EasyOCR, Hybrid, Tesseract
+        best = None
+        best_combined = None
+        for order, (value, source) in enumerate(candidates):
+            if not value:
+                continue
+            pattern = score_field_value(key, value)
+            confidence = value_confidence(value, field_tokens(key, ocr_results, source))
+            combined = PATTERN_WEIGHT * pattern + (1 - PATTERN_WEIGHT) * confidence
+            # เทียบด้วยคะแนนที่ไม่ปัด ปัดเฉพาะตอนส่งออก ไม่งั้น engine ลำดับหลังชนะได้ทั้งที่คะแนนต่ำกว่าเล็กน้อย
+            if best is None or combined > best_combined:
+                best_combined = combined
+                best = {
+                    'value': value,
+                    'source': source,
+                    'score': round(combined, 1),
+                    'pattern_score': pattern,
+                    'confidence': round(confidence, 1)
+                }
+        return best
+
+    def choose_field(key):
+        e = easy_data.get(key)
+        h = hybrid_data.get(key)
+        t = tess_data.get(key)
+        if key == 'registration_number':
+            candidates = [
+                (format_registration_number(e) if e else None, 'easyocr'),
+                (format_registration_number(h) if h else None, 'hybrid'),
+                (format_registration_number(t) if t else None, 'tesseract'),
+            ]
+            best = choose_by_confidence(key, candidates)
+            if best is None:
+                return None, {'source': 'none', 'reason': 'no-canonical-found'}
+            return best['value'], {**best, 'reason': 'preferred-canonical'}
+        else:
+            if key == 'vaccine_name':
+                def split_components(s):
+                    if not s:
+                        return []
+                    parts = re.split(r'[;\n,]+', s)
+                    return [p.strip() for p in parts if p.strip()]
+
+                t_comps = split_components(t)
+                e_comps = split_components(e)
+                h_comps = split_components(h)
+
+                merged_list = []
+                seen = set()
+                for comp in (t_comps + e_comps + h_comps):
+                    low = comp.lower()
+                    if low not in seen:
+                        merged_list.append(comp)
+                        seen.add(low)
+
+                merged_name = '; '.join(merged_list) if merged_list else (e or h or t)
+
+                src = 'none'
+                reason = 'missing'
+                if t and ('FELINE' in (t or '').upper() or len(t_comps) > len(e_comps)):
+                    src = 'tesseract'
+                    reason = 'preferred-by-content'
+                elif e:
+                    src = 'easyocr'
+                    reason = 'easy-present'
+                elif h:
+                    src = 'hybrid'
+                    reason = 'hybrid-present'
+
+                return merged_name, {'source': src, 'reason': reason}
+
+            best = choose_by_confidence(key, [(e, 'easyocr'), (h, 'hybrid'), (t, 'tesseract')])
+            if best is None:
+                return None, {'source': 'none', 'reason': 'missing'}
+            return best['value'], {**best, 'reason': 'confidence' if ocr_results else 'pattern'}
+
+    merged_fields = {}
+    merged_sources = {}
+    for k in ['vaccine_name', 'product_name', 'manufacturer', 'registration_number', 'serial_number', 'mfg_date', 'exp_date']:
+        val, source_info = choose_field(k)
+        source_info.pop('value', None)
+        merged_fields[k] = val
+        merged_sources[k] = source_info
+
+    return {
+        'data': merged_fields,
+        'sources': merged_sources,
+        'formatted_output': format_output_thai(merged_fields)
+    }
+
+
+def count_detected(data: Dict) -> int:
+    return sum(1 for v in data.values() if v and v != 'ไม่พบ')
+
+
+def strategy_section(results: Dict, data: Dict, validation: Dict) -> Dict:
+    return {
+        'data': data,
+        'validation': validation,
+        'formatted_output': format_output_thai(data),
+        'raw_left': results.get('left_text', ''),
+        'raw_right': results.get('right_text', ''),
+        'confidence': {
+            'left': (results.get('left_result') or {}).get('confidence', 0.0),
+            'right': (results.get('right_result') or {}).get('confidence', 0.0)
+        }
+    }
+
+
+def strategy_metrics(data: Dict, validation: Dict, processing_time: float) -> Dict:
+    detected = count_detected(data)
+    total_fields = len(THAI_FIELDS)
+    return {
+        'fields_detected': detected,
+        'total_fields': total_fields,
+        'accuracy': round((detected / total_fields) * 100, 1),
+        'processing_time': round(processing_time, 2),
+        'is_complete': validation['is_complete']
+    }
+
+
+def run_strategy(label: str, ocr_function, left_processed: np.ndarray, right_processed: np.ndarray,
+                 timer: Optional[StageTimer] = None, stage: str = 'ocr'):
+    timer = timer or StageTimer()
+    print(f'\nกำลังประมวลผลด้วย {label}...')
+    start_time = time.time()
+
+    with timer.stage(stage):
+        results = ocr_function(left_processed, right_processed)
+    with timer.stage('extract'):
+        data = extract_vaccine_data(results['left_text'], results['right_text'])
+        validation = validate_vaccine_data(data)
+
+    elapsed = time.time() - start_time
+    print(f'Time: {elapsed:.2f}s')
+    print(f'Complete: {validation["is_complete"]}')
+
+    return results, data, validation, elapsed
+
+
+def derive_strategy(label: str, left_result: Dict, right_result: Dict,
+                    timer: Optional[StageTimer] = None):
+    timer = timer or StageTimer()
+    # ประกอบผลจากการอ่านที่มีอยู่แล้ว ไม่ต้อง OCR ซ้ำ
+    print(f'\nกำลังประมวลผลด้วย {label} (จากผล OCR เดิม)...')
+    start_time = time.time()
+
+    with timer.stage('extract'):
+        results = region_results(left_result, right_result)
+        data = extract_vaccine_data(results['left_text'], results['right_text'])
+        validation = validate_vaccine_data(data)
+
+    elapsed = left_result['time'] + right_result['time'] + (time.time() - start_time)
+    return results, data, validation, elapsed
+
+
+def collect_ocr_results(**strategies) -> Dict:
+    collected = {}
+    for engine, results in strategies.items():
+        collected[engine] = {
+            region: results[f'{region}_result']
+            for region in ('left', 'right')
+            if results.get(f'{region}_engine') == engine
+        }
+    return collected
+
+
+def add_merge_metrics(response: Dict, tess_data: Dict, easy_data: Dict):
+    # ใช้แสดงผลบนหน้าเว็บเท่านั้น ปิดได้ด้วย merge_metrics=False
+    merged_data = response['merged']['data']
+    merged_sources = response['merged']['sources']
+
+    response['metrics']['field_level_accuracy'] = calculate_field_level_accuracy(tess_data, easy_data, merged_data)
+    response['metrics']['merge_quality'] = calculate_merge_quality_score(tess_data, easy_data, merged_data)
+    response['metrics']['merge_decisions'] = create_merge_decision_explanation(tess_data, easy_data, merged_data, merged_sources)
+
+
+def process_regions(left_processed: np.ndarray, right_processed: np.ndarray,
+                    timer: Optional[StageTimer] = None, merge_metrics: bool = True) -> Dict:
+    timer = timer or StageTimer()
+
+    # ใช้ Tesseract สำหรับทั้งสองข้าง
+    tess_results, tess_data, tess_validation, tess_time = run_strategy(
+        'Tesseract', ocr_tesseract_only, left_processed, right_processed, timer, 'ocr_tesseract')
+
+    # ใช้ EasyOCR สำหรับทั้งสองข้าง
+    easy_results, easy_data, easy_validation, easy_time = run_strategy(
+        'EasyOCR', ocr_easyocr_only, left_processed, right_processed, timer, 'ocr_easyocr')
+
+    # ใช้ Tesseract สำหรับด้านซ้าย, EasyOCR สำหรับด้านขวา
+    hybrid_results, hybrid_data, hybrid_validation, hybrid_time = derive_strategy(
+        'การนำมารวมกัน', tess_results['left_result'], easy_results['right_result'], timer)
+
+    ocr_results = collect_ocr_results(tesseract=tess_results, easyocr=easy_results)
+
+    tess_detected = count_detected(tess_data)
+    easy_detected = count_detected(easy_data)
+    hybrid_detected = count_detected(hybrid_data)
+    total_fields = len(THAI_FIELDS)
+
+    metrics = {
+        'tesseract': strategy_metrics(tess_data, tess_validation, tess_time),
+        'easyocr': strategy_metrics(easy_data, easy_validation, easy_time),
+        'hybrid': {**strategy_metrics(hybrid_data, hybrid_validation, hybrid_time), 'derived': True}
+    }
+
+    # กำหนดว่าอะไรดีที่สุด
+    if hybrid_detected >= max(tess_detected, easy_detected):
+        winner = 'Hybrid'
+    elif easy_detected > tess_detected:
+        winner = 'EasyOCR'
+    else:
+        winner = 'Tesseract'
+
+    metrics['comparison'] = {
+        'winner': winner,
+        'recommendation': 'Hybrid (Tesseract + EasyOCR)' if winner == 'Hybrid' else f'{winner}'
+    }
+
+    # พิมพ์สรุปผลลัพธ์
+    print(f'\n{"="*60}')
+    print('RESULTS SUMMARY')
+    print(f'{"="*60}')
+    print(f'Tesseract:  {tess_detected}/{total_fields} fields ({metrics["tesseract"]["accuracy"]}%)')
+    print(f'EasyOCR:    {easy_detected}/{total_fields} fields ({metrics["easyocr"]["accuracy"]}%)')
+    print(f'Hybrid:     {hybrid_detected}/{total_fields} fields ({metrics["hybrid"]["accuracy"]}%)')
+    print(f'Winner:     {winner}')
+    print(f'{"="*60}\n')
+
+    with timer.stage('merge'):
+        merged = merge_ocr_results(tess_data, easy_data, hybrid_data, ocr_results)
+
+    response = {
+        'mode': 'full',
+        'tesseract': strategy_section(tess_results, tess_data, tess_validation),
+        'easyocr': strategy_section(easy_results, easy_data, easy_validation),
+        'hybrid': strategy_section(hybrid_results, hybrid_data, hybrid_validation),
+        'merged': merged,
+        'ocr': ocr_results,
+        'metrics': metrics
+    }
+    if merge_metrics:
+        add_merge_metrics(response, tess_data, easy_data)
+
+    return response
+
+
+def weak_fields(data: Dict, validation: Dict) -> List[str]:
+    weak = [field for field in FIELD_NAMES if score_field_value(field, data.get(field)) < 100]
+    if not validation['has_vaccine_name']:
+        weak.append('vaccine_name')
+    if not validation['has_serial']:
+        weak.append('serial_number')
+    if not validation['has_dates']:
+        weak.extend(['mfg_date', 'exp_date'])
+    return sorted(set(weak), key=lambda f: (LEFT_FIELDS + RIGHT_FIELDS).index(f))
+
+
+def apply_cascade_valid(merged: Dict, tess_data: Dict, weak: List[str],
+                        ocr_results: Optional[Dict] = None) -> Dict:
+    # ฟิลด์ที่ Tesseract ได้คะแนนเต็มแล้วให้ใช้ค่าของ Tesseract
+    # ผ่าน merge แบบมีแค่ Tesseract เพื่อให้ค่าถูกจัดรูปแบบและมีคะแนนเหมือนฟิลด์อื่น เปลี่ยนแค่ reason
+    tess_only = None
+    for field, value in tess_data.items():
+        if not value or field in weak:
+            continue
+        if merged['sources'][field].get('source') != 'tesseract':
+            tess_only = tess_only or merge_ocr_results(tess_data, {}, {}, ocr_results)
+            merged['data'][field] = tess_only['data'][field]
+            merged['sources'][field] = tess_only['sources'][field]
+        merged['sources'][field]['reason'] = 'cascade-valid'
+    merged['formatted_output'] = format_output_thai(merged['data'])
+    return merged
+
+
+def process_regions_fast(left_processed: np.ndarray, right_processed: np.ndarray,
+                         timer: Optional[StageTimer] = None, merge_metrics: bool = True) -> Dict:
+    timer = timer or StageTimer()
+
+    # Tesseract ก่อน แล้วเรียก EasyOCR เฉพาะด้านที่มีฟิลด์ไม่ผ่าน
+    tess_results, tess_data, tess_validation, tess_time = run_strategy(
+        'Tesseract', ocr_tesseract_only, left_processed, right_processed, timer, 'ocr_tesseract')
+
+    weak = weak_fields(tess_data, tess_validation)
+    rerun_left = any(field in LEFT_FIELDS for field in weak)
+    rerun_right = any(field in RIGHT_FIELDS for field in weak)
+
+    stages = {
+        'tesseract_left': 'run',
+        'tesseract_right': 'run',
+        'easyocr_left': 'run' if rerun_left else 'skipped',
+        'easyocr_right': 'run' if rerun_right else 'skipped',
+        'hybrid': 'derived' if rerun_right else 'skipped',
+    }
+    print(f'Weak fields: {weak or "-"}')
+    print(f'EasyOCR: left={stages["easyocr_left"]}, right={stages["easyocr_right"]}')
+
+    start_time = time.time()
+    with timer.stage('ocr_easyocr'):
+        easy_results = region_results(
+            ocr_easyocr_result(left_processed) if rerun_left else empty_result(None),
+            ocr_easyocr_result(right_processed) if rerun_right else empty_result(None)
+        )
+    easy_time = time.time() - start_time
+
+    metrics = {'tesseract': strategy_metrics(tess_data, tess_validation, tess_time)}
+    response = {
+        'mode': 'fast',
+        'tesseract': strategy_section(tess_results, tess_data, tess_validation),
+    }
+
+    if rerun_left or rerun_right:
+        with timer.stage('extract'):
+            easy_data = extract_vaccine_data(easy_results['left_text'], easy_results['right_text'])
+            easy_validation = validate_vaccine_data(easy_data)
+        response['easyocr'] = strategy_section(easy_results, easy_data, easy_validation)
+        metrics['easyocr'] = strategy_metrics(easy_data, easy_validation, easy_time)
+    else:
+        easy_data = {}
+        response['easyocr'] = {'skipped': True, 'data': {}}
+        metrics['easyocr'] = {'skipped': True, 'processing_time': 0}
+
+    if rerun_right:
+        hybrid_results, hybrid_data, hybrid_validation, hybrid_time = derive_strategy(
+            'การนำมารวมกัน', tess_results['left_result'], easy_results['right_result'], timer)
+        response['hybrid'] = strategy_section(hybrid_results, hybrid_data, hybrid_validation)
+        metrics['hybrid'] = {**strategy_metrics(hybrid_data, hybrid_validation, hybrid_time), 'derived': True}
+    else:
+        hybrid_data = {}
+        response['hybrid'] = {'skipped': True, 'data': {}}
+        metrics['hybrid'] = {'skipped': True, 'processing_time': 0}
+
+    ocr_results = collect_ocr_results(tesseract=tess_results, easyocr=easy_results)
+    with timer.stage('merge'):
+        merged = merge_ocr_results(tess_data, easy_data, hybrid_data, ocr_results)
+        apply_cascade_valid(merged, tess_data, weak, ocr_results)
+
+    response['merged'] = merged
+    response['ocr'] = ocr_results
+    response['stages'] = stages
+    response['skipped_stages'] = [name for name, state in stages.items() if state == 'skipped']
+    response['weak_fields'] = weak
+    response['metrics'] = metrics
+    if merge_metrics:
+        add_merge_metrics(response, tess_data, easy_data)
+
+    return response
+
+
+def apply_refinement(response: Dict, left: np.ndarray, right: np.ndarray,
+                     left_processed: np.ndarray, right_processed: np.ndarray,
+                     left_scale: int = 2, right_scale: int = 7,
+                     timer: Optional[StageTimer] = None,
+                     grays: Optional[Dict[str, np.ndarray]] = None) -> Dict:
+    timer = timer or StageTimer()
+    # OCR ซ้ำเฉพาะบรรทัดของฟิลด์ที่หายหรือคะแนนต่ำ แทนการรันทั้ง pipeline ใหม่
+    print('\nกำลัง refine ฟิลด์ที่คะแนนต่ำ...')
+    start_time = time.time()
+
+    merged = response['merged']
+    tess_ocr = response.get('ocr', {}).get('tesseract', {})
+    with timer.stage('refine'):
+        refinement = refine_fields(merged['data'], left, right, left_processed, right_processed,
+                                   left_scale=left_scale, right_scale=right_scale,
+                                   tokens={region: result['tokens'] for region, result in tess_ocr.items()},
+                                   grays=grays, easyocr=response.get('mode') == 'full')
+
+    for field in refinement['updated']:
+        merged['data'][field] = refinement['data'][field]
+        merged['sources'][field] = {'source': 'refined', 'reason': refinement['fields'][field]['variant']}
+
+    if refinement['updated']:
+        merged['formatted_output'] = format_output_thai(merged['data'])
+    if refinement['updated'] and 'merge_decisions' in response['metrics']:
+        add_merge_metrics(response, response['tesseract']['data'], response['easyocr']['data'])
+
+    response['refinement'] = {
+        'fields': refinement['fields'],
+        'updated': refinement['updated'],
+        'processing_time': round(time.time() - start_time, 2)
+    }
+
+    return response
+
+
+def estimate_memory_bytes(image: np.ndarray, right_scale: int = 7) -> int:
+    # ภาพด้านขวาที่ขยาย right_scale เท่าและภาพระหว่างทางของมันกินหน่วยความจำส่วนใหญ่
+    height, width = image.shape[:2]
+    return int(height * width * MEMORY_BYTES_PER_PIXEL * (right_scale / 7) ** 2)
+
+
+def process_sticker(image: np.ndarray, mode: str = 'full', refine: bool = REFINE_DEFAULT,
+                    timer: Optional[StageTimer] = None,
+                    left_scale: int = 2, right_scale: int = 7,
+                    merge_metrics: bool = True,
+                    rectify: bool = RECTIFY_DEFAULT,
+                    memory_budget: Optional[int] = MEMORY_BUDGET_BYTES) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    # pipeline เต็มสำหรับสติกเกอร์หนึ่งใบ: หาสติกเกอร์ → แบ่ง → ประมวลผลภาพ → OCR → ดึงข้อมูล → รวมผล → refine
+    if mode not in PROCESS_MODES:
+        raise ValueError(f'Unknown mode: {mode}')
+    timer = timer or StageTimer()
+    with exclusive_memory_run(timer):
+        return _process_sticker(image, mode, refine, timer, left_scale, right_scale,
+                                merge_metrics, rectify, memory_budget)
+
+
+def _process_sticker(image: np.ndarray, mode: str, refine: bool, timer: StageTimer,
+                     left_scale: int, right_scale: int, merge_metrics: bool, rectify: bool,
+                     memory_budget: Optional[int]) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    # ตัดพื้นหลังและแก้มุมเอียงก่อน ขั้นตอนหลังจากนี้ทำงานกับภาพสติกเกอร์ขนาดมาตรฐาน
+    rectification = {'applied': False, 'reason': 'disabled'}
+    if rectify:
+        with timer.stage('rectify'):
+            image, rectification = rectify_sticker(image)
+
+    # ภาพใหญ่เกินงบหน่วยความจำ ย่อลงก่อน แทนที่จะขยาย 7 เท่าทั้งภาพ
+    memory_fallback = None
+    estimated = estimate_memory_bytes(image, right_scale)
+    if memory_budget and estimated > memory_budget:
+        factor = (memory_budget / estimated) ** 0.5
+        print(f'ภาพใช้หน่วยความจำประมาณ {estimated / 1024 / 1024:.0f} MB เกินงบ ย่อเหลือ {factor:.2f} เท่า')
+        with timer.stage('downscale'):
+            image = cv2.resize(image, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+        memory_fallback = {
+            'estimated_bytes': estimated,
+            'budget_bytes': memory_budget,
+            'scale': round(factor, 3),
+            'size': list(image.shape[:2])
+        }
+
+    # แบ่งรูปภาพ
+    print('กำลังแบ่งรูปภาพ...')
+    with timer.stage('split'):
+        left, right = split_image_left_right(image)
+
+    # ประมวลผล
+    print('กำลังประมวลผล...')
+    # refine ตัดบรรทัดจากภาพเทาก่อน threshold เก็บไว้เฉพาะภาพนั้น ไม่ใส่ภาพระหว่างทางทุกขั้นลงแคช
+    grays = {}
+    with timer.stage('preprocess_left'):
+        if refine:
+            left_processed, grays['left'] = preprocess_left_region_with_gray(left, scale=left_scale)
+        else:
+            left_processed = preprocess_left_region(left, scale=left_scale)
+    with timer.stage('preprocess_right'):
+        if refine:
+            right_processed, grays['right'] = preprocess_right_region_with_gray(right, scale=right_scale)
+        else:
+            right_processed = preprocess_right_region(right, scale=right_scale)
+
+    if mode == 'fast':
+        result = process_regions_fast(left_processed, right_processed, timer, merge_metrics)
+    else:
+        result = process_regions(left_processed, right_processed, timer, merge_metrics)
+
+    if refine:
+        apply_refinement(result, left, right, left_processed, right_processed,
+                         left_scale=left_scale, right_scale=right_scale, timer=timer, grays=grays)
+
+    result['metrics']['rectification'] = rectification
+    result['metrics']['stage_times'] = timer.as_dict()
+    if memory_fallback:
+        result['metrics']['memory_fallback'] = memory_fallback
+    if timer.track_memory:
+        result['metrics']['stage_memory'] = timer.memory_dict()
+
+    regions = {
+        'sticker': image,
+        'left': left,
+        'right': right,
+        'left_processed': left_processed,
+        'right_processed': right_processed
+    }
+    return result, regions
+
+
+def crop_quad_bounds(image: np.ndarray, quad: np.ndarray) -> np.ndarray:
+    x, y, w, h = cv2.boundingRect(np.round(quad).astype(np.int32))
+    return image[max(0, y):y + h, max(0, x):x + w]
+
+
+def process_stickers(image: np.ndarray, mode: str = 'full', refine: bool = REFINE_DEFAULT,
+                     timer: Optional[StageTimer] = None, merge_metrics: bool = True,
+                     rectify: bool = RECTIFY_DEFAULT, max_workers: int = STICKER_WORKERS,
+                     memory_budget: Optional[int] = MEMORY_BUDGET_BYTES) -> List[Tuple[Dict, Dict[str, np.ndarray]]]:
+    # ภาพเดียวหลายขวด: หาสติกเกอร์ทุกใบ แล้วรัน pipeline ของแต่ละใบพร้อมกัน
+    if mode not in PROCESS_MODES:
+        raise ValueError(f'Unknown mode: {mode}')
+    timer = timer or StageTimer()
+    with exclusive_memory_run(timer):
+        return _process_stickers(image, mode, refine, timer, merge_metrics, rectify, max_workers, memory_budget)
+
+
+def _process_stickers(image: np.ndarray, mode: str, refine: bool, timer: StageTimer, merge_metrics: bool,
+                      rectify: bool, max_workers: int, memory_budget: Optional[int]) -> List[Tuple[Dict, Dict[str, np.ndarray]]]:
+    print('กำลังหาสติกเกอร์...')
+    with timer.stage('detect_stickers'):
+        quads = detect_sticker_quads(image)
+
+    # เจอใบเดียวหรือไม่เจอเลย ใช้ pipeline ปกติเพื่อให้ผลเหมือนการสแกนทีละใบ
+    if len(quads) <= 1:
+        return [process_sticker(image, mode=mode, refine=refine, timer=timer, merge_metrics=merge_metrics,
+                                rectify=rectify, memory_budget=memory_budget)]
+
+    print(f'พบสติกเกอร์ {len(quads)} ใบ')
+    if rectify:
+        with timer.stage('rectify'):
+            crops = [warp_quad(image, quad) for quad, _ in quads]
+    else:
+        # ไม่แก้มุมเอียง ตัดแค่กรอบสี่เหลี่ยมที่ครอบสติกเกอร์แต่ละใบ
+        with timer.stage('crop_stickers'):
+            crops = [crop_quad_bounds(image, quad) for quad, _ in quads]
+
+    def run(crop):
+        return process_sticker(crop, mode=mode, refine=refine, timer=StageTimer(timer.track_memory),
+                               merge_metrics=merge_metrics, rectify=False, memory_budget=memory_budget)
+
+    if timer.track_memory:
+        # วัดหน่วยความจำ: รันทีละใบใน thread นี้ ไม่ให้ peak ของสติกเกอร์แต่ละใบปนกัน
+        outputs = [run(crop) for crop in crops]
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(crops)))) as executor:
+            outputs = list(executor.map(run, crops))
+
+    detect_times = timer.as_dict()
+    for (result, _), (quad, coverage) in zip(outputs, quads):
+        result['metrics']['rectification'] = {
+            'applied': rectify,
+            'coverage': round(coverage, 3),
+            'quad': quad.round(1).tolist()
+        }
+        if not rectify:
+            result['metrics']['rectification']['reason'] = 'disabled'
+        result['metrics']['stage_times'] = {**detect_times, **result['metrics']['stage_times']}
+        if timer.track_memory:
+            result['metrics']['stage_memory'] = {**timer.memory_dict(), **result['metrics']['stage_memory']}
+
+    return outputs
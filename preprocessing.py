@@ -1,6 +1,9 @@
 import cv2
+import hashlib
+import threading
 import numpy as np
-from typing import Tuple
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 
 def detect_split_point(image: np.ndarray) -> int:
@@ -40,134 +43,663 @@ def split_image_left_right(image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     return image[:, :split_x], image[:, split_x:]
 
 
-def rotate_90(image: np.ndarray) -> np.ndarray:
-    return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+# หาขอบสติกเกอร์บนภาพย่อ แล้ว warp เป็นภาพตรงขนาดมาตรฐานก่อนแบ่งซ้าย/ขวา
+RECTIFY_MAX_SIDE = 480
+# สติกเกอร์กินพื้นที่เกือบทั้งภาพอยู่แล้ว หรือเล็กจนน่าจะหาผิด ไม่ต้อง warp
+RECTIFY_MAX_COVERAGE = 0.9
+RECTIFY_MIN_COVERAGE = 0.2
+# ขยายกรอบออกจากจุดกึ่งกลาง กันตัดขอบตัวอักษรที่อยู่ชิดขอบสติกเกอร์
+RECTIFY_MARGIN = 0.03
+STICKER_WIDTH = 800
+
+# หลายขวดในภาพเดียว: ช่องว่างระหว่างสติกเกอร์ (สัดส่วนของด้านสั้นของภาพ) และขนาดขั้นต่ำเทียบกับใบใหญ่สุด
+MAX_STICKERS = 4
+STICKER_GAP = 0.1
+STICKER_MIN_RELATIVE_AREA = 0.3
 
 
-def preprocess_left_region(image: np.ndarray, scale: int = 2) -> np.ndarray:
+def order_quad(points: np.ndarray) -> np.ndarray:
+    # เรียงมุมเป็น บนซ้าย บนขวา ล่างขวา ล่างซ้าย
+    points = points.reshape(4, 2).astype(np.float32)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([
+        points[np.argmin(sums)],
+        points[np.argmin(diffs)],
+        points[np.argmax(sums)],
+        points[np.argmax(diffs)]
+    ], dtype=np.float32)
+
+
+def _content_blobs(image: np.ndarray, max_side: int) -> Tuple[List[np.ndarray], np.ndarray, float]:
     height, width = image.shape[:2]
-    scaled = cv2.resize(image, (width*scale, height*scale), 
-                       interpolation=cv2.INTER_CUBIC)
-    
-    gray = cv2.cvtColor(scaled, cv2.COLOR_BGR2GRAY) if len(scaled.shape) == 3 else scaled
-    
-    # เพิ่มความคมชัด
-    kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-    sharpened = cv2.filter2D(gray, -1, kernel)
-    
-    # เพิ่มประสิทธิภาพ
-    enhanced = cv2.convertScaleAbs(sharpened, alpha=1.2, beta=10)
-    
-    # การปรับค่าเกณฑ์
-    _, binary = cv2.threshold(enhanced, 128, 255, cv2.THRESH_BINARY)
-    
-    # Denoise
-    denoised = cv2.medianBlur(binary, 3)
-    
-    return denoised
+    scale = min(1.0, max_side / max(height, width))
+    small = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    small_h, small_w = small.shape[:2]
+
+    # ขอบสติกเกอร์สีขาวบนพื้นสีครีมแทบไม่ต่างกันใน L จึงหา edge จากทุกช่องของ Lab
+    lab = cv2.cvtColor(small, cv2.COLOR_BGR2LAB) if len(small.shape) == 3 else small[:, :, None]
+    edges = np.zeros((small_h, small_w), np.uint8)
+    for channel in cv2.split(lab):
+        channel = cv2.normalize(channel, None, 0, 255, cv2.NORM_MINMAX)
+        edges |= cv2.Canny(cv2.GaussianBlur(channel, (5, 5), 0), 30, 90)
+
+    # ปิดช่องว่างระหว่างตัวอักษรให้เป็นก้อน แล้ว open ด้วย kernel ใหญ่กว่าเพื่อลบเส้นบางๆ ของพื้นหลัง
+    k = max(3, int(min(small_h, small_w) * 0.04)) | 1
+    blob = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, np.ones((k, k), np.uint8))
+    contours, _ = cv2.findContours(blob, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    blob = np.zeros_like(blob)
+    cv2.drawContours(blob, contours, -1, 255, cv2.FILLED)
+    blob = cv2.morphologyEx(blob, cv2.MORPH_OPEN, np.ones((k * 2 + 1, k * 2 + 1), np.uint8))
+
+    contours, _ = cv2.findContours(blob, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = [c for c in contours if cv2.contourArea(c) > 0.01 * small_h * small_w]
+    return contours, blob, scale
+
+
+def _hull_quad(hull: np.ndarray) -> np.ndarray:
+    approx = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True)
+    # ใช้ 4 มุมจริงเมื่อครอบคลุมเนื้อหาทั้งหมด ไม่อย่างนั้นใช้สี่เหลี่ยมหมุนที่เล็กที่สุด
+    if len(approx) == 4 and cv2.contourArea(approx) >= 0.98 * cv2.contourArea(hull):
+        quad = approx.reshape(4, 2).astype(np.float32)
+    else:
+        quad = cv2.boxPoints(cv2.minAreaRect(hull))
+
+    center = quad.mean(axis=0)
+    return center + (quad - center) * (1 + 2 * RECTIFY_MARGIN)
+
+
+def detect_sticker_quad(image: np.ndarray, max_side: int = RECTIFY_MAX_SIDE) -> Optional[Tuple[np.ndarray, float]]:
+    contours, blob, scale = _content_blobs(image, max_side)
+    if not contours:
+        return None
+
+    # ก้อนข้อความทั้งหมดถือเป็นสติกเกอร์ใบเดียว
+    quad = _hull_quad(cv2.convexHull(np.vstack(contours)))
+    coverage = cv2.contourArea(quad) / blob.size
+    return order_quad(quad / scale), float(coverage)
+
+
+def _widest_gap(occupied: np.ndarray) -> Tuple[int, int]:
+    # ช่วงว่างที่กว้างที่สุดระหว่างส่วนที่มีเนื้อหา (ไม่นับขอบนอก)
+    filled = np.flatnonzero(occupied)
+    if len(filled) < 2:
+        return 0, 0
+    steps = np.diff(filled)
+    i = int(np.argmax(steps))
+    return int(filled[i] + 1), int(filled[i + 1])
+
+
+def _xy_cut(mask: np.ndarray, x0: int, y0: int, regions: List[Tuple[int, int, int, int]]):
+    # แบ่งพื้นที่ตามแถว/คอลัมน์ที่ว่างทั้งแถว ถ้าช่องว่างกว้างพอเมื่อเทียบกับขนาดของทั้งสองส่วน
+    ys, xs = np.nonzero(mask)
+    if len(xs) == 0:
+        return
+    mask = mask[ys.min():ys.max() + 1, xs.min():xs.max() + 1]
+    x0, y0 = x0 + int(xs.min()), y0 + int(ys.min())
+
+    best = None
+    for axis in (0, 1):
+        start, end = _widest_gap(mask.any(axis=axis))
+        extent = mask.shape[1 - axis]
+        gap = end - start
+        # ขนาดสติกเกอร์โดยประมาณ: ด้านที่ตั้งฉากกับรอยตัด แต่ไม่เกินส่วนที่ใหญ่กว่าหลังตัด
+        size = min(mask.shape[axis], max(start, extent - end))
+        if gap <= 0 or gap < STICKER_GAP * size:
+            continue
+        if best is None or gap > best[0]:
+            best = (gap, axis, start, end)
+
+    if best is None:
+        regions.append((x0, y0, mask.shape[1], mask.shape[0]))
+        return
+
+    _, axis, start, end = best
+    if axis == 0:
+        _xy_cut(mask[:, :start], x0, y0, regions)
+        _xy_cut(mask[:, end:], x0 + end, y0, regions)
+    else:
+        _xy_cut(mask[:start], x0, y0, regions)
+        _xy_cut(mask[end:], x0, y0 + end, regions)
+
+
+def detect_sticker_quads(image: np.ndarray, max_stickers: int = MAX_STICKERS,
+                         max_side: int = RECTIFY_MAX_SIDE) -> List[Tuple[np.ndarray, float]]:
+    contours, blob, scale = _content_blobs(image, max_side)
+    if not contours:
+        return []
+
+    # ข้อความกับแถบสีในสติกเกอร์ใบเดียวกันห่างกันไม่กี่ pixel ส่วนขวดที่วางเรียงกันมีพื้นหลังคั่นกว้างกว่า
+    mask = np.zeros_like(blob)
+    cv2.drawContours(mask, contours, -1, 255, cv2.FILLED)
+    regions = []
+    _xy_cut(mask, 0, 0, regions)
+
+    quads = []
+    for x, y, w, h in regions:
+        points = cv2.findNonZero(mask[y:y + h, x:x + w]) + np.array([x, y], dtype=np.int32)
+        quad = _hull_quad(cv2.convexHull(points))
+        quads.append((quad, cv2.contourArea(quad)))
+
+    # ก้อนที่เล็กกว่าใบใหญ่สุดมากมักเป็นฉลากอื่นหรือเงา ไม่ใช่สติกเกอร์วัคซีน
+    largest = max(area for _, area in quads)
+    quads = [(quad, area) for quad, area in quads if area >= STICKER_MIN_RELATIVE_AREA * largest]
+    quads = sorted(quads, key=lambda item: item[1], reverse=True)[:max_stickers]
+
+    # เรียงตามลำดับการอ่าน บนลงล่าง ซ้ายไปขวา
+    row_height = min(blob.shape) * 0.1
+    quads.sort(key=lambda item: (round(item[0][:, 1].min() / row_height), item[0][:, 0].min()))
+
+    return [(order_quad(quad / scale), float(area / blob.size)) for quad, area in quads]
+
+
+def warp_quad(image: np.ndarray, quad: np.ndarray, width: int = STICKER_WIDTH) -> np.ndarray:
+    top_left, top_right, bottom_right, bottom_left = quad
+    quad_width = max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left))
+    quad_height = max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right))
+    height = max(1, int(round(width * quad_height / quad_width)))
+
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(quad, target)
+    return cv2.warpPerspective(image, matrix, (width, height), flags=cv2.INTER_CUBIC,
+                               borderMode=cv2.BORDER_REPLICATE)
+
+
+def rectify_sticker(image: np.ndarray, width: int = STICKER_WIDTH) -> Tuple[np.ndarray, Dict]:
+    detected = detect_sticker_quad(image)
+    if detected is None:
+        return image, {'applied': False, 'reason': 'not_found'}
+
+    quad, coverage = detected
+    info = {'applied': False, 'coverage': round(coverage, 3)}
+    if coverage > RECTIFY_MAX_COVERAGE:
+        info['reason'] = 'full_frame'
+        return image, info
+    if coverage < RECTIFY_MIN_COVERAGE:
+        info['reason'] = 'too_small'
+        return image, info
+
+    warped = warp_quad(image, quad, width)
+    info.update({'applied': True, 'quad': quad.round(1).tolist(), 'size': list(warped.shape[:2])})
+    return warped, info
+
+
+# คุณภาพของเฟรมจากวิดีโอ วัดบนภาพย่อ ถูกกว่า OCR หลายร้อยเท่า
+FRAME_QUALITY_MAX_SIDE = 480
+# กระดาษขาวของสติกเกอร์อยู่ราว 205-225 pixel ที่ 250 ขึ้นไปถือว่าเป็นแสงสะท้อน
+GLARE_THRESHOLD = 250
+
+
+def _quality_gray(image: np.ndarray, max_side: int) -> np.ndarray:
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    scale = min(1.0, max_side / max(gray.shape[:2]))
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray
 
 
-def preprocess_right_region(image: np.ndarray, scale: int = 7) -> np.ndarray:
+def sharpness_score(image: np.ndarray, max_side: int = FRAME_QUALITY_MAX_SIDE) -> float:
+    # variance ของ Laplacian ภาพเบลอหรือสั่นมีขอบน้อย ค่าจะต่ำ
+    return float(cv2.Laplacian(_quality_gray(image, max_side), cv2.CV_64F).var())
+
+
+def glare_fraction(image: np.ndarray, max_side: int = FRAME_QUALITY_MAX_SIDE) -> float:
+    return float((_quality_gray(image, max_side) >= GLARE_THRESHOLD).mean())
+
+
+# แบ่งบรรทัดจาก connected component ใช้แทนตัวตรวจจับ CRAFT ของ EasyOCR กับสติกเกอร์ที่วางตัวอักษรเป็นแถว
+# ตัวอักษรคือ component ที่สูงไม่ต่างจากความสูงตัวอักษรโดยประมาณเกินช่วงนี้
+# ตัดจุดรบกวน เส้นขอบ ตัวเลขขนาดใหญ่ และข้อความแนวตั้งออก
+LAYOUT_GLYPH_HEIGHT = (0.5, 3.0)
+# component ที่เล็กกว่าสัดส่วนนี้ของพื้นที่ภาพคือจุดรบกวน ภาพด้านขวาขยาย 7 เท่าจึงใช้ค่าคงที่เป็น pixel ไม่ได้
+LAYOUT_MIN_GLYPH_AREA = 1e-4
+# เส้นที่บางกว่าสัดส่วนนี้ของความสูงตัวอักษรคือลายพื้นหลัง ไม่ใช่ตัวอักษร
+LAYOUT_STROKE = 0.08
+# ตัวอักษรถัดไปในบรรทัดเดียวกัน: ห่างไม่เกินกี่เท่าของความสูง และจุดกึ่งกลางต่างกันไม่เกินกี่เท่าของความสูง
+LAYOUT_WORD_GAP = 1.5
+LAYOUT_LINE_OFFSET = 0.4
+# กล่องที่สูงใกล้กันและซ้อนกันแนวตั้งเกินสัดส่วนนี้ถือว่าอยู่แถวเดียวกัน
+LAYOUT_ROW_OVERLAP = 0.7
+# ขยายกล่องออกกี่เท่าของความสูงบรรทัด ให้ส่วนหัว/หางของตัวอักษรไม่ถูกตัด
+LAYOUT_PAD = 0.25
+# แบ่งได้มากกว่านี้แปลว่าไม่ใช่รูปแบบสติกเกอร์ปกติ ให้ใช้ตัวตรวจจับแทน
+LAYOUT_MAX_BOXES = 40
+
+
+def _ink_mask(image: np.ndarray) -> np.ndarray:
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # ตัวอักษรคือสีส่วนน้อย ใช้ได้ทั้งภาพตัวดำพื้นขาวและภาพที่กลับสีแล้ว
+    if (binary == 0).mean() < 0.5:
+        binary = 255 - binary
+    return binary
+
+
+def _glyph_boxes(image: np.ndarray) -> Tuple[np.ndarray, float]:
+    # คืน [x, y, w, h] ของ component ที่น่าจะเป็นตัวอักษร และความสูงตัวอักษรโดยประมาณ
     height, width = image.shape[:2]
-    
-    # ปรับขนาด
-    scaled = cv2.resize(image, (width*scale, height*scale), 
-                       interpolation=cv2.INTER_CUBIC)
-    
-    # หมุน
-    rotated = rotate_90(scaled)
-    
-    # ภาพขาว-ดำ
-    gray = cv2.cvtColor(rotated, cv2.COLOR_BGR2GRAY) if len(rotated.shape) == 3 else rotated
-    
-    # สลับสี
-    inverted = cv2.bitwise_not(gray)
-    
-    # ฟิลเตอร์ Bilateral
-    bilateral = cv2.bilateralFilter(inverted, 9, 75, 75)
-    
-    # CLAHE
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-    clahe_applied = clahe.apply(bilateral)
-    
-    # TESTED: alpha=1.3, beta=4
-    enhanced = cv2.convertScaleAbs(clahe_applied, alpha=1.3, beta=4)
-    
-    # TESTED: block=25, C=2
-    binary = cv2.adaptiveThreshold(
-        enhanced, 255,
-        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY,
-        blockSize=25,
-        C=2
-    )
-    
-    white_percent = (binary == 255).sum() / binary.size * 100
-    print(f'   Right preprocessing: {white_percent:.1f}% white')
-    
-    # Denoise
-    denoised = cv2.medianBlur(binary, 3)
-    
-    # Morphological operations
-    kernel = np.ones((2, 2), np.uint8)
-    opened = cv2.morphologyEx(denoised, cv2.MORPH_OPEN, kernel, iterations=1)
-    closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, kernel, iterations=1)
-    
-    return closed
+    mask = _ink_mask(image)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    areas = stats[:, cv2.CC_STAT_AREA]
+    heights = stats[:, cv2.CC_STAT_HEIGHT]
+    candidates = np.flatnonzero(areas >= LAYOUT_MIN_GLYPH_AREA * height * width)
+    candidates = candidates[candidates > 0]
+    if not len(candidates):
+        return np.empty((0, 4), dtype=np.int32), 0.0
+
+    # median ถ่วงด้วยพื้นที่ ตัวอักษรเส้นหนากินพื้นที่มากกว่าลายพื้นหลังที่มีจำนวนชิ้นมากกว่า
+    order = candidates[np.argsort(heights[candidates])]
+    weights = np.cumsum(areas[order])
+    glyph_height = float(heights[order[np.searchsorted(weights, weights[-1] / 2)]])
+
+    # ลายพื้นหลังหลัง adaptive threshold เป็นเส้นบาง หายไปหลัง open ส่วนตัวอักษรยังเหลือ
+    size = max(1, int(glyph_height * LAYOUT_STROKE))
+    opened = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((size, size), np.uint8))
+    solid = np.zeros(len(stats), dtype=bool)
+    solid[np.unique(labels[opened > 0])] = True
+
+    low, high = LAYOUT_GLYPH_HEIGHT
+    keep = [i for i in candidates
+            if solid[i] and low * glyph_height <= heights[i] <= high * glyph_height
+            and stats[i, cv2.CC_STAT_WIDTH] <= 4 * LAYOUT_WORD_GAP * glyph_height]
+    return stats[keep, :4], glyph_height
+
+
+def _merge_line_boxes(boxes: List[List[int]]) -> List[List[int]]:
+    # ตัวอักษรเส้นบางหรือบิดเบี้ยวแตกเป็นหลายกล่องในบรรทัดเดียว รวมกล่องที่อยู่แถวเดียวกันและชิดกัน
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                size = min(a[3] - a[2], b[3] - b[2])
+                overlap = min(a[3], b[3]) - max(a[2], b[2])
+                gap = max(a[0], b[0]) - min(a[1], b[1])
+                # กล่องที่รวมหลายแถวไปแล้วจะสูงกว่ากล่องอื่นมาก จึงไม่ถูกรวมต่อเป็นทอดๆ
+                if (overlap >= LAYOUT_ROW_OVERLAP * size and gap <= LAYOUT_WORD_GAP * size
+                        and max(a[3] - a[2], b[3] - b[2]) <= 1.5 * size):
+                    boxes[i] = [min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
 
 
-def preprocess_right_region_for_tesseract(image: np.ndarray, scale: int = 10) -> np.ndarray:
+def segment_text_lines(image: np.ndarray, max_boxes: int = LAYOUT_MAX_BOXES) -> List[List[int]]:
+    # คืนกล่องของแต่ละบรรทัดเป็น [x_min, x_max, y_min, y_max] (รูปแบบ horizontal_list ของ EasyOCR) เรียงตามลำดับการอ่าน
+    # คืนรายการว่างเมื่อแบ่งไม่ได้ ผู้เรียกควรกลับไปใช้ตัวตรวจจับ
     height, width = image.shape[:2]
-    
-    # ความละเอียดสูงขึ้น
-    scaled = cv2.resize(image, (width*scale, height*scale), 
-                       interpolation=cv2.INTER_CUBIC)
-    
-    rotated = rotate_90(scaled)
-    gray = cv2.cvtColor(rotated, cv2.COLOR_BGR2GRAY) if len(rotated.shape) == 3 else rotated
-    inverted = cv2.bitwise_not(gray)
-    
-    # Aggressive denoising
-    denoised = cv2.fastNlMeansDenoising(inverted, None, h=15, 
-                                        templateWindowSize=7, 
-                                        searchWindowSize=21)
-    
-    bilateral = cv2.bilateralFilter(denoised, 9, 100, 100)
-    
-    clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(8, 8))
-    clahe_applied = clahe.apply(bilateral)
-    
-    kernel_sharpen = np.array([
+    glyphs, _ = _glyph_boxes(image)
+    if len(glyphs) < 2:
+        return []
+    glyphs = glyphs[np.argsort(glyphs[:, 0])]
+    x, y, w, h = glyphs.T
+    center = y + h / 2
+
+    # ต่อตัวอักษรแต่ละตัวกับตัวที่ใกล้ที่สุดทางขวาที่อยู่แนวเดียวกัน ป้ายกับค่าที่อยู่ต่ำกว่าครึ่งบรรทัดจึงไม่ถูกรวมกัน
+    parent = list(range(len(glyphs)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(glyphs)):
+        size = np.minimum(h[i], h[i + 1:])
+        gap = x[i + 1:] - (x[i] + w[i])
+        near = ((gap <= LAYOUT_WORD_GAP * np.maximum(h[i], h[i + 1:]))
+                & (np.abs(center[i + 1:] - center[i]) <= LAYOUT_LINE_OFFSET * size)
+                & (np.maximum(h[i], h[i + 1:]) <= 2 * size))
+        if near.any():
+            j = i + 1 + int(np.argmin(np.where(near, gap, np.inf)))
+            parent[find(i)] = find(j)
+
+    lines = {}
+    for i in range(len(glyphs)):
+        lines.setdefault(find(i), []).append(i)
+
+    boxes = []
+    for members in lines.values():
+        # component เดี่ยวมักเป็นลายพื้นหลังหรือขอบ ไม่ใช่ข้อความ
+        if len(members) < 2:
+            continue
+        members = np.array(members)
+        pad = int(round(LAYOUT_PAD * np.median(h[members])))
+        boxes.append([max(0, int(x[members].min()) - pad), min(width, int((x + w)[members].max()) + pad),
+                      max(0, int(y[members].min()) - pad), min(height, int((y + h)[members].max()) + pad)])
+
+    boxes = _merge_line_boxes(boxes)
+    if not boxes or len(boxes) > max_boxes:
+        return []
+
+    # ลำดับการอ่าน: กล่องที่จุดกึ่งกลางอยู่ในช่วงความสูงของแถวเดียวกันเรียงซ้ายไปขวา
+    boxes.sort(key=lambda box: box[2] + box[3])
+    rows = []
+    for box in boxes:
+        if rows and (box[2] + box[3]) / 2 < rows[-1][0][3]:
+            rows[-1].append(box)
+        else:
+            rows.append([box])
+    return [box for row in rows for box in sorted(row, key=lambda box: box[0])]
+
+
+def rotate_90(image: np.ndarray) -> np.ndarray:
+    return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+
+
+# ขั้นตอนการประมวลผลภาพแบบประกาศ: รายการของ (ชื่อ op, พารามิเตอร์)
+Step = Tuple[str, Dict]
+
+KERNELS = {
+    'sharpen': np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]]),
+    'sharpen_strong': np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]]),
+    'sharpen_5x5': np.array([
         [-1, -1, -1, -1, -1],
         [-1,  2,  2,  2, -1],
         [-1,  2,  9,  2, -1],
         [-1,  2,  2,  2, -1],
         [-1, -1, -1, -1, -1]
-    ]) / 9.0
-    sharpened = cv2.filter2D(clahe_applied, -1, kernel_sharpen)
-    
-    enhanced = cv2.convertScaleAbs(sharpened, alpha=2.5, beta=20)
-    
-    binary = cv2.adaptiveThreshold(
-        enhanced, 255,
+    ]) / 9.0,
+}
+
+
+def _op_resize(image: np.ndarray, scale: int) -> np.ndarray:
+    height, width = image.shape[:2]
+    return cv2.resize(image, (width*scale, height*scale),
+                      interpolation=cv2.INTER_CUBIC)
+
+
+def _op_rotate_90(image: np.ndarray) -> np.ndarray:
+    return rotate_90(image)
+
+
+def _op_grayscale(image: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+
+
+def _op_invert(image: np.ndarray) -> np.ndarray:
+    return cv2.bitwise_not(image)
+
+
+def _op_nl_means(image: np.ndarray, h: int, template_window: int, search_window: int) -> np.ndarray:
+    return cv2.fastNlMeansDenoising(image, None, h=h,
+                                    templateWindowSize=template_window,
+                                    searchWindowSize=search_window)
+
+
+def _op_bilateral(image: np.ndarray, d: int, sigma_color: float, sigma_space: float) -> np.ndarray:
+    return cv2.bilateralFilter(image, d, sigma_color, sigma_space)
+
+
+def _op_clahe(image: np.ndarray, clip_limit: float, tile: int = 8) -> np.ndarray:
+    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile, tile))
+    return clahe.apply(image)
+
+
+def _op_filter2d(image: np.ndarray, kernel: str) -> np.ndarray:
+    return cv2.filter2D(image, -1, KERNELS[kernel])
+
+
+def _op_scale_abs(image: np.ndarray, alpha: float, beta: float) -> np.ndarray:
+    return cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
+
+
+def _op_threshold(image: np.ndarray, thresh: int) -> np.ndarray:
+    _, binary = cv2.threshold(image, thresh, 255, cv2.THRESH_BINARY)
+    return binary
+
+
+def _op_adaptive_threshold(image: np.ndarray, block_size: int, c: float) -> np.ndarray:
+    return cv2.adaptiveThreshold(
+        image, 255,
         cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
         cv2.THRESH_BINARY,
-        blockSize=11, C=3
+        blockSize=block_size,
+        C=c
     )
-    
-    denoised2 = cv2.medianBlur(binary, 3)
-    
-    kernel_dilate = np.ones((2, 2), np.uint8)
-    dilated = cv2.dilate(denoised2, kernel_dilate, iterations=1)
-    
-    kernel = np.ones((2, 2), np.uint8)
-    opened = cv2.morphologyEx(dilated, cv2.MORPH_OPEN, kernel, iterations=1)
-    closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, kernel, iterations=1)
-    
-    final = cv2.filter2D(closed, -1, np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]]))
-    _, final = cv2.threshold(final, 127, 255, cv2.THRESH_BINARY)
-    
-    white_percent = (final == 255).sum() / final.size * 100
-    print(f'   Right (Tesseract): {white_percent:.1f}% white')
-    
-    return final
\ No newline at end of file
+
+
+def _op_median(image: np.ndarray, ksize: int = 3) -> np.ndarray:
+    return cv2.medianBlur(image, ksize)
+
+
+def _op_dilate(image: np.ndarray, size: int = 2, iterations: int = 1) -> np.ndarray:
+    return cv2.dilate(image, np.ones((size, size), np.uint8), iterations=iterations)
+
+
+def _op_open(image: np.ndarray, size: int = 2, iterations: int = 1) -> np.ndarray:
+    return cv2.morphologyEx(image, cv2.MORPH_OPEN, np.ones((size, size), np.uint8),
+                            iterations=iterations)
+
+
+def _op_close(image: np.ndarray, size: int = 2, iterations: int = 1) -> np.ndarray:
+    return cv2.morphologyEx(image, cv2.MORPH_CLOSE, np.ones((size, size), np.uint8),
+                            iterations=iterations)
+
+
+PREPROCESS_OPS = {
+    'resize': _op_resize,
+    'rotate_90': _op_rotate_90,
+    'grayscale': _op_grayscale,
+    'invert': _op_invert,
+    'nl_means': _op_nl_means,
+    'bilateral': _op_bilateral,
+    'clahe': _op_clahe,
+    'filter2d': _op_filter2d,
+    'scale_abs': _op_scale_abs,
+    'threshold': _op_threshold,
+    'adaptive_threshold': _op_adaptive_threshold,
+    'median': _op_median,
+    'dilate': _op_dilate,
+    'open': _op_open,
+    'close': _op_close,
+}
+
+
+def left_region_pipeline(scale: int = 2) -> List[Step]:
+    return [
+        ('resize', {'scale': scale}),
+        ('grayscale', {}),
+        # เพิ่มความคมชัด
+        ('filter2d', {'kernel': 'sharpen'}),
+        # เพิ่มประสิทธิภาพ
+        ('scale_abs', {'alpha': 1.2, 'beta': 10}),
+        # การปรับค่าเกณฑ์
+        ('threshold', {'thresh': 128}),
+        # Denoise
+        ('median', {'ksize': 3}),
+    ]
+
+
+def right_region_pipeline(scale: int = 7, alpha: float = 1.3, beta: float = 4,
+                          block_size: int = 25, c_value: float = 2) -> List[Step]:
+    return [
+        # ปรับขนาด, หมุน, ภาพขาว-ดำ, สลับสี
+        ('resize', {'scale': scale}),
+        ('rotate_90', {}),
+        ('grayscale', {}),
+        ('invert', {}),
+        # ฟิลเตอร์ Bilateral
+        ('bilateral', {'d': 9, 'sigma_color': 75, 'sigma_space': 75}),
+        ('clahe', {'clip_limit': 3.0}),
+        # TESTED: alpha=1.3, beta=4
+        ('scale_abs', {'alpha': alpha, 'beta': beta}),
+        # TESTED: block=25, C=2
+        ('adaptive_threshold', {'block_size': block_size, 'c': c_value}),
+        # Denoise + Morphological operations
+        ('median', {'ksize': 3}),
+        ('open', {'size': 2}),
+        ('close', {'size': 2}),
+    ]
+
+
+def right_region_tesseract_pipeline(scale: int = 10) -> List[Step]:
+    return [
+        # ความละเอียดสูงขึ้น
+        ('resize', {'scale': scale}),
+        ('rotate_90', {}),
+        ('grayscale', {}),
+        ('invert', {}),
+        # Aggressive denoising
+        ('nl_means', {'h': 15, 'template_window': 7, 'search_window': 21}),
+        ('bilateral', {'d': 9, 'sigma_color': 100, 'sigma_space': 100}),
+        ('clahe', {'clip_limit': 4.0}),
+        ('filter2d', {'kernel': 'sharpen_5x5'}),
+        ('scale_abs', {'alpha': 2.5, 'beta': 20}),
+        ('adaptive_threshold', {'block_size': 11, 'c': 3}),
+        ('median', {'ksize': 3}),
+        ('dilate', {'size': 2}),
+        ('open', {'size': 2}),
+        ('close', {'size': 2}),
+        ('filter2d', {'kernel': 'sharpen_strong'}),
+        ('threshold', {'thresh': 127}),
+    ]
+
+
+def pipeline_until(steps: List[Step], op_name: str) -> List[Step]:
+    # ตัดขั้นตอนหลัง op ที่ระบุ (รวม op นั้นด้วย)
+    for i, (name, _) in enumerate(steps):
+        if name == op_name:
+            return steps[:i + 1]
+    raise ValueError(f'Unknown step in pipeline: {op_name}')
+
+
+# แคชผลลัพธ์ระหว่างทาง คีย์คือ (hash ของภาพ, prefix ของขั้นตอน)
+PIPELINE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+_pipeline_cache = OrderedDict()
+_pipeline_cache_bytes = 0
+_pipeline_cache_lock = threading.Lock()
+
+
+def image_hash(image: np.ndarray) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((image.shape, image.dtype.str)).encode())
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+
+def _step_key(step: Step) -> Tuple:
+    name, params = step
+    return (name, tuple(sorted(params.items())))
+
+
+def _cache_get(key):
+    with _pipeline_cache_lock:
+        value = _pipeline_cache.get(key)
+        if value is not None:
+            _pipeline_cache.move_to_end(key)
+        return value
+
+
+def _cache_put(key, value: np.ndarray):
+    global _pipeline_cache_bytes
+    if value.nbytes > PIPELINE_CACHE_MAX_BYTES:
+        return
+    # ผลลัพธ์ในแคชถูกใช้ร่วมกัน ห้ามแก้ไขในที่
+    value.flags.writeable = False
+    with _pipeline_cache_lock:
+        if key in _pipeline_cache:
+            return
+        _pipeline_cache[key] = value
+        _pipeline_cache_bytes += value.nbytes
+        while _pipeline_cache_bytes > PIPELINE_CACHE_MAX_BYTES:
+            _, evicted = _pipeline_cache.popitem(last=False)
+            _pipeline_cache_bytes -= evicted.nbytes
+
+
+def clear_pipeline_cache():
+    global _pipeline_cache_bytes
+    with _pipeline_cache_lock:
+        _pipeline_cache.clear()
+        _pipeline_cache_bytes = 0
+
+
+def run_preprocessing(image: np.ndarray, steps: List[Step], cache: bool = False,
+                      input_hash: Optional[str] = None) -> np.ndarray:
+    keys = [_step_key(step) for step in steps]
+
+    if not cache:
+        result = image
+        for name, params in steps:
+            result = PREPROCESS_OPS[name](result, **params)
+        return result
+
+    if input_hash is None:
+        input_hash = image_hash(image)
+
+    # หา prefix ที่ยาวที่สุดที่มีในแคช แล้วคำนวณเฉพาะขั้นตอนที่เหลือ
+    result = image
+    start = 0
+    for i in range(len(steps), 0, -1):
+        cached = _cache_get((input_hash, tuple(keys[:i])))
+        if cached is not None:
+            result = cached
+            start = i
+            break
+
+    for i in range(start, len(steps)):
+        name, params = steps[i]
+        result = PREPROCESS_OPS[name](result, **params)
+        # op ที่คืนภาพเดิม (เช่น grayscale ของภาพเทา) คืน array ของผู้เรียก ต้องคัดลอกก่อนแคช
+        # ไม่อย่างนั้นแคชจะตั้งภาพของผู้เรียกเป็น read-only
+        if np.shares_memory(result, image):
+            result = result.copy()
+        _cache_put((input_hash, tuple(keys[:i + 1])), result)
+
+    return result
+
+
+def white_percent(binary: np.ndarray) -> float:
+    return (binary == 255).sum() / binary.size * 100
+
+
+def preprocess_left_region(image: np.ndarray, scale: int = 2, cache: bool = False) -> np.ndarray:
+    return run_preprocessing(image, left_region_pipeline(scale), cache=cache)
+
+
+def preprocess_right_region(image: np.ndarray, scale: int = 7, cache: bool = False) -> np.ndarray:
+    steps = right_region_pipeline(scale)
+
+    prefix = pipeline_until(steps, 'adaptive_threshold')
+
+    binary = run_preprocessing(image, prefix, cache=cache)
+    print(f'   Right preprocessing: {white_percent(binary):.1f}% white')
+
+    if cache:
+        return run_preprocessing(image, steps, cache=True)
+    return run_preprocessing(binary, steps[len(prefix):])
+
+
+# refinement ตัดบรรทัดจากภาพเทาหลังขั้นนี้ (ก่อน threshold) มาอ่านซ้ำ
+REFINE_GRAY_STEP = 'scale_abs'
+
+
+def preprocess_left_region_with_gray(image: np.ndarray, scale: int = 2) -> Tuple[np.ndarray, np.ndarray]:
+    # คืนภาพเทาระหว่างทางให้ refinement ด้วย แทนการเก็บทุกขั้นไว้ในแคชแล้วคำนวณซ้ำ
+    steps = left_region_pipeline(scale)
+    gray_steps = pipeline_until(steps, REFINE_GRAY_STEP)
+    gray = run_preprocessing(image, gray_steps)
+    return run_preprocessing(gray, steps[len(gray_steps):]), gray
+
+
+def preprocess_right_region_with_gray(image: np.ndarray, scale: int = 7) -> Tuple[np.ndarray, np.ndarray]:
+    steps = right_region_pipeline(scale)
+    gray_steps = pipeline_until(steps, REFINE_GRAY_STEP)
+    binary_steps = pipeline_until(steps, 'adaptive_threshold')
+
+    gray = run_preprocessing(image, gray_steps)
+    binary = run_preprocessing(gray, binary_steps[len(gray_steps):])
+    print(f'   Right preprocessing: {white_percent(binary):.1f}% white')
+
+    return run_preprocessing(binary, steps[len(binary_steps):]), gray
+
+
+def preprocess_right_region_for_tesseract(image: np.ndarray, scale: int = 10, cache: bool = False) -> np.ndarray:
+    final = run_preprocessing(image, right_region_tesseract_pipeline(scale), cache=cache)
+    print(f'   Right (Tesseract): {white_percent(final):.1f}% white')
+
+    return final
@@ -0,0 +1,236 @@
+import re
+import cv2
+import numpy as np
+from typing import Dict, List, Optional
+
+from preprocessing import (
+    left_region_pipeline,
+    right_region_pipeline,
+    pipeline_until,
+    run_preprocessing,
+    REFINE_GRAY_STEP
+)
+from ocr_engines import OCR_BACKENDS, ocr_easyocr, ocr_tesseract_result, ocr_tesseract_text
+from data_extraction import (
+    extract_serial_number,
+    extract_mfg_date,
+    extract_exp_date,
+    extract_registration_number
+)
+from scoring import score_field_value
+
+
+# ฟิลด์ที่ refine ได้: ด้านที่อยู่, regex ของ label และ regex ของค่าเมื่อหา label ไม่เจอ
+REFINE_FIELDS = {
+    'serial_number': {
+        'region': 'right',
+        'label': r'\b(SER|SERIAL|SCR|SET|LOT)\b',
+        'value': r'\b\d{5,7}[A-Z]{0,2}\b',
+        'prefix': 'SER',
+        'extract': extract_serial_number,
+    },
+    'mfg_date': {
+        'region': 'right',
+        'label': r'\b(MFG|HLFG|HIFG|MIFG)',
+        'value': r'\b\d{1,2}\s+[A-Z]{3}\s+\d{2,4}\b',
+        'prefix': 'MFG',
+        'extract': extract_mfg_date,
+    },
+    'exp_date': {
+        'region': 'right',
+        'label': r'\bEXP',
+        'value': r'\b\d{1,2}\s+[A-Z]{3}\s+\d{2,4}\b',
+        'prefix': 'EXP',
+        'extract': extract_exp_date,
+    },
+    'registration_number': {
+        'region': 'left',
+        'label': r'\b(REG|RSG|RGS|FEG|GEG)',
+        'value': r'\d{1,3}\s*/\s*\d{1,3}',
+        'prefix': '',
+        'extract': extract_registration_number,
+    },
+}
+
+LINE_PADDING = 0.6
+LINE_PSM_CONFIGS = ['--psm 7 --oem 3', '--psm 6 --oem 3']
+MIN_REFINE_SCORE = 100
+
+
+def lines_from_tokens(tokens: List[Dict]) -> List[Dict]:
+    lines = {}
+    for token in tokens:
+        key = tuple(token['line']) if token.get('line') is not None else tuple(token['box'])
+        x1, y1, x2, y2 = token['box']
+        line = lines.setdefault(key, {'words': [], 'confs': [], 'box': [x1, y1, x2, y2]})
+        line['words'].append(token['text'])
+        line['confs'].append(token['conf'])
+        box = line['box']
+        line['box'] = [min(box[0], x1), min(box[1], y1), max(box[2], x2), max(box[3], y2)]
+
+    return [
+        {
+            'text': ' '.join(line['words']),
+            'box': tuple(line['box']),
+            'conf': sum(line['confs']) / len(line['confs'])
+        }
+        for line in lines.values()
+    ]
+
+
+def tesseract_lines(image: np.ndarray) -> List[Dict]:
+    return lines_from_tokens(ocr_tesseract_result(image)['tokens'])
+
+
+def locate_field_line(lines: List[Dict], field: str) -> Optional[Dict]:
+    spec = REFINE_FIELDS[field]
+
+    for line in lines:
+        if re.search(spec['label'], line['text'].upper()):
+            return line
+
+    candidates = [line for line in lines if re.search(spec['value'], line['text'].upper())]
+    if not candidates:
+        return None
+
+    # MFG มาก่อน EXP เสมอบนสติกเกอร์
+    if field == 'exp_date' and len(candidates) >= 2:
+        return sorted(candidates, key=lambda line: line['box'][1])[1]
+    return sorted(candidates, key=lambda line: line['box'][1])[0]
+
+
+def crop_line(image: np.ndarray, box) -> np.ndarray:
+    height = image.shape[0]
+    _, y1, _, y2 = box
+    pad = int((y2 - y1) * LINE_PADDING)
+    # ใช้ทั้งความกว้างของภาพ เผื่อค่าถูกแยกออกจากบรรทัดของ label
+    return image[max(0, y1 - pad):min(height, y2 + pad), :]
+
+
+def crop_variants(binary_crop: np.ndarray, gray_crop: Optional[np.ndarray]) -> Dict[str, np.ndarray]:
+    variants = {'binary': binary_crop}
+    if gray_crop is not None and gray_crop.size:
+        _, otsu = cv2.threshold(gray_crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        variants['otsu'] = otsu
+        variants['adaptive_15'] = cv2.adaptiveThreshold(
+            gray_crop, 255,
+            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY,
+            blockSize=15, C=4
+        )
+    return variants
+
+
+def read_crop_candidates(variants: Dict[str, np.ndarray], easyocr: bool = False) -> List[Dict]:
+    candidates = []
+    for name, crop in variants.items():
+        for config in LINE_PSM_CONFIGS:
+            try:
+                text = ocr_tesseract_text(crop, config).strip()
+            except Exception as e:
+                print(f'   Refine Tesseract error ({name}): {e}')
+                continue
+            candidates.append({'variant': f'{name} ({config.split(" --")[0]})', 'text': text})
+
+    # EasyOCR เฉพาะเมื่อผู้เรียกขอและโหลด reader ไว้แล้ว ไม่โหลดโมเดลเพื่อ refine (เช่นโหมด fast)
+    if easyocr and OCR_BACKENDS['easyocr']['loaded']():
+        candidates.append({'variant': 'binary (easyocr)', 'text': ocr_easyocr(variants['binary'])})
+
+    return candidates
+
+
+def refine_field(field: str, lines: List[Dict], processed: np.ndarray,
+                 gray: Optional[np.ndarray], current_value: Optional[str], easyocr: bool = False) -> Dict:
+    spec = REFINE_FIELDS[field]
+    current_score = score_field_value(field, current_value)
+    report = {
+        'before': current_value,
+        'after': current_value,
+        'score_before': current_score,
+        'score_after': current_score,
+        'updated': False
+    }
+
+    line = locate_field_line(lines, field)
+    if line is None:
+        report['reason'] = 'line-not-found'
+        return report
+
+    report['line'] = line['text']
+    binary_crop = crop_line(processed, line['box'])
+    gray_crop = crop_line(gray, line['box']) if gray is not None and gray.shape[:2] == processed.shape[:2] else None
+
+    best = None
+    for candidate in read_crop_candidates(crop_variants(binary_crop, gray_crop), easyocr):
+        text = f"{spec['prefix']} {candidate['text']}".strip()
+        value = spec['extract'](text)
+        score = score_field_value(field, value)
+        if value and (best is None or score > best['score']):
+            best = {'value': value, 'score': score, 'variant': candidate['variant']}
+
+    if best and best['score'] > current_score:
+        report.update({
+            'after': best['value'],
+            'score_after': best['score'],
+            'variant': best['variant'],
+            'updated': True
+        })
+    else:
+        report['reason'] = 'no-better-candidate'
+
+    return report
+
+
+def refine_fields(data: Dict, left: np.ndarray, right: np.ndarray,
+                  left_processed: np.ndarray, right_processed: np.ndarray,
+                  left_scale: int = 2, right_scale: int = 7,
+                  fields: Optional[List[str]] = None,
+                  tokens: Optional[Dict[str, List[Dict]]] = None,
+                  grays: Optional[Dict[str, np.ndarray]] = None,
+                  easyocr: bool = False) -> Dict:
+    if fields is None:
+        fields = [f for f in REFINE_FIELDS if score_field_value(f, data.get(f)) < MIN_REFINE_SCORE]
+
+    regions = {
+        'left': {
+            'raw': left,
+            'processed': left_processed,
+            'steps': pipeline_until(left_region_pipeline(left_scale), REFINE_GRAY_STEP),
+        },
+        'right': {
+            'raw': right,
+            'processed': right_processed,
+            'steps': pipeline_until(right_region_pipeline(right_scale), REFINE_GRAY_STEP),
+        },
+    }
+
+    refined = dict(data)
+    reports = {}
+    for field in fields:
+        region = regions[REFINE_FIELDS[field]['region']]
+
+        # ใช้ตำแหน่งคำจากการอ่านรอบหลักถ้ามี ไม่งั้นหาบรรทัดครั้งเดียวต่อด้าน
+        # ภาพเทาก่อน threshold ใช้ที่ pipeline ส่งมา (preprocess_*_with_gray) ไม่มีจึงคำนวณใหม่
+        if 'lines' not in region:
+            region_name = REFINE_FIELDS[field]['region']
+            if tokens and tokens.get(region_name):
+                region['lines'] = lines_from_tokens(tokens[region_name])
+            else:
+                region['lines'] = tesseract_lines(region['processed'])
+            if grays and grays.get(region_name) is not None:
+                region['gray'] = grays[region_name]
+            else:
+                region['gray'] = run_preprocessing(region['raw'], region['steps'])
+
+        report = refine_field(field, region['lines'], region['processed'], region['gray'], data.get(field),
+                              easyocr=easyocr)
+        reports[field] = report
+        if report['updated']:
+            refined[field] = report['after']
+            print(f'   [REFINED] {field}: {report["before"] or "ไม่พบ"} → {report["after"]} ({report["variant"]})')
+
+    return {
+        'data': refined,
+        'fields': reports,
+        'updated': [field for field, report in reports.items() if report['updated']]
+    }
@@ -0,0 +1,109 @@
+import os
+import io
+import csv
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional
+
+from data_extraction import THAI_FIELDS, validate_vaccine_data
+
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+RESULTS_LOG = os.path.join(RESULTS_FOLDER, 'results.jsonl')
+EXPORT_FORMATS = ('jsonl', 'csv')
+EXPORT_CHUNK_RECORDS = 500
+RECORD_FIELDS = list(THAI_FIELDS)
+CSV_COLUMNS = ['timestamp', 'filename', 'sticker', 'mode'] + RECORD_FIELDS + ['is_complete', 'refined', 'processing_time']
+
+_lock = threading.Lock()
+
+
+def compact_record(result: Dict, filename: str, processing_time: Optional[float] = None,
+                   sticker: Optional[int] = None) -> Dict:
+    # เก็บเฉพาะผลที่รวมแล้ว ไม่เก็บข้อความดิบ ผลของแต่ละ engine และ metrics
+    data = result['merged']['data']
+    record = {
+        'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+        'filename': filename,
+        'mode': result.get('mode'),
+        'data': {field: data.get(field) for field in RECORD_FIELDS},
+        'sources': {field: info.get('source') for field, info in result['merged']['sources'].items()},
+        'is_complete': validate_vaccine_data(data)['is_complete'],
+        'refined': result.get('refinement', {}).get('updated', []),
+    }
+    if sticker is not None:
+        # ลำดับสติกเกอร์ในภาพที่มีหลายขวด
+        record['sticker'] = sticker
+    if processing_time is not None:
+        record['processing_time'] = round(processing_time, 3)
+    return record
+
+
+def append_record(record: Dict, path: str = RESULTS_LOG):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+    # เขียนทีละบรรทัดแบบ append ใต้ lock เพื่อไม่ให้ request พร้อมกันเขียนทับกัน
+    with _lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+def iter_records(path: str = RESULTS_LOG, since: Optional[str] = None,
+                 limit: Optional[int] = None) -> Iterator[Dict]:
+    if not os.path.exists(path):
+        return
+
+    count = 0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if limit is not None and count >= limit:
+                return
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # บรรทัดสุดท้ายอาจยังเขียนไม่เสร็จ
+                continue
+            # timestamp เป็น ISO จึงเทียบแบบ string ได้
+            if since and record.get('timestamp', '') <= since:
+                continue
+            count += 1
+            yield record
+
+
+def flatten_record(record: Dict) -> Dict:
+    row = {key: record.get(key) for key in ('timestamp', 'filename', 'sticker', 'mode', 'is_complete', 'processing_time')}
+    row.update(record.get('data', {}))
+    row['refined'] = ' '.join(record.get('refined', []))
+    return row
+
+
+def iter_export_chunks(records: Iterable[Dict], export_format: str = 'jsonl',
+                       chunk_records: int = EXPORT_CHUNK_RECORDS) -> Iterator[str]:
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+
+    buffer = io.StringIO()
+    writer = None
+    if export_format == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+
+    pending = 0
+    for record in records:
+        if writer:
+            writer.writerow(flatten_record(record))
+        else:
+            buffer.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        pending += 1
+
+        # ส่งออกทีละก้อน หน่วยความจำจึงไม่โตตามจำนวน record
+        if pending >= chunk_records:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
@@ -0,0 +1,161 @@
+import re
+
+
+FIELD_NAMES = ['vaccine_name', 'product_name', 'registration_number', 'serial_number', 'mfg_date', 'exp_date']
+
+VALID_MONTHS = {'JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC',
+                'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'}
+
+
+def score_date_format(date_str):
+    if not date_str or date_str == 'ไม่พบ':
+        return 0
+
+    parts = date_str.strip().split()
+    if len(parts) != 3:
+        return 0
+
+    score = 0
+    day, month, year = parts
+
+    if day.isdigit() and 1 <= int(day) <= 31:
+        score += 33
+
+    if month in VALID_MONTHS:
+        score += 34
+
+    if year.isdigit() and 2000 <= int(year) <= 2030:
+        score += 33
+
+    return score
+
+
+def score_registration_number(reg_str):
+    if not reg_str or reg_str == 'ไม่พบ':
+        return 0
+
+    score = 0
+
+    if '/' in reg_str:
+        score += 40
+
+        slash_pattern = re.search(r'\d+/\d+', reg_str)
+        if slash_pattern:
+            score += 30
+
+    prefix_pattern = re.search(r'([A-Z0-9]{1,3})\s*\d+/\d+', reg_str)
+    if prefix_pattern:
+        score += 20
+
+    suffix_pattern = re.search(r'\(([A-Z0-9]+)\)', reg_str)
+    if suffix_pattern:
+        suffix = suffix_pattern.group(1)
+        if re.fullmatch(r'[A-Z]{1,2}', suffix):
+            score += 10
+        elif re.fullmatch(r'[0-9]{1,2}', suffix):
+            score += 5
+
+    return min(score, 100)
+
+
+def score_serial_number(serial_str):
+    if not serial_str or serial_str == 'ไม่พบ':
+        return 0
+
+    clean = re.sub(r'[^A-Z0-9]', '', serial_str.upper())
+
+    if len(clean) < 5:
+        return 0
+
+    score = 0
+
+    if 5 <= len(clean) <= 9:
+        score += 50
+
+    digit_part = re.match(r'^(\d+)', clean)
+    if digit_part:
+        digits = digit_part.group(1)
+        if 5 <= len(digits) <= 7:
+            score += 30
+
+    letter_part = re.search(r'([A-Z]+)$', clean)
+    if letter_part:
+        letters = letter_part.group(1)
+        if len(letters) <= 2:
+            score += 20
+    else:
+        score += 20
+
+    pattern = re.fullmatch(r'\d{5,7}[A-Z]{0,2}', clean)
+    if pattern:
+        return 100
+
+    return min(score, 100)
+
+
+def score_field_value(field_name, value):
+    if not value or value == 'ไม่พบ':
+        return 0
+
+    if field_name in ['mfg_date', 'exp_date']:
+        return score_date_format(value)
+    elif field_name == 'registration_number':
+        return score_registration_number(value)
+    elif field_name == 'serial_number':
+        return score_serial_number(value)
+    elif field_name in ['vaccine_name', 'product_name']:
+        if len(value.strip()) >= 3:
+            return 100
+        elif len(value.strip()) >= 1:
+            return 50
+        return 0
+
+    return 100
+
+
+def calculate_field_level_accuracy(tess_data, easy_data, merged_data):
+    field_accuracy = {}
+
+    for field in FIELD_NAMES:
+        tess_val = tess_data.get(field)
+        easy_val = easy_data.get(field)
+        merged_val = merged_data.get(field)
+
+        tess_score = score_field_value(field, tess_val)
+        easy_score = score_field_value(field, easy_val)
+        merged_score = score_field_value(field, merged_val)
+
+        field_accuracy[field] = {
+            'tesseract': tess_score,
+            'easyocr': easy_score,
+            'merged': merged_score,
+            'tesseract_value': tess_val or '',
+            'easyocr_value': easy_val or '',
+            'merged_value': merged_val or ''
+        }
+
+    return field_accuracy
+
+
+def calculate_merge_quality_score(tess_data, easy_data, merged_data):
+    def calculate_average_score(data):
+        total_score = 0
+        for field in FIELD_NAMES:
+            total_score += score_field_value(field, data.get(field))
+        return total_score / len(FIELD_NAMES)
+
+    tess_accuracy = calculate_average_score(tess_data)
+    easy_accuracy = calculate_average_score(easy_data)
+    merged_accuracy = calculate_average_score(merged_data)
+
+    best_individual = max(tess_accuracy, easy_accuracy)
+    improvement = merged_accuracy - best_individual
+
+    return {
+        'tesseract_accuracy': round(tess_accuracy, 1),
+        'easyocr_accuracy': round(easy_accuracy, 1),
+        'merged_accuracy': round(merged_accuracy, 1),
+        'best_individual': round(best_individual, 1),
+        'improvement': round(improvement, 1),
+        'improvement_percentage': round(improvement, 1)
+    }
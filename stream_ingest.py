@@ -0,0 +1,119 @@
+import sys
+import json
+import struct
+import argparse
+import threading
+import http.client
+from urllib.parse import urlencode, urlsplit
+from typing import BinaryIO, Dict, Iterator, List
+
+
+# แต่ละ frame = ความยาว 4 byte (big-endian) ตามด้วยไฟล์ภาพที่ encode แล้ว (JPG/PNG) ความยาว 0 = จบ stream
+FRAME_HEADER = struct.Struct('>I')
+END_OF_STREAM = FRAME_HEADER.pack(0)
+STREAM_MIMETYPE = 'application/octet-stream'
+
+
+class FrameError(ValueError):
+    pass
+
+
+def pack_frame(data: bytes) -> bytes:
+    if not data:
+        raise FrameError('Empty frame')
+    return FRAME_HEADER.pack(len(data)) + data
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frames(stream: BinaryIO, max_frame_bytes: int) -> Iterator[bytes]:
+    # อ่านทีละ frame ทันทีที่มาถึง ไม่รอให้ client ส่งครบทั้ง stream
+    while True:
+        header = _read_exact(stream, FRAME_HEADER.size)
+        if not header:
+            return
+        if len(header) < FRAME_HEADER.size:
+            raise FrameError('Truncated frame header')
+
+        size, = FRAME_HEADER.unpack(header)
+        if size == 0:
+            return
+        if size > max_frame_bytes:
+            raise FrameError(f'Frame too large: {size} bytes (max {max_frame_bytes})')
+
+        data = _read_exact(stream, size)
+        if len(data) < size:
+            raise FrameError('Truncated frame')
+        yield data
+
+
+def stream_images(url: str, paths: List[str], params: Dict = None) -> Iterator[Dict]:
+    # ส่งภาพต่อกันใน request เดียว (chunked) และอ่านผลที่ทยอยกลับมาไปพร้อมกัน
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    connection = connection_class(parts.netloc)
+    path = (parts.path.rstrip('/') or '') + '/api/stream'
+    if params:
+        path += '?' + urlencode(params)
+
+    connection.putrequest('POST', path)
+    connection.putheader('Content-Type', STREAM_MIMETYPE)
+    connection.putheader('Transfer-Encoding', 'chunked')
+    connection.endheaders()
+
+    def send_frames():
+        try:
+            for image_path in paths:
+                with open(image_path, 'rb') as f:
+                    frame = pack_frame(f.read())
+                connection.send(b'%x\r\n%s\r\n' % (len(frame), frame))
+            connection.send(b'%x\r\n%s\r\n0\r\n\r\n' % (len(END_OF_STREAM), END_OF_STREAM))
+        except OSError as e:
+            print(f'ส่งภาพไม่สำเร็จ: {e}', file=sys.stderr)
+
+    sender = threading.Thread(target=send_frames, daemon=True)
+    sender.start()
+    try:
+        response = connection.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f'HTTP {response.status}: {response.read().decode(errors="replace")}')
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        sender.join(timeout=1)
+        connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stream sticker images to the OCR server over one connection')
+    parser.add_argument('server', help='Server URL, e.g. http://localhost:5001')
+    parser.add_argument('paths', nargs='+', help='Image files, sent in this order')
+    parser.add_argument('--mode', default='fast')
+    parser.add_argument('--view', default='compact', choices=('full', 'compact'))
+    parser.add_argument('--fields', help='Extra response sections for the compact view')
+    args = parser.parse_args(argv)
+
+    params = {'mode': args.mode, 'view': args.view}
+    if args.fields:
+        params['fields'] = args.fields
+
+    for result in stream_images(args.server, args.paths, params):
+        seq = result.get('seq')
+        if seq is not None and 0 <= seq < len(args.paths):
+            result = {'path': args.paths[seq], **result}
+        print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
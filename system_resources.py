@@ -0,0 +1,8 @@
+import os
+
+
+def usable_cpu_count() -> int:
+    # นับเฉพาะ core ที่ process นี้ใช้ได้จริง (container / taskset)
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
@@ -0,0 +1,152 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import admission
+from admission import AdmissionController, AdmissionRejected
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def hold(self, controller: AdmissionController, release: threading.Event, cost: int = 1) -> threading.Thread:
+        # จองที่ไว้ใน thread อื่นจนกว่าจะ set release
+        admitted = threading.Event()
+
+        def run():
+            with controller.admit(cost=cost):
+                admitted.set()
+                release.wait()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(admitted.wait(1))
+        return thread
+
+    def wait_for_waiting(self, controller: AdmissionController, count: int):
+        deadline = time.monotonic() + 1
+        while controller.waiting < count:
+            self.assertLess(time.monotonic(), deadline, 'งานไม่ได้เข้าคิว')
+            time.sleep(0.01)
+
+    def test_queue_full_is_429_with_retry_after(self):
+        controller = AdmissionController(max_inflight=1, max_queue=0, queue_timeout=1)
+        release = threading.Event()
+        thread = self.hold(controller, release)
+        try:
+            with self.assertRaises(AdmissionRejected) as caught:
+                with controller.admit():
+                    pass
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(caught.exception.status, 429)
+        self.assertEqual(caught.exception.reason, 'queue_full')
+        self.assertGreaterEqual(caught.exception.retry_after, 1)
+        self.assertEqual(controller.counters['rejected_queue_full'], 1)
+
+    def test_queue_timeout_is_503_with_retry_after(self):
+        controller = AdmissionController(max_inflight=1, max_queue=1, queue_timeout=0.1)
+        release = threading.Event()
+        thread = self.hold(controller, release)
+        try:
+            with self.assertRaises(AdmissionRejected) as caught:
+                with controller.admit():
+                    pass
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(caught.exception.status, 503)
+        self.assertEqual(caught.exception.reason, 'queue_timeout')
+        self.assertGreaterEqual(caught.exception.retry_after, 1)
+        self.assertEqual(controller.waiting, 0)
+
+    def test_retry_after_grows_with_queue(self):
+        controller = AdmissionController(max_inflight=1, max_queue=4)
+        controller.service_time = 2.0
+        self.assertEqual(controller.retry_after(), 2)
+        controller.inflight = 1
+        controller.waiting = 2
+        self.assertEqual(controller.retry_after(), 6)
+
+    def test_waiters_are_admitted_in_arrival_order(self):
+        controller = AdmissionController(max_inflight=2, max_queue=4, queue_timeout=5)
+        release_big = threading.Event()
+        big = self.hold(controller, release_big)
+        order = []
+
+        def wait_for_turn(name: str, cost: int):
+            with controller.admit(cost=cost):
+                order.append(name)
+
+        # งานใหญ่ต้องใช้ทั้งสองช่อง จึงต้องรอ ส่วนงานเล็กที่มาทีหลังมีที่ว่างแต่ต้องไม่แซง
+        first = threading.Thread(target=wait_for_turn, args=('first', 2))
+        first.start()
+        self.wait_for_waiting(controller, 1)
+        second = threading.Thread(target=wait_for_turn, args=('second', 1))
+        second.start()
+        try:
+            self.wait_for_waiting(controller, 2)
+            self.assertEqual(order, [])
+        finally:
+            release_big.set()
+        for thread in (big, first, second):
+            thread.join(5)
+        self.assertEqual(order, ['first', 'second'])
+
+    def test_abandoned_ticket_does_not_block_queue(self):
+        controller = AdmissionController(max_inflight=1, max_queue=2, queue_timeout=0.1)
+        release = threading.Event()
+        thread = self.hold(controller, release)
+        with self.assertRaises(AdmissionRejected):
+            with controller.admit():
+                pass
+        release.set()
+        thread.join()
+        with controller.admit():
+            self.assertEqual(controller.inflight, 1)
+        self.assertEqual(controller.inflight, 0)
+
+    def test_waiter_rechecks_memory_without_a_release(self):
+        # ช่องว่างพอ แต่หน่วยความจำไม่พอ แล้วหน่วยความจำว่างขึ้นเองโดยไม่มีงานไหนจบ
+        memory = {'bytes': 0}
+        controller = AdmissionController(max_inflight=2, max_queue=1, queue_timeout=5, memory_poll=0.05)
+        release = threading.Event()
+        with mock.patch.object(admission, 'available_memory_bytes', lambda: memory['bytes']):
+            thread = self.hold(controller, release)
+            admitted = threading.Event()
+
+            def wait_for_memory():
+                with controller.admit():
+                    admitted.set()
+
+            waiter = threading.Thread(target=wait_for_memory)
+            waiter.start()
+            try:
+                self.wait_for_waiting(controller, 1)
+                self.assertFalse(admitted.wait(0.2))
+                memory['bytes'] = admission.PIPELINE_MEMORY_BYTES
+                self.assertTrue(admitted.wait(1))
+            finally:
+                release.set()
+                thread.join()
+                waiter.join(5)
+        self.assertEqual(controller.counters['rejected_memory'], 0)
+
+    def test_memory_wait_times_out_as_503(self):
+        controller = AdmissionController(max_inflight=2, max_queue=1, queue_timeout=0.2, memory_poll=0.05)
+        release = threading.Event()
+        with mock.patch.object(admission, 'available_memory_bytes', lambda: 0):
+            thread = self.hold(controller, release)
+            try:
+                with self.assertRaises(AdmissionRejected) as caught:
+                    with controller.admit():
+                        pass
+            finally:
+                release.set()
+                thread.join()
+        self.assertEqual(caught.exception.status, 503)
+        self.assertEqual(caught.exception.reason, 'memory')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from catalogue import correct_tokens
+from data_extraction import extract_manufacturer, extract_product_name
+from fuzzy_match import build_deletion_index, lookup
+
+
+class CorrectTokensTest(unittest.TestCase):
+    def test_corrects_garbled_catalogue_terms(self):
+        self.assertEqual(correct_tokens('CEFENSOR 3'), 'DEFENSOR 3')
+        self.assertEqual(correct_tokens('FEUOKCELL'), 'FELOCELL')
+        self.assertEqual(correct_tokens('ELOKCELL'), 'FELOCELL')
+        self.assertEqual(correct_tokens('ZOETLS INC'), 'ZOETIS INC')
+        self.assertEqual(correct_tokens('MERIAI'), 'MERIAL')
+        self.assertEqual(correct_tokens('PANLCUKOPENIA'), 'PANLEUKOPENIA')
+
+    def test_joins_split_fragments(self):
+        self.assertEqual(correct_tokens('MERIA L'), 'MERIAL')
+
+    def test_leaves_common_words_alone(self):
+        for word in ('MATERIAL', 'INTERVAL', 'SERIAL', 'AERIAL', 'DEFENDER', 'RAISIN'):
+            self.assertEqual(correct_tokens(word), word)
+        self.assertEqual(correct_tokens('MATERIAL INTERVAL'), 'MATERIAL INTERVAL')
+
+    def test_brand_terms_need_a_close_match(self):
+        # MERIAL ยาว 6 ตัว แก้ได้ 1 ตัวอักษร ห่าง 2 ตัวต้องไม่ถูกแก้แม้ไม่อยู่ใน words
+        self.assertEqual(correct_tokens('MEXRIAQ'), 'MEXRIAQ')
+
+    def test_extractors_do_not_invent_manufacturers(self):
+        self.assertIsNone(extract_manufacturer('Store away from material at intervals'))
+        self.assertEqual(extract_manufacturer('ZOETLS INC.'), 'Zoetis Inc.')
+        self.assertEqual(extract_product_name('CEFENSOR 3'), 'DEFENSOR 3')
+
+
+class LookupTest(unittest.TestCase):
+    def test_accept_filters_candidates(self):
+        index = build_deletion_index(['ABCDEF', 'ABCDEY'], 2)
+        self.assertEqual(lookup(index, 'ABCDEX')['term'], 'ABCDEF')
+        match = lookup(index, 'ABCDEX', accept=lambda term, distance: term != 'ABCDEF')
+        self.assertEqual(match['term'], 'ABCDEY')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import contextlib
+import io
+import unittest
+
+from data_extraction import extract_brand_name, extract_vaccine_data
+
+
+def extract(left_text: str, right_text: str = '') -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return extract_vaccine_data(left_text, right_text)
+
+
+class ProductNameTest(unittest.TestCase):
+    def test_brand_with_model_number(self):
+        self.assertEqual(extract('Rabies Vaccine DEFENSOR 3 Zoetis Inc.')['product_name'], 'DEFENSOR 3')
+
+    def test_brand_split_by_punctuation_without_components(self):
+        # ส่วนประกอบอ่านไม่ได้ แต่ชื่อการค้ายังอ่านได้ ต้องไม่คืน None
+        self.assertEqual(extract('FELO-CELL Reg No 2F 1/55 xq#zz')['product_name'], 'FELOCELL')
+        self.assertEqual(extract_brand_name('DEFEN.SOR'), 'DEFENSOR')
+
+    def test_brand_lookup_comes_before_component_inference(self):
+        # RABIES ชี้ไปที่ DEFENSOR ตามลำดับใน catalogue แต่ชื่อบนสติกเกอร์คือ RABISIN
+        data = extract('Rabies Vaccine RABI-SIN')
+        self.assertEqual(data['product_name'], 'RABISIN')
+
+    def test_infers_product_from_components_when_no_brand(self):
+        data = extract('Feline Rhinotracheitis Calici Panleukopenia Chlamydia psittaci')
+        self.assertEqual(data['product_name'], 'FELOCELL')
+
+
+if __name__ == '__main__':
+    unittest.main()
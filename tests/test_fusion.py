@@ -0,0 +1,89 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from fusion import FieldVotes, frame_quality, fuse_extractions, select_frames
+
+
+FRAME = {
+    'vaccine_name': 'Rabies Vaccine',
+    'product_name': 'DEFENSOR 3',
+    'registration_number': '1F 2/56 (B)',
+    'serial_number': '643797',
+    'mfg_date': '22 Jan 2023',
+    'exp_date': '11 Jun 2024',
+}
+
+
+def checkerboard(size: int = 200, cell: int = 10) -> np.ndarray:
+    board = ((np.indices((size, size)) // cell).sum(axis=0) % 2 * 200 + 20).astype(np.uint8)
+    return cv2.cvtColor(board, cv2.COLOR_GRAY2BGR)
+
+
+class FuseExtractionsTest(unittest.TestCase):
+    def test_agreeing_frames_stop_early(self):
+        fused = fuse_extractions([FRAME, FRAME, FRAME])
+        # สองเฟรมตรงกันและรูปแบบถูกต้องได้ consensus แล้ว เฟรมที่สามไม่ต้องอ่าน
+        self.assertEqual(fused['frames'], [0, 1])
+        self.assertTrue(fused['consensus'])
+        self.assertEqual(fused['data']['product_name'], 'DEFENSOR 3')
+
+    def test_early_stop_can_be_disabled(self):
+        fused = fuse_extractions([FRAME, FRAME, FRAME], early_stop=False)
+        self.assertEqual(fused['frames'], [0, 1, 2])
+
+    def test_spelling_variants_vote_together(self):
+        variant = {**FRAME, 'product_name': 'defensor-3'}
+        other = {**FRAME, 'product_name': 'DEFENSOR 5'}
+        fused = fuse_extractions([other, variant, FRAME], early_stop=False)
+        self.assertEqual(fused['sources']['product_name']['frames'], [1, 2])
+        self.assertEqual(fused['sources']['product_name']['alternatives'], 1)
+
+    def test_tie_goes_to_the_earlier_frame(self):
+        first = {**FRAME, 'serial_number': '111111'}
+        second = {**FRAME, 'serial_number': '222222'}
+        fused = fuse_extractions([first, second], early_stop=False)
+        self.assertEqual(fused['data']['serial_number'], '111111')
+        self.assertEqual(fused['sources']['serial_number']['margin'], 0)
+        self.assertFalse(fused['sources']['serial_number']['consensus'])
+
+    def test_votes_are_weighted_by_format_score(self):
+        votes = FieldVotes()
+        votes.add({'registration_number': '1F 2/56 (B)'})
+        votes.add({'registration_number': 'IF Z/S6 B'})
+        votes.add({'registration_number': 'IF Z/S6 B'})
+        winner = votes.ranked('registration_number')[0]
+        self.assertEqual(winner['value'], '1F 2/56 (B)')
+
+    def test_missing_values_do_not_vote(self):
+        fused = fuse_extractions([{**FRAME, 'serial_number': 'ไม่พบ'}, {**FRAME, 'serial_number': None}])
+        self.assertIsNone(fused['data']['serial_number'])
+        self.assertEqual(fused['sources']['serial_number']['frames'], [])
+
+
+class FrameQualityTest(unittest.TestCase):
+    def test_sharp_frames_rank_above_blurred_and_glare(self):
+        sharp = checkerboard()
+        blurred = cv2.GaussianBlur(sharp, (15, 15), 5)
+        glare = sharp.copy()
+        glare[:100] = 255
+
+        rows = frame_quality([blurred, sharp, glare])
+        scores = {row['index']: row['score'] for row in rows}
+        self.assertEqual(max(scores, key=scores.get), 1)
+        self.assertGreater(rows[2]['glare'], 0.4)
+        self.assertLess(scores[2], scores[1])
+        self.assertLess(scores[0], scores[1])
+
+        selected = select_frames(rows, top_k=2)
+        self.assertEqual(selected[0]['index'], 1)
+        self.assertEqual(len(selected), 2)
+
+    def test_select_frames_keeps_at_least_one(self):
+        rows = frame_quality([checkerboard()])
+        self.assertEqual(len(select_frames(rows, top_k=0)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
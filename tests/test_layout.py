@@ -0,0 +1,61 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from preprocessing import segment_text_lines
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def draw_text(lines, size=(400, 900)) -> np.ndarray:
+    image = np.full(size + (3,), 255, np.uint8)
+    for text, origin in lines:
+        cv2.putText(image, text, origin, FONT, 1.0, (0, 0, 0), 2)
+    return image
+
+
+def ink_box(text, origin, size=(400, 900)):
+    # กรอบของหมึกจริงเมื่อวาดบรรทัดนั้นบรรทัดเดียว
+    mask = draw_text([(text, origin)], size)[:, :, 0] < 128
+    x, y, w, h = cv2.boundingRect(mask.astype(np.uint8))
+    return [x, x + w, y, y + h]
+
+
+class SegmentTextLinesTest(unittest.TestCase):
+    LINES = [('FELOCELL 3', (20, 60)), ('Serial No', (20, 140)), ('123456A', (500, 140)),
+             ('EXP 12/2027', (20, 220))]
+
+    def assertCovers(self, box, expected):
+        x_min, x_max, y_min, y_max = expected
+        self.assertLessEqual(box[0], x_min)
+        self.assertGreaterEqual(box[1], x_max)
+        self.assertLessEqual(box[2], y_min)
+        self.assertGreaterEqual(box[3], y_max)
+
+    def test_one_box_per_line_in_reading_order(self):
+        boxes = segment_text_lines(draw_text(self.LINES))
+        self.assertEqual(len(boxes), len(self.LINES))
+        for box, (text, origin) in zip(boxes, self.LINES):
+            with self.subTest(text=text):
+                self.assertCovers(box, ink_box(text, origin))
+        # ป้ายกับค่าในแถวเดียวกันแต่ห่างกันมากเป็นคนละกล่อง เรียงซ้ายไปขวา
+        self.assertLess(boxes[1][1], boxes[2][0])
+
+    def test_value_below_half_a_line_is_separate(self):
+        boxes = segment_text_lines(draw_text([('Serial', (20, 100)), ('123456', (160, 125))]))
+        self.assertEqual(len(boxes), 2)
+        self.assertLess(boxes[0][2], boxes[1][2])
+
+    def test_inverted_grayscale_gives_same_boxes(self):
+        image = draw_text(self.LINES)
+        inverted = 255 - cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self.assertEqual(segment_text_lines(inverted), segment_text_lines(image))
+
+    def test_returns_empty_when_layout_is_unusable(self):
+        self.assertEqual(segment_text_lines(np.full((200, 200, 3), 255, np.uint8)), [])
+        self.assertEqual(segment_text_lines(draw_text(self.LINES), max_boxes=3), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from pipeline import apply_cascade_valid, merge_ocr_results
+
+
+class CascadeValidTest(unittest.TestCase):
+    def merge(self, tess_data, easy_data, weak):
+        merged = merge_ocr_results(tess_data, easy_data, {})
+        return merged, apply_cascade_valid(merged, tess_data, weak)
+
+    def test_valid_tesseract_field_overrides_easyocr(self):
+        tess_data = {'product_name': 'FELOCELL 3', 'serial_number': '123456A'}
+        easy_data = {'product_name': 'FEL0CELL 3X', 'serial_number': '654321B'}
+        before, after = self.merge(tess_data, easy_data, weak=[])
+        # คะแนนเสมอกัน merge ปกติเลือก EasyOCR ก่อน
+        self.assertEqual(merge_ocr_results(tess_data, easy_data, {})['sources']['product_name']['source'], 'easyocr')
+        self.assertIs(after, before)
+        for field, value in tess_data.items():
+            self.assertEqual(after['data'][field], value)
+            self.assertEqual(after['sources'][field]['source'], 'tesseract')
+            self.assertEqual(after['sources'][field]['reason'], 'cascade-valid')
+            self.assertEqual(after['sources'][field]['pattern_score'], 100)
+        self.assertIn('FELOCELL 3', after['formatted_output'])
+        self.assertNotIn('FEL0CELL 3X', after['formatted_output'])
+
+    def test_weak_fields_keep_the_normal_merge(self):
+        tess_data = {'product_name': 'FELOCELL 3', 'serial_number': '12'}
+        easy_data = {'product_name': 'FEL0CELL 3X', 'serial_number': '654321B'}
+        _, after = self.merge(tess_data, easy_data, weak=['serial_number', 'product_name'])
+        self.assertEqual(after['data']['product_name'], 'FEL0CELL 3X')
+        self.assertEqual(after['data']['serial_number'], '654321B')
+        self.assertNotEqual(after['sources']['serial_number']['reason'], 'cascade-valid')
+
+    def test_tesseract_winner_only_changes_reason(self):
+        tess_data = {'serial_number': '123456A'}
+        easy_data = {'serial_number': '12'}
+        before = merge_ocr_results(tess_data, easy_data, {})
+        _, after = self.merge(tess_data, easy_data, weak=[])
+        expected = {**before['sources']['serial_number'], 'reason': 'cascade-valid'}
+        self.assertEqual(after['sources']['serial_number'], expected)
+
+    def test_registration_number_is_formatted(self):
+        tess_data = {'registration_number': '2f 12/57 (b)'}
+        _, after = self.merge(tess_data, {'registration_number': '2F 99/57 (B)'}, weak=[])
+        self.assertEqual(after['sources']['registration_number']['source'], 'tesseract')
+        self.assertEqual(after['data']['registration_number'], '2F 12/57 (B)')
+
+
+if __name__ == '__main__':
+    unittest.main()
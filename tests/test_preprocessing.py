@@ -0,0 +1,109 @@
+import unittest
+
+import cv2
+import numpy as np
+
+import preprocessing
+from preprocessing import (
+    clear_pipeline_cache,
+    image_hash,
+    left_region_pipeline,
+    pipeline_until,
+    right_region_pipeline,
+    run_preprocessing
+)
+
+
+def sample_image(seed: int = 0, shape=(40, 60, 3)) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+
+
+class PipelineTest(unittest.TestCase):
+    def test_pipelines_are_lists_of_known_steps(self):
+        for steps in (left_region_pipeline(), right_region_pipeline()):
+            for name, params in steps:
+                self.assertIn(name, preprocessing.PREPROCESS_OPS)
+                self.assertIsInstance(params, dict)
+
+    def test_sweep_parameters_reach_the_steps(self):
+        steps = dict(right_region_pipeline(scale=5, alpha=1.5, beta=10, block_size=15, c_value=4))
+        self.assertEqual(steps['resize'], {'scale': 5})
+        self.assertEqual(steps['scale_abs'], {'alpha': 1.5, 'beta': 10})
+        self.assertEqual(steps['adaptive_threshold'], {'block_size': 15, 'c': 4})
+
+    def test_pipeline_until_includes_the_named_step(self):
+        steps = right_region_pipeline()
+        prefix = pipeline_until(steps, 'adaptive_threshold')
+        self.assertEqual(prefix[-1][0], 'adaptive_threshold')
+        self.assertEqual(prefix, steps[:len(prefix)])
+        with self.assertRaises(ValueError):
+            pipeline_until(steps, 'missing')
+
+
+class PipelineCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.max_bytes = preprocessing.PIPELINE_CACHE_MAX_BYTES
+        clear_pipeline_cache()
+
+    def tearDown(self):
+        preprocessing.PIPELINE_CACHE_MAX_BYTES = self.max_bytes
+        clear_pipeline_cache()
+
+    def test_cached_result_matches_uncached(self):
+        image = sample_image()
+        steps = left_region_pipeline()
+        expected = run_preprocessing(image, steps)
+        np.testing.assert_array_equal(run_preprocessing(image, steps, cache=True), expected)
+        # รอบสองอ่านจากแคช
+        np.testing.assert_array_equal(run_preprocessing(image, steps, cache=True), expected)
+
+    def test_cache_key_is_image_hash_and_step_prefix(self):
+        image = sample_image()
+        steps = left_region_pipeline()
+        run_preprocessing(image, steps, cache=True)
+        keys = list(preprocessing._pipeline_cache)
+        self.assertEqual(len(keys), len(steps))
+        self.assertTrue(all(key[0] == image_hash(image) for key in keys))
+        self.assertEqual([len(key[1]) for key in keys], list(range(1, len(steps) + 1)))
+
+        # พารามิเตอร์ต่างกันใช้ prefix ร่วมกันจนถึงขั้นที่ต่าง
+        run_preprocessing(image, left_region_pipeline(scale=3), cache=True)
+        self.assertEqual(len(preprocessing._pipeline_cache), 2 * len(steps))
+
+    def test_image_hash_depends_on_shape_and_content(self):
+        image = sample_image()
+        self.assertEqual(image_hash(image), image_hash(image.copy()))
+        self.assertNotEqual(image_hash(image), image_hash(image.reshape(60, 40, 3)))
+        changed = image.copy()
+        changed[0, 0, 0] ^= 1
+        self.assertNotEqual(image_hash(image), image_hash(changed))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        steps = [('invert', {})]
+        first, second, third = (sample_image(seed) for seed in range(3))
+        preprocessing.PIPELINE_CACHE_MAX_BYTES = 2 * first.nbytes
+        run_preprocessing(first, steps, cache=True)
+        run_preprocessing(second, steps, cache=True)
+        # ใช้ภาพแรกอีกครั้ง ภาพที่สองจึงเก่าที่สุด
+        run_preprocessing(first, steps, cache=True)
+        run_preprocessing(third, steps, cache=True)
+
+        hashes = {key[0] for key in preprocessing._pipeline_cache}
+        self.assertEqual(hashes, {image_hash(first), image_hash(third)})
+        self.assertLessEqual(preprocessing._pipeline_cache_bytes, preprocessing.PIPELINE_CACHE_MAX_BYTES)
+
+    def test_passthrough_step_does_not_freeze_the_input(self):
+        gray = cv2.cvtColor(sample_image(), cv2.COLOR_BGR2GRAY)
+        original = gray.copy()
+        result = run_preprocessing(gray, [('grayscale', {})], cache=True)
+        self.assertTrue(gray.flags.writeable)
+        self.assertFalse(np.shares_memory(result, gray))
+        self.assertFalse(result.flags.writeable)
+
+        # แก้ภาพของผู้เรียกในที่ได้ และไม่กระทบผลในแคช
+        cv2.rectangle(gray, (0, 0), (5, 5), 0, -1)
+        np.testing.assert_array_equal(result, original)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import io
+import json
+import unittest
+from unittest import mock
+
+import app as app_module
+from stream_ingest import END_OF_STREAM, FRAME_HEADER, FrameError, pack_frame, read_frames
+
+
+class TrickleStream(io.BytesIO):
+    # ส่งทีละ byte เหมือน chunk เล็กๆ จากเครือข่าย
+    def read(self, size=-1):
+        return super().read(1 if size != 0 else 0)
+
+
+class ReadFramesTest(unittest.TestCase):
+    def test_round_trip_stops_at_end_of_stream(self):
+        frames = [b'first', b'second frame']
+        body = b''.join(pack_frame(frame) for frame in frames) + END_OF_STREAM + pack_frame(b'ignored')
+        self.assertEqual(list(read_frames(io.BytesIO(body), 64)), frames)
+        self.assertEqual(list(read_frames(TrickleStream(body), 64)), frames)
+
+    def test_closed_stream_without_end_marker(self):
+        self.assertEqual(list(read_frames(io.BytesIO(pack_frame(b'only')), 64)), [b'only'])
+        self.assertEqual(list(read_frames(io.BytesIO(b''), 64)), [])
+
+    def test_empty_frame_cannot_be_packed(self):
+        with self.assertRaises(FrameError):
+            pack_frame(b'')
+
+    def test_truncated_input(self):
+        for body in (b'\x00\x00', FRAME_HEADER.pack(10) + b'short'):
+            with self.subTest(body=body), self.assertRaises(FrameError):
+                list(read_frames(io.BytesIO(body), 64))
+
+    def test_frame_size_limit(self):
+        body = pack_frame(b'x' * 64) + pack_frame(b'x' * 65)
+        frames = read_frames(io.BytesIO(body), 64)
+        self.assertEqual(len(next(frames)), 64)
+        with self.assertRaises(FrameError) as caught:
+            next(frames)
+        self.assertIn('65 bytes', str(caught.exception))
+
+
+class StreamEndpointTest(unittest.TestCase):
+    def setUp(self):
+        # ไม่ต้องโหลดโมเดล OCR ใน test
+        patcher = mock.patch.object(app_module, '_prewarm_started', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app_module.app.test_client()
+
+    def post(self, body: bytes):
+        response = self.client.post('/api/stream', data=body, content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line.strip()]
+
+    def test_each_frame_gets_its_own_line(self):
+        lines = self.post(pack_frame(b'not an image') + pack_frame(b'also not') + END_OF_STREAM)
+        self.assertEqual(lines, [{'seq': 0, 'error': 'Failed to decode image'},
+                                 {'seq': 1, 'error': 'Failed to decode image'}])
+
+    def test_oversized_frame_ends_stream_with_error_line(self):
+        with mock.patch.object(app_module, 'MAX_FILE_SIZE', 16):
+            lines = self.post(pack_frame(b'not an image') + pack_frame(b'x' * 17) + pack_frame(b'never read'))
+        self.assertEqual(lines[0], {'seq': 0, 'error': 'Failed to decode image'})
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1]['frames'], 1)
+        self.assertIn('Frame too large: 17 bytes (max 16)', lines[1]['error'])
+
+    def test_rejects_saved_images_section(self):
+        response = self.client.post('/api/stream?fields=images', data=END_OF_STREAM,
+                                    content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from tuning import DEFAULT_GRID, SWEEP_PARAMS, build_combinations, grid_combinations, random_combinations
+
+
+class GridCombinationsTest(unittest.TestCase):
+    def test_default_grid_is_the_full_product(self):
+        combos = grid_combinations()
+        expected = 1
+        for values in DEFAULT_GRID.values():
+            expected *= len(values)
+        self.assertEqual(len(combos), expected)
+        self.assertEqual(list(combos[0]), SWEEP_PARAMS)
+
+    def test_overrides_replace_single_parameters(self):
+        combos = grid_combinations({'scale': [7], 'alpha': [1.3], 'beta': [4], 'block_size': [25], 'c_value': [2]})
+        self.assertEqual(combos, [{'scale': 7, 'alpha': 1.3, 'beta': 4, 'block_size': 25, 'c_value': 2}])
+
+    def test_integer_valued_floats_become_ints(self):
+        combo = grid_combinations({'scale': [7.0], 'block_size': [25.0]})[0]
+        self.assertIsInstance(combo['scale'], int)
+        self.assertIsInstance(combo['block_size'], int)
+
+    def test_rejects_invalid_grids(self):
+        invalid = [
+            [],
+            {'unknown': [1]},
+            {'alpha': 1.3},
+            {'alpha': []},
+            {'alpha': ['1.3']},
+            {'scale': [True]},
+            {'scale': [2.5]},
+            {'scale': [0]},
+            {'block_size': [24]},
+            {'block_size': [1]},
+        ]
+        for space in invalid:
+            with self.subTest(space=space), self.assertRaises(ValueError):
+                grid_combinations(space)
+
+
+class RandomCombinationsTest(unittest.TestCase):
+    def test_seeded_samples_are_reproducible_and_valid(self):
+        combos = random_combinations(samples=10, seed=3)
+        self.assertEqual(combos, random_combinations(samples=10, seed=3))
+        self.assertEqual(len(combos), 10)
+        for combo in combos:
+            self.assertEqual(combo['block_size'] % 2, 1)
+            self.assertGreater(combo['block_size'], 1)
+
+    def test_single_value_range_is_allowed_as_min_equals_max(self):
+        combos = random_combinations({'scale': [7, 7]}, samples=3, seed=1)
+        self.assertTrue(all(combo['scale'] == 7 for combo in combos))
+
+    def test_rejects_invalid_ranges(self):
+        invalid = [
+            ({'alpha': [1.2]}, 5),
+            ({'alpha': [2.0, 1.0]}, 5),
+            ({'alpha': [1.0, 2.0, 3.0]}, 5),
+            ({'block_size': [0, 1]}, 5),
+            ({}, 0),
+        ]
+        for space, samples in invalid:
+            with self.subTest(space=space, samples=samples), self.assertRaises(ValueError):
+                random_combinations(space, samples=samples)
+
+    def test_unknown_search_type(self):
+        with self.assertRaises(ValueError):
+            build_combinations('bayes')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import atexit
+import random
+import argparse
+import tempfile
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
+from functools import partial
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+import preprocessing
+from preprocessing import (
+    split_image_left_right,
+    preprocess_left_region,
+    right_region_pipeline,
+    pipeline_until,
+    run_preprocessing,
+    image_hash,
+    white_percent
+)
+from ocr_engines import OCR_BACKENDS, configure_easyocr, ocr_text, prewarm_engines
+from data_extraction import extract_vaccine_data
+from scoring import FIELD_NAMES, score_field_value
+from system_resources import usable_cpu_count
+
+
+# ลำดับตรงกับลำดับใน right_region_pipeline เพื่อให้ชุดที่อยู่ติดกันใช้ prefix ในแคชร่วมกัน
+SWEEP_PARAMS = ['scale', 'alpha', 'beta', 'block_size', 'c_value']
+
+DEFAULT_GRID = {
+    'scale': [5, 7, 9],
+    'alpha': [1.1, 1.3, 1.5],
+    'beta': [0, 4, 10],
+    'block_size': [15, 25, 35],
+    'c_value': [2, 4],
+}
+
+# ช่วงค่า [min, max] สำหรับ random search
+DEFAULT_RANGES = {
+    'scale': [4, 10],
+    'alpha': [0.8, 2.0],
+    'beta': [0, 20],
+    'block_size': [11, 41],
+    'c_value': [0, 6],
+}
+
+MAX_SWEEP_COMBINATIONS = 500
+WORKER_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+INTEGER_PARAMS = ('scale', 'block_size')
+
+
+def _check_value(name: str, value) -> None:
+    # bool เป็น int ใน Python จึงต้องกันออกเอง
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f'{name} values must be numbers, got {value!r}')
+    if name in INTEGER_PARAMS and value != int(value):
+        raise ValueError(f'{name} values must be integers, got {value!r}')
+    if name == 'scale' and value < 1:
+        raise ValueError(f'scale must be at least 1, got {value!r}')
+
+
+def _check_space(space: Optional[Dict[str, List]]) -> Dict[str, List]:
+    if space is None:
+        return {}
+    if not isinstance(space, dict):
+        raise ValueError('space must be an object mapping parameter names to lists')
+    unknown = sorted(set(space) - set(SWEEP_PARAMS))
+    if unknown:
+        raise ValueError(f'Unknown parameters: {", ".join(unknown)}')
+    for name, values in space.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f'{name} must be a non-empty list')
+        for value in values:
+            _check_value(name, value)
+    return space
+
+
+def grid_combinations(grid: Optional[Dict[str, List]] = None) -> List[Dict]:
+    grid = {**DEFAULT_GRID, **_check_space(grid)}
+    for value in grid['block_size']:
+        # blockSize ของ adaptiveThreshold ต้องเป็นเลขคี่และมากกว่า 1
+        if value <= 1 or int(value) % 2 == 0:
+            raise ValueError(f'block_size must be odd and greater than 1, got {value!r}')
+    values = [[int(v) if name in INTEGER_PARAMS else v for v in grid[name]] for name in SWEEP_PARAMS]
+    return [dict(zip(SWEEP_PARAMS, combo)) for combo in itertools.product(*values)]
+
+
+def random_combinations(ranges: Optional[Dict[str, List]] = None, samples: int = 20,
+                        seed: Optional[int] = None) -> List[Dict]:
+    ranges = {**DEFAULT_RANGES, **_check_space(ranges)}
+    for name, bounds in ranges.items():
+        if len(bounds) != 2 or bounds[0] > bounds[1]:
+            raise ValueError(f'{name} range must be [min, max] with min <= max, got {bounds!r}')
+    if ranges['block_size'][1] <= 1:
+        raise ValueError(f'block_size range must allow values greater than 1, got {ranges["block_size"]!r}')
+    if samples < 1:
+        raise ValueError(f'samples must be at least 1, got {samples}')
+    rng = random.Random(seed)
+
+    combos = set()
+    attempts = 0
+    while len(combos) < samples and attempts < samples * 20:
+        attempts += 1
+        scale = rng.randint(int(ranges['scale'][0]), int(ranges['scale'][1]))
+        # blockSize ต้องเป็นเลขคี่และมากกว่า 1
+        block_size = rng.randint(int(ranges['block_size'][0]), int(ranges['block_size'][1])) | 1
+        combos.add((
+            scale,
+            round(rng.uniform(*ranges['alpha']), 2),
+            round(rng.uniform(*ranges['beta']), 1),
+            max(3, block_size),
+            round(rng.uniform(*ranges['c_value']), 1),
+        ))
+
+    return [dict(zip(SWEEP_PARAMS, combo)) for combo in sorted(combos)]
+
+
+def build_combinations(search: str = 'grid', space: Optional[Dict[str, List]] = None,
+                       samples: int = 20, seed: Optional[int] = None) -> List[Dict]:
+    if search == 'grid':
+        return grid_combinations(space)
+    if search == 'random':
+        return random_combinations(space, samples=samples, seed=seed)
+    raise ValueError(f'Unknown search type: {search}')
+
+
+_worker = {}
+
+# pool ของ sweep สร้างครั้งเดียวแล้วใช้ซ้ำทุก request worker จึงโหลดโมเดลแค่ครั้งแรก
+# ใช้ spawn เพราะการ fork process ที่มีหลาย thread (thread ของ Flask, prewarm, thread pool ของ torch/OpenMP) ค้างได้
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    preprocessing.PIPELINE_CACHE_MAX_BYTES = WORKER_CACHE_MAX_BYTES
+    # หนึ่ง thread ต่อ worker ไม่ให้ torch แตก thread ซ้อนกัน
+    configure_easyocr(threads=1)
+    _worker['engines'] = set()
+
+
+def _load_job(job: Dict) -> np.ndarray:
+    # ภาพด้านขวาส่งผ่านไฟล์ครั้งเดียวต่อ sweep แทนการ pickle ไปกับทุกชุดพารามิเตอร์ เก็บไว้แค่ภาพของ sweep ล่าสุด
+    if _worker.get('job') != (job['path'], job['right_hash']):
+        _worker['right'] = np.load(job['path'])
+        _worker['job'] = (job['path'], job['right_hash'])
+    if job['engine'] not in _worker['engines']:
+        prewarm_engines((job['engine'],))
+        _worker['engines'].add(job['engine'])
+    return _worker['right']
+
+
+def _evaluate(job: Dict, params: Dict) -> Dict:
+    if not job['quiet']:
+        return _evaluate_params(job, params)
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        return _evaluate_params(job, params)
+
+
+def _evaluate_params(job: Dict, params: Dict) -> Dict:
+    right = _load_job(job)
+    start_time = time.time()
+
+    steps = right_region_pipeline(**params)
+    prefix = pipeline_until(steps, 'adaptive_threshold')
+    right_hash = job['right_hash']
+
+    binary = run_preprocessing(right, prefix, cache=True, input_hash=right_hash)
+    processed = run_preprocessing(right, steps, cache=True, input_hash=right_hash)
+
+    right_text = ocr_text(job['engine'], processed)
+    data = extract_vaccine_data(job['left_text'], right_text)
+
+    field_scores = {field: score_field_value(field, data.get(field)) for field in FIELD_NAMES}
+
+    return {
+        'params': params,
+        'score': round(sum(field_scores.values()) / len(FIELD_NAMES), 1),
+        'field_scores': field_scores,
+        'fields': {field: data.get(field) for field in FIELD_NAMES},
+        'white_percent': round(white_percent(binary), 1),
+        'raw_right': right_text,
+        'processing_time': round(time.time() - start_time, 3),
+    }
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker)
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def sweep_preprocessing(image: np.ndarray, combinations: List[Dict], engine: str = 'tesseract',
+                        workers: Optional[int] = None, quiet: bool = True) -> List[Dict]:
+    if engine not in OCR_BACKENDS:
+        raise ValueError(f'Unknown engine: {engine}')
+    if len(combinations) > MAX_SWEEP_COMBINATIONS:
+        raise ValueError(f'Too many combinations: {len(combinations)} > {MAX_SWEEP_COMBINATIONS}')
+
+    left, right = split_image_left_right(image)
+
+    # ด้านซ้ายไม่ขึ้นกับพารามิเตอร์ที่ sweep จึง OCR ครั้งเดียว
+    left_text = ocr_text(engine, preprocess_left_region(left, scale=2))
+
+    # ขนาด pool ไม่ขึ้นกับจำนวนชุดพารามิเตอร์ ไม่อย่างนั้น sweep เล็กๆ จะทำให้สร้าง pool ใหม่ทุกครั้ง
+    workers = max(1, workers or usable_cpu_count())
+    pool = _get_pool(workers)
+    chunksize = max(1, len(combinations) // (workers * 2))
+
+    fd, path = tempfile.mkstemp(suffix='.npy')
+    os.close(fd)
+    try:
+        np.save(path, right)
+        job = {'path': path, 'right_hash': image_hash(right), 'left_text': left_text,
+               'engine': engine, 'quiet': quiet}
+        rows = list(pool.map(partial(_evaluate, job), combinations, chunksize=chunksize))
+    except BrokenProcessPool:
+        # worker ตาย (เช่น หน่วยความจำไม่พอ) สร้าง pool ใหม่ใน sweep ถัดไป
+        shutdown_pool()
+        raise
+    finally:
+        os.remove(path)
+
+    rows.sort(key=lambda row: (-row['score'], row['processing_time']))
+    for rank, row in enumerate(rows, start=1):
+        row['rank'] = rank
+
+    return rows
+
+
+def format_table(rows: List[Dict], top: int = 10) -> str:
+    header = f'{"#":>3}  {"score":>5}  ' + '  '.join(f'{p:>10}' for p in SWEEP_PARAMS) + f'  {"white%":>6}  {"time":>6}'
+    lines = [header, '-' * len(header)]
+    for row in rows[:top]:
+        params = '  '.join(f'{row["params"][p]:>10}' for p in SWEEP_PARAMS)
+        lines.append(f'{row["rank"]:>3}  {row["score"]:>5}  {params}  {row["white_percent"]:>6}  {row["processing_time"]:>6}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sweep right-region preprocessing parameters on one image')
+    parser.add_argument('image', help='Path to sticker image')
+    parser.add_argument('--search', choices=['grid', 'random'], default='grid')
+    parser.add_argument('--samples', type=int, default=20, help='Number of random combinations')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--engine', choices=sorted(OCR_BACKENDS), default='tesseract')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='Print full ranked results as JSON')
+    for name in SWEEP_PARAMS:
+        value_type = int if name in ('scale', 'block_size') else float
+        parser.add_argument(f'--{name.replace("_", "-")}', dest=name, type=value_type, nargs='+',
+                            help='Grid values, or [min max] for random search')
+    args = parser.parse_args(argv)
+
+    image = cv2.imread(args.image)
+    if image is None:
+        parser.error(f'Failed to load image: {args.image}')
+
+    space = {name: getattr(args, name) for name in SWEEP_PARAMS if getattr(args, name)}
+    try:
+        combinations = build_combinations(args.search, space, samples=args.samples, seed=args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f'Sweeping {len(combinations)} combinations ({args.search}, {args.engine})...')
+
+    start_time = time.time()
+    rows = sweep_preprocessing(image, combinations, engine=args.engine, workers=args.workers)
+    print(f'Done in {time.time() - start_time:.1f}s\n')
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(format_table(rows, top=args.top))
+
+
+if __name__ == '__main__':
+    main()